@@ -11,44 +11,22 @@
 
 """
 
-#Just change the pip command to install any libraries
+# The library code lives in the trend_forecaster package; install it with its optional extras instead of
+# running pip from the notebook:
+#
+#   pip install -e .[all]          (or .[data,ml,stats,backtest,plots] for just what you need)
+#
+# The same pipeline is also available without the notebook narrative as `trend-forecaster pipeline`
+# (trend_forecaster.pipeline.run_pipeline), and live signals as `trend-forecaster live`.
 
-!pip install tvdatafeed #for the datafeed
-!pip install vectorbt #for main backtesting engine
-
-#Importing libraries
+#Importing libraries (scikit-learn, statsmodels and vectorbt are imported by the sections that use them)
 
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import vectorbt as vbt
 import warnings
 warnings.filterwarnings('ignore')
 
-
-from tvDatafeed import TvDatafeed, Interval #ensure that '!pip install tvdatafeed' has been executed
-from sklearn.preprocessing import MinMaxScaler
-from pandas import DataFrame
-from selenium import webdriver
-from datetime import datetime
-
-from statsmodels.tsa.stattools import adfuller
-
-from sklearn.model_selection import train_test_split
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import cross_val_score
-from sklearn.model_selection import RepeatedStratifiedKFold
-from sklearn.ensemble import RandomForestClassifier
-
-
-from sklearn.metrics import confusion_matrix, accuracy_score
-from sklearn.metrics import plot_confusion_matrix
-from sklearn.metrics import f1_score
-from sklearn.metrics import classification_report
-from sklearn.metrics import roc_curve
-from sklearn.metrics import roc_auc_score
-from sklearn.metrics import precision_recall_curve
-from sklearn.metrics import auc
+from tvDatafeed import TvDatafeed, Interval #ensure that the [data] extra (tvdatafeed) is installed
 
 """# **DATA COLLECTION - E-mini S&P 500 Futures**
 
@@ -57,35 +35,39 @@ from sklearn.metrics import auc
 
 #Fetching the data for E-mini S&P 500 Futures: 
 
+# Bars are served from a local cache (bar_cache/) and only the missing tail is fetched from TradingView
+# To run offline, swap the source for trend_forecaster.CsvSource('<directory with CSV fixtures>')
+
+from trend_forecaster import BarStore
+
 tv = TvDatafeed()
+store = BarStore('bar_cache', source=tv)
 
-es = tv.get_hist(symbol='ES',exchange='CME_MINI',interval=Interval.in_4_hour,n_bars=5000,fut_contract=1) #fetch the data for front-month futures
-es_px = es.drop(['symbol','volume'],1) #drop the columns for symbol and volume (not needed in the analysis)
-es_px.dropna() # drop any NaN values
+es = store.get_hist(symbol='ES',exchange='CME_MINI',interval=Interval.in_4_hour,n_bars=5000,fut_contract=1) #fetch the data for front-month futures
+es_px = es[['open','high','low','close']] #OHLC only (symbol and volume are not needed in the analysis)
 
 """# **Heikin-Ashi Candle Conversion**
 
 ##### Converting normal candlesticks to Heikin-Ashi candlesticks by writing a new function. The price adjustment will be made later during backtesting.
 """
 
-#Define a function to calculate the Heikin-Ashi candle values (OHLC): 
+#The Heikin-Ashi candle values (OHLC) are calculated by trend_forecaster.heikin_ashi
+#(vectorized HA open recursion; HeikinAshiStream converts live bars one at a time)
+
+# Stage instrumentation (timings, row counts, memory, copy counts) - switch on with TRENDFC_INSTRUMENT=1
+# or instrument.enable(profile=True, trace_memory=True) for cProfile / tracemalloc capture per stage
 
-def heikin_ashi(df):
-    heikin_ashi_df = pd.DataFrame(index=df.index.values, columns=['open', 'high', 'low', 'close'])
-    heikin_ashi_df['close'] = (df['open'] + df['high'] + df['low'] + df['close']) / 4    
-    for i in range(len(df)):
-        if i == 0:
-            heikin_ashi_df.iat[0, 0] = df['open'].iloc[0]
-        else:
-            heikin_ashi_df.iat[i, 0] = (heikin_ashi_df.iat[i-1, 0] + heikin_ashi_df.iat[i-1, 3]) / 2
+from trend_forecaster import instrument
+from trend_forecaster.instrument import stage, instrumented
 
-    heikin_ashi_df['high'] = heikin_ashi_df.loc[:, ['open', 'close']].join(df['high']).max(axis=1)
-    heikin_ashi_df['low'] = heikin_ashi_df.loc[:, ['open', 'close']].join(df['low']).min(axis=1)   
-    return heikin_ashi_df
+# Figures and stats are collected into a headless report bundle (report/index.html + report.json) that is
+# rendered in parallel worker processes at the end of the run - set TRENDFC_NO_PLOTS=1 to skip plotting
 
-#Converting candlesticks to Heikin Ashi
+from trend_forecaster.reporting import Report
 
-hadf = heikin_ashi(es_px) 
+report = Report('report')
+
+#Converting candlesticks to Heikin Ashi: only the HA open is used (FeatureStore.from_bars below converts the bars)
 
 #Why use open prices instead of closing prices? 
 
@@ -97,43 +79,24 @@ prices that do not exist (more precisely, at past prices), and that is inaccurat
 
 '''
 
-data_open = pd.DataFrame(hadf['open'])
-data_open.columns = ['open_hadf']
-data_open['open'] = pd.DataFrame(es_px['open'])
-
-#EMAs (EMA is better because it assigns more weight to recent values and less to the old ones)
+# The base columns (open_hadf, open, EMA_1, EMA_5, pct and log returns) are computed once into a single
+# float64 block by trend_forecaster.features.FeatureStore; data_open, the model inputs, the simulation and
+# the backtests all work on views of it instead of deep copies
 
-data_open['EMA_1'] = data_open['open_hadf'].ewm(span=1, adjust=False).mean()
-data_open['EMA_5'] = data_open['open_hadf'].ewm(span=5, adjust=False).mean()
+from trend_forecaster.features import FeatureStore, FEATURES
 
-data_open
-
-# Creating copies of the dataset:
-
-# Copy-1 : to be used at a later stage for backtesting of the momentum model
-
-# since the data_open DF will be modified for classification purposes,
-# it is best to create another dataframe that can be used for vectorized backtesting using VectorBT
-
-momentum_backtest_data = data_open.copy(deep=True)
-
-"""# **BASIC FEATURE ADDITION**"""
-
-# Feature addition - pct change and log returns (these will also be used for the Monte Carlo simulation)
-
-data_open['hadf_pct_change'] = data_open['open_hadf'].pct_change()
-data_open['hadf_log_return'] = np.log(1 + data_open.hadf_pct_change)
+#EMAs (EMA is better because it assigns more weight to recent values and less to the old ones)
+#pct change and log returns (these will also be used for the Monte Carlo simulation)
 
-data_open = data_open.dropna()
-data_open
+features = FeatureStore.from_bars(es_px)
 
 # Adding a new column for the direction (based on the returns)
+# Labels and signals are stored as int8 codes (UP = 1, DOWN = -1) by trend_forecaster.signals
+# (the first bar has no pct change and is left out, as with dropna())
 
-NaN = np.nan
-data_open['direction'] = NaN
-
-data_open.direction = np.where(data_open['hadf_pct_change'] > 0,   'UP', 'DOWN')
+from trend_forecaster.signals import momentum_signal, final_signal
 
+data_open = features.frame()
 data_open
 #END OF DATA PREPROCESSING
 
@@ -147,29 +110,18 @@ data_open
 # MONTE CARLO SIMULATION - generating a random time series using the statistical properties of the data
 # This time series will be used later to test the ML models
 
-data_copy = data_open.copy(deep=True)
-simulation = pd.DataFrame()
-
-mu, sigma = data_copy['hadf_log_return'].mean(), data_copy['hadf_log_return'].std() #Mean and Stdev for the new timeseries
+log_returns = features['hadf_log_return']
+mu, sigma = log_returns.mean(), log_returns.std(ddof=1) #Mean and Stdev for the new timeseries
 
 sim_rets = np.random.normal(mu, sigma, 5000)
-initial = data_copy['open_hadf'].iloc[-1]
-
-simulation['open_hadf'] = initial * (sim_rets + 1).cumprod()
-simulation['EMA_5'] = simulation['open_hadf'].ewm(span=5, adjust=False).mean()
-simulation['hadf_pct_change'] = simulation['open_hadf'].pct_change()
-simulation['hadf_log_return'] = np.log(1 + simulation.hadf_pct_change)
+initial = features['open_hadf'][-1]
 
-simulation = simulation.dropna()
+# same base columns and direction labels as the real data
 
-# Adding a new column for the direction (based on the returns)
-
-NaN = np.nan
-simulation['direction'] = NaN
+simulation = FeatureStore.from_prices(initial * (sim_rets + 1).cumprod())
+simX_test, simY_test = simulation.features()
 
-simulation.direction = np.where(simulation['hadf_pct_change'] > 0,   'UP', 'DOWN')
-
-simulation
+simulation.frame()
 
 """# **START OF EDA**
 
@@ -185,29 +137,19 @@ print(data_open.describe())
 
 # Let us now try to perform the ADF test (Dickey-Fuller test) to check the stationarity of a time series
 
-def adf_test(timeseries):
-    print ('Results of Dickey-Fuller Test:')
-    dftest = adfuller(timeseries, autolag='AIC')
-    dfoutput = pd.Series(dftest[0:4], index=['Test Statistic','p-value','#Lags Used','Number of Observations Used'])
-    for key,value in dftest[4].items():
-        dfoutput['Critical Value (%s)'%key] = value
-    print (dfoutput)
+# trend_forecaster.stationarity runs the ADF test (same statistics as statsmodels' adfuller with autolag='AIC')
+# on any number of series at once, optionally in rolling windows and with the KPSS test alongside, and
+# returns one row per series: test statistic, p-value, lags used, observations and critical values
+
+from trend_forecaster.stationarity import screen
+
+#ADF (and KPSS) on % returns and log returns:
+stationarity = screen(data_open[['hadf_pct_change','hadf_log_return']], kpss=True)
+print(stationarity.set_index('series').T)
+report.add_stats('stationarity', stationarity)
 
-#ADF on % returns: 
-print("")
-print("ADF on RETURNS:")
-print("")
-adf_test(data_open['hadf_pct_change'])
-print("")
-#ADF on log returns: 
-print("ADF on LOG RETURNS:")
-print("")
-adf_test(data_open['hadf_log_return'])
-print("")
 # Plotting the log returns to double check the stationarity
-plt.figure(figsize=(16,8))
-plt.plot(data_open['hadf_log_return'])
-plt.show()
+report.line('hadf_log_return', data_open['hadf_log_return'], title='Heikin-Ashi log returns', figsize=(16,8))
 
 """##### **Null Hypothesis:** Series is non-stationary or series has a unit root.
 ##### **Alternate Hypothesis:** Series is stationary or series has no unit root.
@@ -225,89 +167,102 @@ plt.show()
 # **BINARY CLASSIFICATION APPROACH using LOGISTIC REGRESSION**
 """
 
-# CONVERTING THE DATA FOR A BINARY CLASSIFICATION PROBLEM:
-
-# Adding a new column for the direction (based on the returns)
+# CONVERTING THE DATA FOR A BINARY CLASSIFICATION PROBLEM: direction (UP / DOWN) is the label
 
-NaN = np.nan
-data_open['direction'] = NaN
-data_open.direction = np.where(data_open['hadf_pct_change'] > 0,   'UP', 'DOWN')
+X, y = features.features()
 
-data_open
+from sklearn.model_selection import train_test_split
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import classification_report
+from trend_forecaster.signals import decode_labels
 
 # Splitting the data into test and train: 
-X_train, X_test, y_train, y_test = train_test_split(data_open[['open_hadf','EMA_5']], data_open.direction, test_size=0.25)
+X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.25)
 
 # Building a model class
 
 model = LogisticRegression()
-classifier = model.fit(X_train, y_train)
+with stage('training', model='logistic'):
+    classifier = model.fit(X_train, y_train)
 
 # Testing the model on X_test (part of the original data): 
 
 y_pred = model.predict(X_test)
 print("Model's Accuracy:",model.score(X_test, y_test))
-print(classification_report(y_test,y_pred))
+print(classification_report(decode_labels(y_test), decode_labels(y_pred)))
 
 # Plotting a confusion matrix 
 
-plot_confusion_matrix(model, X_test, y_test)
-plt.show()
+report.confusion_matrix('logistic_test', y_test, y_pred, title='Logistic Regression | test data')
 
 # Testing the model on the 'simulation' dataframe (random simulated data): 
 
-simX_test = simulation.copy(deep=True)
-simY_test = simulation.copy(deep=True)
-
-simX_test = simX_test.drop(['direction','hadf_pct_change','hadf_log_return'],1)
-simY_test = simY_test.drop(['open_hadf','EMA_5','hadf_pct_change','hadf_log_return'],1)
-
 simulation_pred = model.predict(simX_test)
 print("Model's Accuracy:",model.score(simX_test, simY_test))
-print(classification_report(simY_test,simulation_pred))
+print(classification_report(decode_labels(simY_test), decode_labels(simulation_pred)))
 
 # Plotting a confusion matrix 
 
-plot_confusion_matrix(model, simX_test, simY_test)
-plt.show()
+report.confusion_matrix('logistic_simulation', simY_test, simulation_pred, title='Logistic Regression | simulated data')
 
 """# **BINARY CLASSIFICATION APPROACH using a RANDOM FOREST CLASSIFIER**
 
 """
 
+from sklearn.ensemble import RandomForestClassifier
+
 # Building and fitting the model
 
 rf = RandomForestClassifier(max_depth=900, max_samples=2000, n_estimators = 50)
-rf.fit(X_train, y_train)
+with stage('training', model='random_forest'):
+    rf.fit(X_train, y_train)
 
 # Testing the model on X_test (part of the original data): 
 
 y_preds = rf.predict(X_test)
 print("Model's Accuracy:",rf.score(X_test, y_test))
-print(classification_report(y_test,y_preds))
+print(classification_report(decode_labels(y_test), decode_labels(y_preds)))
 print("")
 
 # Plotting a confusion matrix 
-plot_confusion_matrix(rf, X_test, y_test)
-plt.show()
+report.confusion_matrix('random_forest_test', y_test, y_preds, title='Random Forest | test data')
 
 # Testing the model on the 'simulation' dataframe (random simulated data): 
+simulation_preds = rf.predict(simX_test)
+print("Model's Accuracy:",rf.score(simX_test, simY_test))
+print(classification_report(decode_labels(simY_test), decode_labels(simulation_preds)))
 
+# Plotting a confusion matrix 
 
-simX_test = simulation.copy(deep=True)
-simY_test = simulation.copy(deep=True)
+report.confusion_matrix('random_forest_simulation', simY_test, simulation_preds, title='Random Forest | simulated data')
 
-simX_test = simX_test.drop(['direction','hadf_pct_change','hadf_log_return'],1)
-simY_test = simY_test.drop(['open_hadf','EMA_5','hadf_pct_change','hadf_log_return'],1)
+# Persisting both fitted classifiers (with their feature schema, training window and accuracy) so that
+# later runs and the live service can load them in milliseconds instead of retraining
 
-simulation_preds = rf.predict(simX_test)
-print("Model's Accuracy:",rf.score(simX_test, simY_test))
-print(classification_report(simY_test,simulation_preds))
+from trend_forecaster.registry import ModelRegistry
 
-# Plotting a confusion matrix 
+model_registry = ModelRegistry('model_registry')
+model_registry.save('logistic', model, FEATURES, X_train.index.min(), X_train.index.max(), {'accuracy': model.score(X_test, y_test)})
+model_registry.save('random_forest', rf, FEATURES, X_train.index.min(), X_train.index.max(), {'accuracy': rf.score(X_test, y_test)})
+
+# A single random path says little about the models, so both classifiers are also scored across
+# 1000 simulated paths (block bootstrap of the HA log returns); the result is a distribution of accuracies
+
+from trend_forecaster.montecarlo import monte_carlo_accuracy
+
+mc_accuracy = monte_carlo_accuracy({'logistic': model, 'random_forest': rf}, log_returns, initial, n_paths=1000, n_steps=5000, method='block', seed=42)
+print(mc_accuracy.describe())
 
-plot_confusion_matrix(rf, simX_test, simY_test)
-plt.show()
+"""# **WALK-FORWARD EVALUATION**
+
+##### The shuffled train/test split above lets the classifiers train on bars from after the test period. The walk-forward engine retrains both models on expanding windows of past bars only and scores them on the window that follows (folds run in parallel).
+"""
+
+from trend_forecaster.walkforward import walk_forward
+
+wf_metrics, wf_predictions = walk_forward(X, y, train_size=1000, test_size=250, mode='expanding')
+print(wf_metrics.groupby('model')[['accuracy','f1_macro']].mean())
+wf_metrics
 
 """The results from classification models show us that in our case, Logistic Regression would be a better choice 
 
@@ -317,7 +272,7 @@ plt.show()
 
 #pd.set_option('display.max_rows', 100)
 
-data_open['long'] = np.where(data_open.EMA_1 > data_open.EMA_5, 1,0)
+data_open['long'] = np.where(data_open.EMA_1 > data_open.EMA_5, 1,0).astype(np.int8)
 data_open['Signal'] = data_open['long'].diff()
 
 # We need to shift the signals one step down. 
@@ -327,112 +282,67 @@ data_open['Signal'] = data_open['long'].diff()
 data_open['Signal'] = data_open['Signal'].shift(1)
 data_open
 
-#Creating another dataframe to do some testing with signals
-
 # Here we are integrating the moving average signals along with the direction signals
+# (new columns are added to data_open itself; the base columns stay views of the feature store)
 
-opens = data_open.copy(deep=True)
-
-condition = [((opens['Signal']==1) & (opens['direction']=='UP')),
-             ((opens['Signal']==1) & (opens['direction']=='DOWN')),
-             ((opens['Signal']==0) & (opens['direction']=='UP')),
-             ((opens['Signal']==0) & (opens['direction']=='DOWN')),
-             ((opens['Signal']==-1) & (opens['direction']=='UP')),
-             ((opens['Signal']==-1) & (opens['direction']=='DOWN'))]
+# momentum_signal is 1 when a bullish crossover (Signal 1) comes with an UP direction, -1 when a bearish
+# crossover (Signal -1) comes with a DOWN direction and 0 otherwise (a lookup table on the int8 codes)
 
-values = [1,0,0,0,0,-1]
-
-opens['momentum_signal'] = np.select(condition,values)
-opens
+with stage('signal_integration'):
+    data_open['momentum_signal'] = momentum_signal(data_open['Signal'], data_open['direction'])
+data_open
 
-"""# **Integration: Applying ML Model on the 'opens' dataframe and predicting values**
+"""# **Integration: Applying ML Model on the 'data_open' dataframe and predicting values**
 
 * These predicted values will be added to another column -- 'ml_predict'
 
 
 """
 
-# actual price data for the ML model
-live_px_data = opens.copy(deep=True)
+# using the ML model that we created earlier to make predictions on 'open_hadf' and 'EMA_5' (X, a view of the store)
+with stage('prediction'):
+    data_open['ml_predict'] = model.predict(X)
 
-# removing all columns except 'open_hadf' and 'EMA_5'
-live_px_data = live_px_data.drop(['open','EMA_1','direction','hadf_pct_change','hadf_log_return','long','Signal','momentum_signal'],1)
-
-# using the ML model that we created earlier to make predictions
-ml_pred = model.predict(live_px_data)
-
-# converting the numpy array to a pandas dataframe
-
-ml_dataframe = pd.DataFrame(ml_pred, columns=['ml_predict'])
-
-# assigning the same index to the predictions dataframe
-ml_dataframe.index = opens.index
-#concatenating the ml_dataframe to opens dataframe
-
-opens = pd.concat([opens,ml_dataframe],axis=1)
-opens
+data_open
 
 """# **FINAL INTEGRATION OF ML MODEL WITH MOMENTUM FILTER**"""
 
-fin_mod = opens.copy(deep=True)
-
-conditions = [((fin_mod['momentum_signal']==1) & (fin_mod['ml_predict']=='UP')),
-             ((fin_mod['momentum_signal']==1) & (fin_mod['ml_predict']=='DOWN')),
-             ((fin_mod['momentum_signal']==0) & (fin_mod['ml_predict']=='UP')),
-             ((fin_mod['momentum_signal']==0) & (fin_mod['ml_predict']=='DOWN')),
-             ((fin_mod['momentum_signal']==-1) & (fin_mod['ml_predict']=='UP')),
-             ((fin_mod['momentum_signal']==-1) & (fin_mod['ml_predict']=='DOWN'))]
+# final_signal keeps a momentum signal only when the ML prediction agrees with it (same lookup table)
 
-values_fin = [1,0,0,0,0,-1]
-
-fin_mod['final_signal'] = np.select(conditions,values_fin)
-final_data = fin_mod.drop(['EMA_1','hadf_pct_change','hadf_log_return','direction','long','Signal'],1)
+with stage('signal_integration'):
+    data_open['final_signal'] = final_signal(data_open['momentum_signal'], data_open['ml_predict'])
 
 # displaying the final data with only necesary columns:
 
+final_data = data_open[['open_hadf','open','EMA_5','momentum_signal','ml_predict','final_signal']]
 final_data
 
+# For live bars, the same momentum_signal / ml_predict / final_signal are produced one bar at a time
+# (constant time per bar, no DataFrame rebuild) by the streaming service:
+
+from trend_forecaster.live import LiveSignalService
+
+live_service = LiveSignalService.from_history(es_px, model)
+
 """# **BACKTESTING**
 
 * Implementation of a backtesting engine for the combined model
 * Utilizes the VectorBT library
 """
 
-# Initializing the portfolio settings for VectorBT
-
-# 1. We will be using the HADF data because it generates signals with little noise
-
-px = pd.to_numeric(final_data['open_hadf'],errors='coerce')
-
-# 2. Setting the initial portfolio cash to 100,000 USD and Trade Size = 1 contract
-
-vbt.settings.portfolio['init_cash'] = 100000.  
-vbt.settings.portfolio['size'] = 1
-
-# Initializing moving averages for VectorBT
-
-fast_ma = vbt.MA.run(px, 1, short_name='fast')
-slow_ma = vbt.MA.run(px, 5, short_name='slow')
+# The same fetch -> Heikin-Ashi -> EMA crossover -> vectorbt -> slippage sequence is run for every contract
+# by the spec-driven runner (trend_forecaster.runner). Each InstrumentSpec carries its point value
+# (ES: 50, GE: 2500), slippage (ES: 8 long / 7 short, GE: 0) and interval, and the contracts are
+# processed in parallel across a process pool. Trade size is 1 contract and initial cash is 100,000 USD.
 
-# Generate LONG crossover signals
-dmac_entries_long = fast_ma.ma_crossed_above(slow_ma)
-dmac_exits_long = fast_ma.ma_crossed_below(slow_ma)
+from trend_forecaster import ES, GE, run_universe
 
-# Build partfolio, which internally calculates the equity curve
+results, trades = run_universe([ES, GE], store, with_trades=True)
+print(results)
 
-dmac_long_pf = vbt.Portfolio.from_signals(px, dmac_entries_long, dmac_exits_long)
+# Trade logs adjusted for the Heikin Ashi factor and slippage (pnl is in points)
 
-# Storing the trades/trade log in a DataFrame
-
-df_test = pd.DataFrame(dmac_long_pf.trades.records)
-
-# Modifying the trades in the DataFrame to adjust for Heikin Ashi Factor and Slippage
-
-df_mod = df_test.copy(deep=True)
-slippage = 8
-df_mod['entry_price'] = df_mod['entry_price'] + slippage
-df_mod['exit_price'] = df_mod['exit_price'] - slippage
-df_mod['pnl'] = df_mod['exit_price']-df_mod['entry_price']
+df_mod = trades['ES', 'long']
 
 """# **PnL Statistics - LONG Signals on E-mini S&P 500 Futures**
 
@@ -441,29 +351,14 @@ df_mod['pnl'] = df_mod['exit_price']-df_mod['entry_price']
 
 # Equity curve for LONG Trade Signals
 
-df_mod['cumulative_pnl_points'] = pd.Series(dtype='float')
-
-for i in range(len(df_mod)):
-  if i == 0:
-    df_mod['cumulative_pnl_points'][i] = df_mod['pnl'][i]
-  else:
-    df_mod['cumulative_pnl_points'][i] = df_mod['pnl'][i] + df_mod['cumulative_pnl_points'][i-1]
+# cumulative_pnl_points is computed (vectorized) by trend_forecaster.analytics.adjust_trades
 
 df_mod['cumulative_pnl_usd'] = df_mod['cumulative_pnl_points']*50.0
-df_mod['cumulative_pnl_usd'].plot(figsize=(10,4),xlabel='Trades',ylabel='Cumulative Profit (in USD)',title='Cumulative Profit/Loss in USD | LONG Trades | E-mini S&P 500 Futures | HYBRID MODEL')
+report.line('es_long_equity', df_mod['cumulative_pnl_usd'], title='Cumulative Profit/Loss in USD | LONG Trades | E-mini S&P 500 Futures | HYBRID MODEL', xlabel='Trades', ylabel='Cumulative Profit (in USD)')
 
 # Distribution of Returns for LONG Trade Signals
 
-df_results = df_mod.drop(['col','entry_idx','entry_fees','entry_idx','exit_fees','direction','parent_id'],1)
-
-x = df_results['return']
-plt.figure(figsize=(10,8))
-plt.hist(x, bins=40)
-plt.xlabel('Returns (per each trade)')
-plt.ylabel('Number of Trades')
-plt.ylim(0,150)
-plt.title('Distribution of Trade Returns | LONG Trades | E-mini S&P 500 Futures | HYBRID MODEL')
-plt.show()
+report.hist('es_long_returns', df_mod['return'], bins=40, title='Distribution of Trade Returns | LONG Trades | E-mini S&P 500 Futures | HYBRID MODEL', xlabel='Returns (per each trade)', ylabel='Number of Trades', ylim=(0,150))
 
 # Calculating the total POINTS the strategy made (not in dollars, since we are using futures)
 
@@ -471,8 +366,8 @@ total_long_pts = df_mod['pnl'].sum()
 
 # Calculating the starting and ending price of the time series to compute the Buy-and-Hold return 
 
-starting_price = int(data_open['open'][0])
-current_price = int(data_open['open'][-1])
+starting_price = int(features['open'][0])
+current_price = int(features['open'][-1])
 
 # PRINT FINAL TRADE AND PORTFOLIO STATISTICS
 
@@ -486,7 +381,7 @@ buyhold_pct_return = float(100*((initial_capital+buyhold_pnl)-initial_capital)/(
 
 
 print("Trade Size: 1 contract")
-print("Total Number of Completed Trades: ",df_test['status'].sum(axis=0,skipna=True))
+print("Total Number of Completed Trades: ",df_mod['status'].sum(axis=0,skipna=True))
 print("Total LONG Pts: ",total_long_pts)
 print("")
 # PnL Statistics -- Strategy vs Buy-and-Hold the Underlying
@@ -503,53 +398,26 @@ print("Portfolio Value at the End of Buy and Hold Strategy: $",int(initial_capit
 print("Buy and Hold Strategy Return: ",buyhold_pct_return,"%")
 print("")
 
+report.add_stats('es_long_summary', {'completed_trades': df_mod['status'].sum(), 'long_pts': total_long_pts, 'long_pnl_usd': long_pnl, 'model_return_pct': strat_pct_return, 'buyhold_pnl_usd': buyhold_pnl, 'buyhold_return_pct': buyhold_pct_return})
+
 # LONG Trade Signal PnL Statistics
 
 print("LONG Signals PnL Stats (in $)")
 print("")
 print((50*trade_size*df_mod['pnl']).describe())
+report.add_stats('es_long_pnl_stats', (50*trade_size*df_mod['pnl']).describe())
 print("")
 
-ymin = -4000
-ymax = 11000
-
-plt.figure(figsize=(20,8))
-plt.plot(df_mod['pnl']*50)
-plt.axhline(y=0, linestyle='dashed', color='red')
-x1,x2,y1,y2 = plt.axis()  
-plt.axis((x1,x2,ymin,ymax))
-plt.title("Individual Trade PnL - LONG TRADES | E-mini S&P 500 Futures")
-plt.show()
+report.line('es_long_trade_pnl', df_mod['pnl']*50, title="Individual Trade PnL - LONG TRADES | E-mini S&P 500 Futures", hline=0, ylim=(-4000,11000), figsize=(20,8))
 
 """# **PnL Statistics - SHORT Signals on E-mini S&P 500 Futures**
 
 * Profit/Loss analysis of SHORT signal trades and overall model on the E-mini S&P 500 futures
 """
 
-# SHORT Trade Signals
-
-fast_ma_short = vbt.MA.run(px, 1, short_name='fast')
-slow_ma_short = vbt.MA.run(px, 5, short_name='slow')
-dmac_entries_short = fast_ma_short.ma_crossed_below(slow_ma_short)
-dmac_exits_short = fast_ma_short.ma_crossed_above(slow_ma_short)
+# SHORT Trade Signals (backtested by the runner above)
 
-# Build portfolio, which internally calculates the equity curve
-
-dmac_short_pf = vbt.Portfolio.from_signals(px, dmac_entries_short, dmac_exits_short)
-
-# Storing the trades/trade log in a DataFrame
-
-df_test_short = pd.DataFrame(dmac_short_pf.trades.records)
-
-# Modifying the trades in the DataFrame to adjust for Heikin Ashi Factor and Slippage
-
-df_mod_short = df_test_short.copy(deep=True)
-slippage_short = 7
-df_mod_short['entry_price'] = df_mod_short['entry_price'] - slippage_short
-df_mod_short['exit_price'] = df_mod_short['exit_price'] + slippage_short
-
-df_mod_short['pnl'] = df_mod_short['exit_price']-df_mod_short['entry_price']
-df_mod_short['pnl'] = -1*df_mod_short['pnl']
+df_mod_short = trades['ES', 'short']
 
 # Calculating the total POINTS the strategy made (not in dollars, since we are using futures)
 
@@ -559,97 +427,33 @@ short_pnl = total_short_pts*50*short_trade_size
 
 # Plotting the Equity Curve for SHORT Trade Signals
 
-df_mod_short['cumulative_pnl_points'] = pd.Series(dtype='float')
-
-for i in range(len(df_mod_short)):
-  if i == 0:
-    df_mod_short['cumulative_pnl_points'][i] = df_mod_short['pnl'][i]
-  else:
-    df_mod_short['cumulative_pnl_points'][i] = df_mod_short['pnl'][i] + df_mod_short['cumulative_pnl_points'][i-1]
+# cumulative_pnl_points is computed (vectorized) by trend_forecaster.analytics.adjust_trades
 
 df_mod_short['cumulative_pnl_usd'] = df_mod_short['cumulative_pnl_points']*50.0
-df_mod_short['cumulative_pnl_usd'].plot(figsize=(10,4),xlabel='Trades',ylabel='Cumulative Profit (in USD)',title='Cumulative Profit/Loss in USD | SHORT Trades | E-mini S&P 500 Futures | HYBRID MODEL')
+report.line('es_short_equity', df_mod_short['cumulative_pnl_usd'], title='Cumulative Profit/Loss in USD | SHORT Trades | E-mini S&P 500 Futures | HYBRID MODEL', xlabel='Trades', ylabel='Cumulative Profit (in USD)')
 
 # Distribution of Returns for SHORT Trade Signals
 
-y = df_mod_short['return']
-plt.figure(figsize=(10,8))
-plt.hist(y, bins=70)
-plt.xlabel('Returns (per each trade)')
-plt.ylabel('Number of Trades')
-plt.ylim(0,150)
-plt.title('Distribution of Trade Returns | SHORT Trades | E-mini S&P 500 Futures | HYBRID MODEL')
-plt.show()
+report.hist('es_short_returns', df_mod_short['return'], bins=70, title='Distribution of Trade Returns | SHORT Trades | E-mini S&P 500 Futures | HYBRID MODEL', xlabel='Returns (per each trade)', ylabel='Number of Trades', ylim=(0,150))
 
 # SHORT Trade Signal PnL Statistics
 
 print("SHORT Signals PnL Stats (in $)")
 print("")
 print((50*trade_size*df_mod_short['pnl']).describe())
+report.add_stats('es_short_pnl_stats', (50*trade_size*df_mod_short['pnl']).describe())
 print("")
 
-ymin = -4000
-ymax = 25000
-
-plt.figure(figsize=(20,8))
-plt.plot(df_mod_short['pnl']*50)
-#plt.axhline(y=100, linestyle='dashed', color='black')
-plt.axhline(y=0, linestyle='dashed', color='red') #y=150 for NQ 
-#plt.axhline(y=300, linestyle='dashed', color='blue')
-x1,x2,y1,y2 = plt.axis()  
-plt.axis((x1,x2,ymin,ymax))
-plt.title("Individual Trade PnL - SHORT TRADES | E-mini S&P 500 Futures")
-plt.show()
+report.line('es_short_trade_pnl', df_mod_short['pnl']*50, title="Individual Trade PnL - SHORT TRADES | E-mini S&P 500 Futures", hline=0, ylim=(-4000,25000), figsize=(20,8))
 
 """# **MODEL RESULTS ON EURODOLLAR FUTURES**
 
 ##### Now we will test our final model and its robustness on the Eurodollar Futures market. This market has a completely different microstructure and moves very slowly
 """
 
-ge = tv.get_hist(symbol='GE',exchange='CME',interval=Interval.in_weekly,n_bars=5000,fut_contract=1)
-ge_px = ge.drop(['symbol','volume'],1) #drop the columns for symbol and volume (not needed in the analysis)
+# GE is backtested by the same runner as ES (see the BACKTESTING section)
 
-#Converting candlesticks to Heikin Ashi
-hadf = heikin_ashi(ge_px) 
-
-data_open_ge = pd.DataFrame(hadf['open'])
-data_open_ge.columns = ['open_hadf']
-data_open_ge['open'] = pd.DataFrame(ge_px['open'])
-
-# BACKTESTING STUFF
-
-#portfolio settings for VectorBT
-
-px_ge = pd.to_numeric(data_open_ge['open_hadf'],errors='coerce')
-vbt.settings.portfolio['init_cash'] = 100000.  # $100000
-vbt.settings.portfolio['size'] = 1
-
-# Moving averages for VectorBT
-
-fast_ma_long_ge = vbt.MA.run(px_ge, 1, short_name='fast')
-slow_ma_long_ge = vbt.MA.run(px_ge, 5, short_name='slow')  
-
-# Generate LONG crossover signals
-dmac_entries_long_ge = fast_ma_long_ge.ma_crossed_above(slow_ma_long_ge)
-dmac_exits_long_ge = fast_ma_long_ge.ma_crossed_below(slow_ma_long_ge)
-
-# Build partfolio, which internally calculates the equity curve
-
-# Volume is set to np.inf by default to buy/sell everything
-# You don't have to pass freq here because our data is already perfectly time-indexed
-dmac_long_pf_ge = vbt.Portfolio.from_signals(px_ge, dmac_entries_long_ge, dmac_exits_long_ge)                                            
-
-# Storing the trades/trade log in a DataFrame
-
-df_test_ge = pd.DataFrame(dmac_long_pf_ge.trades.records)
-
-# Modifying the trades in the DataFrame to adjust for Heikin Ashi Factor and Slippage
-
-df_mod_ge = df_test_ge.copy(deep=True)
-slippage_long_ge = 0
-df_mod_ge['entry_price'] = df_mod_ge['entry_price'] + slippage_long_ge
-df_mod_ge['exit_price'] = df_mod_ge['exit_price'] - slippage_long_ge
-df_mod_ge['pnl'] = df_mod_ge['exit_price']-df_mod_ge['entry_price']
+df_mod_ge = trades['GE', 'long']
 
 # Calculating the total POINTS the strategy made (not in dollars, since we are using futures)
 
@@ -666,32 +470,18 @@ long_pnl_ge = total_long_pts_ge*2500*trade_size_ge
 
 # Plotting the Equity Curve for LONG Trade Signals - Eurodollar futures
 
-df_mod_ge['cumulative_pnl_points'] = pd.Series(dtype='float')
-
-for i in range(len(df_mod_ge)):
-  if i == 0:
-    df_mod_ge['cumulative_pnl_points'][i] = df_mod_ge['pnl'][i]
-  else:
-    df_mod_ge['cumulative_pnl_points'][i] = df_mod_ge['pnl'][i] + df_mod_ge['cumulative_pnl_points'][i-1]
+# cumulative_pnl_points is computed (vectorized) by trend_forecaster.analytics.adjust_trades
 
 df_mod_ge['cumulative_pnl_usd'] = df_mod_ge['cumulative_pnl_points']*2500.0
-df_mod_ge['cumulative_pnl_usd'].plot(figsize=(10,4),xlabel='Trades',ylabel='Cumulative Profit (in USD)',title='Cumulative Profit/Loss in USD - LONG TRADES - HYBRID MODEL | Eurodollar Futures')
+report.line('ge_long_equity', df_mod_ge['cumulative_pnl_usd'], title='Cumulative Profit/Loss in USD - LONG TRADES - HYBRID MODEL | Eurodollar Futures', xlabel='Trades', ylabel='Cumulative Profit (in USD)')
 
 # Plotting the distribution of returns for LONG Trade Signals - Eurodollar Futures
 
-x_ge = df_mod_ge['return']
-plt.figure(figsize=(10,8))
-plt.hist(x_ge, bins=40)
-plt.xlabel('Returns (per each trade)')
-plt.ylabel('Number of Trades')
-plt.ylim(0,100)
-plt.title('Distribution of LONG Trade Returns -- HYBRID MODEL | Eurodollar Futures')
-plt.show()
+report.hist('ge_long_returns', df_mod_ge['return'], bins=40, title='Distribution of LONG Trade Returns -- HYBRID MODEL | Eurodollar Futures', xlabel='Returns (per each trade)', ylabel='Number of Trades', ylim=(0,100))
 
 # LONG Trade Signal PnL Statistics - Eurodollar futures
 
 
-import matplotlib.pyplot as plt
 print("Trade Size:",trade_size_ge, "contract")
 print("")
 # total points captured using LONG trades (adjusted for commissions and slippage)
@@ -704,18 +494,10 @@ print("")
 print("PnL Stats for LONG Eurodollar (in $)")
 print("")
 print((2500*trade_size_ge*df_mod_ge['pnl']).describe())
+report.add_stats('ge_long_pnl_stats', (2500*trade_size_ge*df_mod_ge['pnl']).describe())
 print("")
 
-ymin = -4000
-ymax = 11000
-
-plt.figure(figsize=(20,8))
-plt.plot(df_mod_ge['pnl']*2500)
-plt.axhline(y=0, linestyle='dashed', color='red')
-x1,x2,y1,y2 = plt.axis()  
-plt.axis((x1,x2,ymin,ymax))
-plt.title("Individual Trade PnL - LONG TRADES | Eurodollar Futures")
-plt.show()
+report.line('ge_long_trade_pnl', df_mod_ge['pnl']*2500, title="Individual Trade PnL - LONG TRADES | Eurodollar Futures", hline=0, ylim=(-4000,11000), figsize=(20,8))
 
 """# **PnL Statistics - SHORT Signals on Eurodollar Futures**
 
@@ -724,34 +506,7 @@ plt.show()
 
 """
 
-# Moving averages for VectorBT
-
-fast_ma_short_ge = vbt.MA.run(px_ge, 1, short_name='fast')
-slow_ma_short_ge = vbt.MA.run(px_ge, 5, short_name='slow')
-
-
-# Generate SHORT crossover signals
-dmac_entries_short_ge = fast_ma_short_ge.ma_crossed_below(slow_ma_short_ge)
-dmac_exits_short_ge = fast_ma_short_ge.ma_crossed_above(slow_ma_short_ge)
-
-# Build portfolio, which internally calculates the equity curve
-
-dmac_short_pf_ge = vbt.Portfolio.from_signals(px_ge, dmac_entries_short_ge, dmac_exits_short_ge)
-
-# Storing the trades/trade log in a DataFrame
-
-df_test_short_ge = pd.DataFrame(dmac_short_pf_ge.trades.records)
-
-# Modifying the trades in the DataFrame to adjust for Heikin Ashi Factor and Slippage
-
-
-df_mod_short_ge = df_test_short_ge.copy(deep=True)
-slippage_short_ge = 0
-df_mod_short_ge['entry_price'] = df_mod_short_ge['entry_price'] - slippage_short_ge
-df_mod_short_ge['exit_price'] = df_mod_short_ge['exit_price'] + slippage_short_ge
-
-df_mod_short_ge['pnl'] = df_mod_short_ge['exit_price']-df_mod_short_ge['entry_price']
-df_mod_short_ge['pnl'] = -1*df_mod_short_ge['pnl']
+df_mod_short_ge = trades['GE', 'short']
 
 # Calculating the total POINTS the strategy made (not in dollars, since we are using futures)
 
@@ -761,17 +516,11 @@ short_pnl_ge = total_short_pts_ge*2500*short_trade_size_ge
 
 # Plotting the Equity Curve for LONG Trade Signals - Eurodollar futures
 
-df_mod_short_ge['cumulative_pnl_points'] = pd.Series(dtype='float')
-
-for i in range(len(df_mod_short_ge)):
-  if i == 0:
-    df_mod_short_ge['cumulative_pnl_points'][i] = df_mod_short_ge['pnl'][i]
-  else:
-    df_mod_short_ge['cumulative_pnl_points'][i] = df_mod_short_ge['pnl'][i] + df_mod_short_ge['cumulative_pnl_points'][i-1]
+# cumulative_pnl_points is computed (vectorized) by trend_forecaster.analytics.adjust_trades
 
 df_mod_short_ge['cumulative_pnl_usd'] = df_mod_short_ge['cumulative_pnl_points']*2500.0
 
-df_mod_short_ge['cumulative_pnl_usd'].plot(figsize=(10,4),xlabel='Trades',ylabel='Cumulative Profit (in USD)',title='Cumulative Profit/Loss in USD - SHORT TRADES - HYBRID MODEL | Eurodollar Futures')
+report.line('ge_short_equity', df_mod_short_ge['cumulative_pnl_usd'], title='Cumulative Profit/Loss in USD - SHORT TRADES - HYBRID MODEL | Eurodollar Futures', xlabel='Trades', ylabel='Cumulative Profit (in USD)')
 
 # SHORT Trade Signal PnL Statistics - Eurodollar futures
 
@@ -786,27 +535,24 @@ print("")
 print("PnL Stats for SHORT Eurodollar Signals (in $)")
 print("")
 print((2500*short_trade_size_ge*df_mod_short_ge['pnl']).describe())
+report.add_stats('ge_short_pnl_stats', (2500*short_trade_size_ge*df_mod_short_ge['pnl']).describe())
 print("")
 
-ymin = -4000
-ymax = 6000
-
-plt.figure(figsize=(20,8))
-plt.plot(df_mod_short_ge['pnl']*2500)
-plt.axhline(y=0, linestyle='dashed', color='red') #y=150 for NQ 
-plt.title("Individual Trade PnL - SHORT TRADES | Eurodollar Futures")
-x1,x2,y1,y2 = plt.axis()  
-plt.axis((x1,x2,ymin,ymax))
-plt.show()
+report.line('ge_short_trade_pnl', df_mod_short_ge['pnl']*2500, title="Individual Trade PnL - SHORT TRADES | Eurodollar Futures", hline=0, ylim=(-4000,6000), figsize=(20,8))
 
 # Plotting the distribution of returns for SHORT Trade Signals - Eurodollar Futures
 
 
-y_ge = df_mod_short_ge['return']
-plt.figure(figsize=(10,8))
-plt.hist(y_ge, bins=40)
-plt.xlabel('Returns (per each trade)')
-plt.ylabel('Number of Trades')
-plt.ylim(0,100)
-plt.title('Distribution of SHORT Trade Returns | Eurodollar Futures | HYBRID MODEL')
-plt.show()
+report.hist('ge_short_returns', df_mod_short_ge['return'], bins=40, title='Distribution of SHORT Trade Returns | Eurodollar Futures | HYBRID MODEL', xlabel='Returns (per each trade)', ylabel='Number of Trades', ylim=(0,100))
+
+# Writing the report bundle: all figures are rendered headlessly (Agg backend) in a pool of worker processes
+
+report.add_stats('backtest_results', results)
+report.add_stats('monte_carlo_accuracy', mc_accuracy.describe())
+report.add_stats('walk_forward_metrics', wf_metrics)
+print("Report written to", report.write())
+
+# Stage timings collected by the instrumentation layer (empty unless it was enabled)
+
+if instrument.is_enabled():
+    print(instrument.summary())
@@ -0,0 +1,157 @@
+# Parity of the native kernels with the code they replace
+#
+# The same cases as `python -m trend_forecaster.bench --parity` on short
+# histories, plus the Heikin-Ashi filter against the script's row loop, adf()
+# against statsmodels' adfuller and the streamed features against the batch
+# ones. Tests of optional dependencies are skipped when they are missing.
+
+import warnings
+
+import numpy as np
+import pytest
+
+from trend_forecaster import crossover
+from trend_forecaster.bench import _mismatches, check_parity, synthetic_bars
+from trend_forecaster.features import FeatureStore
+from trend_forecaster.heikin_ashi import HeikinAshiStream, heikin_ashi, heikin_ashi_arrays
+from trend_forecaster.live import LiveSignalService
+
+N_BARS = 600
+
+
+@pytest.fixture(scope='module')
+def bars():
+    return synthetic_bars(N_BARS, seed=3)
+
+
+def _script_heikin_ashi(df):
+    # the script's row-by-row conversion
+    o, h, l, c = (df[k].to_numpy() for k in ('open', 'high', 'low', 'close'))
+    ha_close = (o + h + l + c) / 4
+    ha_open = np.empty(len(df))
+    ha_open[0] = o[0]
+    for i in range(1, len(df)):
+        ha_open[i] = (ha_open[i - 1] + ha_close[i - 1]) / 2
+    ha_high = np.maximum.reduce([ha_open, ha_close, h])
+    ha_low = np.minimum.reduce([ha_open, ha_close, l])
+    return ha_open, ha_high, ha_low, ha_close
+
+
+def test_heikin_ashi_matches_row_loop(bars):
+    ha = heikin_ashi(bars)
+    for name, expected in zip(('open', 'high', 'low', 'close'), _script_heikin_ashi(bars)):
+        np.testing.assert_array_equal(ha[name].to_numpy(), expected)
+
+
+def test_heikin_ashi_chunks_and_stream_match_batch(bars):
+    ha = heikin_ashi(bars)
+    split = N_BARS // 3
+    first = heikin_ashi_arrays(*(bars[k].iloc[:split] for k in ('open', 'high', 'low', 'close')))
+    rest = heikin_ashi_arrays(*(bars[k].iloc[split:] for k in ('open', 'high', 'low', 'close')),
+                              prev=(first[0][-1], first[3][-1]))
+    np.testing.assert_array_equal(np.concatenate((first[0], rest[0])), ha['open'].to_numpy())
+
+    stream = HeikinAshiStream.from_history(bars.iloc[:split])
+    streamed = [stream.update(bar) for bar in bars.iloc[split:].to_dict('records')]
+    np.testing.assert_array_equal(np.array(streamed),
+                                  ha.iloc[split:][['open', 'high', 'low', 'close']].to_numpy())
+
+
+class _AlwaysUp:
+    def predict(self, X):
+        return np.array(['UP'] * len(X))
+
+
+def test_live_features_match_batch(bars):
+    store = FeatureStore.from_bars(bars)
+    split = N_BARS // 2
+    service = LiveSignalService.from_history(bars.iloc[:split], _AlwaysUp())
+    signals = [service.update(bar) for bar in bars.iloc[split:].to_dict('records')]
+    # the store drops the first bar (no pct change)
+    rows = slice(split - 1, None)
+    for name in ('open_hadf', 'EMA_1', 'EMA_5'):
+        np.testing.assert_allclose([getattr(s, name) for s in signals], store[name][rows],
+                                   rtol=1e-12)
+    np.testing.assert_array_equal([s.direction for s in signals], store.direction[rows])
+
+
+def test_live_first_bar_is_flat(bars):
+    store = FeatureStore.from_bars(bars)
+    service = LiveSignalService(_AlwaysUp())
+    signals = [service.update(bar) for bar in bars.to_dict('records')]
+    # batch has no row for the first bar, so the stream signals nothing on it
+    assert signals[0].direction == signals[0].momentum_signal == signals[0].final_signal == 0
+    np.testing.assert_array_equal([s.direction for s in signals[1:]], store.direction)
+
+
+@pytest.mark.parametrize('regression', ['n', 'c', 'ct', 'ctt'])
+@pytest.mark.parametrize('autolag', ['AIC', 'BIC', None])
+def test_adf_matches_adfuller(regression, autolag):
+    stattools = pytest.importorskip('statsmodels.tsa.stattools')
+    from trend_forecaster.stationarity import adf
+
+    rng = np.random.default_rng(0)
+    x = 0.1 * np.cumsum(rng.normal(size=500)) + rng.normal(size=500)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = stattools.adfuller(x, regression=regression, autolag=autolag)
+    result = adf(x, regression=regression, autolag=autolag)
+    assert result['used_lag'] == expected[2]
+    assert result['nobs'] == expected[3]
+    np.testing.assert_allclose([result['adf_stat'], result['adf_pvalue']], expected[:2],
+                               rtol=1e-8, atol=1e-12)
+    np.testing.assert_allclose([result['crit_1%'], result['crit_5%'], result['crit_10%']],
+                               [expected[4][k] for k in ('1%', '5%', '10%')])
+
+
+@pytest.mark.parametrize('blocks', [1, 4])
+@pytest.mark.parametrize('gaps', [False, True])
+def test_crossover_indicators_match_vectorbt(blocks, gaps):
+    vbt = pytest.importorskip('vectorbt')
+    from trend_forecaster.chunked import Crossed, RollingMean
+
+    rng = np.random.default_rng(1)
+    px = 100 + np.cumsum(rng.normal(size=N_BARS))
+    if gaps:
+        px[[50, 51, 300]] = np.nan
+    fast_ma, slow_ma = vbt.MA.run(px, 2), vbt.MA.run(px, 5)
+    parts = np.array_split(px, blocks)
+    fast, slow = RollingMean(2), RollingMean(5)
+    fast = np.concatenate([fast.update(p) for p in parts])
+    slow = np.concatenate([slow.update(p) for p in parts])
+    np.testing.assert_array_equal(fast, fast_ma.ma.to_numpy())
+    np.testing.assert_array_equal(slow, slow_ma.ma.to_numpy())
+    above, below = Crossed(), Crossed()
+    cuts = np.cumsum([len(p) for p in parts])[:-1]
+    above = np.concatenate([above.update(f, s) for f, s in
+                            zip(np.split(fast, cuts), np.split(slow, cuts))])
+    below = np.concatenate([below.update(s, f) for f, s in
+                            zip(np.split(fast, cuts), np.split(slow, cuts))])
+    np.testing.assert_array_equal(above, fast_ma.ma_crossed_above(slow_ma).to_numpy())
+    np.testing.assert_array_equal(below, fast_ma.ma_crossed_below(slow_ma).to_numpy())
+
+
+def test_backtests_match_vectorbt():
+    pytest.importorskip('vectorbt')
+    results = check_parity((N_BARS,), chunk_rows=128)
+    assert (results['trades'] > 0).all()
+    assert results['mismatches'].sum() == 0, results[results['mismatches'] > 0]
+
+
+@pytest.mark.parametrize('compiled', [True, False])
+def test_sized_down_trades_match_vectorbt(monkeypatch, compiled):
+    vbt = pytest.importorskip('vectorbt')
+    if not compiled:
+        monkeypatch.setattr(crossover, '_compiled', crossover._sized_fills)
+
+    rng = np.random.default_rng(7)
+    for init_cash in (1e-7, 1., 30., 100., 150.):
+        n = 300
+        px = 100 * np.exp(np.cumsum(rng.normal(0, 0.05, n)))
+        px[rng.random(n) < 0.05] = np.nan
+        entries = rng.random((n, 3)) < 0.2
+        exits = rng.random((n, 3)) < 0.2
+        native = crossover.trade_records(px, entries, exits, init_cash=init_cash)
+        reference = vbt.Portfolio.from_signals(px[:, np.newaxis], entries, exits,
+                                               init_cash=init_cash, size=1.).trades.records
+        assert _mismatches(native, reference) == 0, init_cash
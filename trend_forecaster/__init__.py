@@ -0,0 +1,59 @@
+# Library code behind the FYP integrated model (fyp_integrated_model_main.py)
+#
+# Importing the package is cheap: most names below are resolved on first
+# attribute access (PEP 562), so `from trend_forecaster import LiveSignalService`
+# only loads the live-signal modules and NumPy. pandas, scikit-learn,
+# statsmodels, vectorbt and matplotlib are imported by the stages that use
+# them. Command line: `trend-forecaster --help` (see cli.py).
+
+import importlib
+
+# these two share their name with their submodule, which would otherwise
+# replace the lazily exported function once the submodule is imported; both
+# modules only need NumPy at import time
+from .heikin_ashi import heikin_ashi, heikin_ashi_many, HeikinAshiStream
+from .sweep import sweep
+
+_EXPORTS = {
+    'BarStore': 'datastore', 'CsvSource': 'datastore',
+    'InstrumentSpec': 'runner', 'ES': 'runner', 'GE': 'runner',
+    'run_instrument': 'runner', 'run_universe': 'runner',
+    'adjust_trades': 'analytics', 'analyze_trades': 'analytics', 'trade_stats': 'analytics',
+    'walk_forward': 'walkforward',
+    'LiveSignalService': 'live',
+    'monte_carlo_accuracy': 'montecarlo', 'simulate_paths': 'montecarlo',
+    'ModelRegistry': 'registry',
+    'UP': 'signals', 'DOWN': 'signals', 'direction': 'signals',
+    'momentum_signal': 'signals', 'final_signal': 'signals',
+    'FeatureStore': 'features',
+    'resample_bars': 'resample', 'Resampler': 'resample',
+    'technical_features': 'technical', 'TechnicalConfig': 'technical',
+    'TechnicalStream': 'technical',
+    'backtest_chunked': 'chunked', 'backtest_crossover': 'crossover',
+    'FillModel': 'fills', 'fill_trades': 'fills',
+    'simulate': 'portfolio', 'backtest_account': 'runner',
+    'Report': 'reporting',
+    'SharedPool': 'shared', 'publish': 'shared',
+    'StageCache': 'stagecache',
+    'run_pipeline': 'pipeline',
+}
+
+_SUBMODULES = {'instrument', 'pipeline', 'stationarity', 'significance', 'cli', 'bench'}
+
+__all__ = sorted(_EXPORTS) + ['heikin_ashi', 'heikin_ashi_many', 'HeikinAshiStream',
+                                'sweep', 'instrument']
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    elif name in _SUBMODULES:
+        value = importlib.import_module('.' + name, __name__)
+    else:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
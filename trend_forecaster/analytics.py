@@ -0,0 +1,177 @@
+# Trade analytics on vectorbt trade records
+#
+# Everything works on the raw `trades.records` structured array (or a
+# DataFrame of it) and handles many backtests at once: trades are laid out
+# in a NaN-padded (max_trades, n_cols) matrix with one column per record
+# `col`, i.e. per parameter set, and every statistic is a NumPy reduction
+# along axis 0. No Python loop runs per trade or per column.
+
+import warnings
+
+import numpy as np
+
+DIRECTIONS = {'long': 1, 'short': -1}
+
+STAT_COLUMNS = ['trades', 'total_pts', 'total_usd', 'win_rate', 'profit_factor',
+                'max_drawdown_usd', 'count', 'mean', 'std', 'min', '25%', '50%',
+                '75%', 'max']
+
+
+def _field(records, name):
+    return np.asarray(records[name])
+
+
+def _sign(direction):
+    if direction not in DIRECTIONS:
+        raise ValueError("direction must be 'long' or 'short'")
+    return DIRECTIONS[direction]
+
+
+def adjusted_pnl(records, slippage=0., direction='long'):
+    """Per-trade pnl in points after slippage.
+
+    Slippage is paid on both entry and exit. For 'short' the records are
+    those of the mirrored long-only portfolio (as in the script), so the
+    sign of the pnl is flipped.
+    """
+    sign = _sign(direction)
+    entry = _field(records, 'entry_price').astype(np.float64) + sign * slippage
+    exit_ = _field(records, 'exit_price').astype(np.float64) - sign * slippage
+    return sign * (exit_ - entry)
+
+
+def adjust_trades(records, slippage=0., direction='long'):
+    """Trade log DataFrame with slippage-adjusted entry/exit prices, pnl in
+    points, return (pnl / entry price) and the running cumulative_pnl_points
+    of each column (fills.fill_trades with a fixed slippage only)."""
+    import pandas as pd
+
+    sign = _sign(direction)
+    df = pd.DataFrame(records)
+    df['entry_price'] = df['entry_price'] + sign * slippage
+    df['exit_price'] = df['exit_price'] - sign * slippage
+    df['pnl'] = sign * (df['exit_price'] - df['entry_price'])
+    df['return'] = df['pnl'] / df['entry_price']
+    df['cumulative_pnl_points'] = cumulative_pnl(df['pnl'].to_numpy(), df['col'].to_numpy())
+    return df
+
+
+def cumulative_pnl(pnl, col):
+    """Running pnl sum within each column, in record order."""
+    pnl = np.asarray(pnl, dtype=np.float64)
+    col = np.asarray(col)
+    if not len(col) or (col == col[0]).all():
+        return np.cumsum(pnl)   # one backtest
+    # the trades of each column as a zero-padded (max_trades, n_cols)
+    # matrix, summed down axis 0: the same sequential sums as a per-column
+    # cumsum, for all columns at once
+    order = np.argsort(col, kind='stable')
+    sorted_col = col[order]
+    first = np.ones(len(col), dtype=bool)
+    first[1:] = sorted_col[1:] != sorted_col[:-1]
+    group = np.cumsum(first) - 1
+    starts = np.flatnonzero(first)
+    rank = np.arange(len(col)) - starts[group]
+    matrix = np.zeros((rank.max() + 1, len(starts)))
+    matrix[rank, group] = pnl[order]
+    out = np.empty(len(col))
+    out[order] = np.cumsum(matrix, axis=0)[rank, group]
+    return out
+
+
+def pnl_matrix(records, slippage=0., direction='long', n_cols=None):
+    """Adjusted pnl (points) as a NaN-padded (max_trades, n_cols) matrix.
+
+    Row k of column c is the k-th trade of backtest c.
+    """
+    pnl = adjusted_pnl(records, slippage, direction)
+    cols = _field(records, 'col').astype(np.intp)
+    if n_cols is None:
+        n_cols = int(cols.max()) + 1 if len(cols) else 1
+
+    # position of each trade within its column (records are grouped by col
+    # but do not have to be sorted)
+    order = np.argsort(cols, kind='stable')
+    sorted_cols = cols[order]
+    counts = np.bincount(sorted_cols, minlength=n_cols)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.empty(len(cols), dtype=np.intp)
+    rank[order] = np.arange(len(cols)) - starts[sorted_cols]
+
+    out = np.full((counts.max() if len(cols) else 0, n_cols), np.nan)
+    out[rank, cols] = pnl
+    return out
+
+
+def equity_curves(pnl):
+    """Cumulative pnl per column, NaN after each column's last trade."""
+    cum = np.nancumsum(pnl, axis=0)
+    cum[np.isnan(pnl)] = np.nan
+    return cum
+
+
+def drawdowns(cum):
+    """Drawdown from the running peak (starting equity counts as a peak of 0)."""
+    peak = np.fmax(np.fmax.accumulate(cum, axis=0), 0.)
+    return cum - peak
+
+
+def trade_stats(pnl, point_value=1.):
+    """Summary statistics per column of a pnl matrix (points).
+
+    Returns a DataFrame with one row per column: trade count, total pnl,
+    win rate, profit factor, max drawdown and the describe() statistics of
+    the per-trade pnl in USD.
+    """
+    import pandas as pd
+
+    usd = pnl * point_value
+    valid = ~np.isnan(usd)
+    count = valid.sum(axis=0)
+    has = count > 0
+
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns
+        total = np.nansum(usd, axis=0)
+        wins = (usd > 0).sum(axis=0)
+        gross_profit = np.where(usd > 0, usd, 0.).sum(axis=0)
+        gross_loss = -np.where(usd < 0, usd, 0.).sum(axis=0)
+        mean = np.where(has, total / np.maximum(count, 1), np.nan)
+        var = np.nansum((usd - mean) ** 2, axis=0) / (count - 1)
+        std = np.where(count > 1, np.sqrt(var), np.nan)
+        profit_factor = np.where(gross_loss > 0, gross_profit / gross_loss,
+                                 np.where(gross_profit > 0, np.inf, np.nan))
+        win_rate = np.where(has, wins / np.maximum(count, 1), np.nan)
+        if usd.shape[0]:
+            max_dd = np.nanmin(drawdowns(equity_curves(usd)), axis=0)
+            q = np.nanpercentile(usd, [0, 25, 50, 75, 100], axis=0)
+        else:
+            max_dd = np.full(usd.shape[1], np.nan)
+            q = np.full((5, usd.shape[1]), np.nan)
+
+    return pd.DataFrame({
+        'trades': count,
+        'total_pts': np.nansum(pnl, axis=0),
+        'total_usd': total,
+        'win_rate': win_rate,
+        'profit_factor': profit_factor,
+        'max_drawdown_usd': max_dd,
+        'count': count.astype(np.float64),
+        'mean': mean,
+        'std': std,
+        'min': q[0],
+        '25%': q[1],
+        '50%': q[2],
+        '75%': q[3],
+        'max': q[4],
+    }, columns=STAT_COLUMNS)
+
+
+def analyze_trades(records, slippage=0., point_value=1., direction='long', n_cols=None):
+    """Slippage/point-value adjusted analytics for one or many backtests.
+
+    Returns (stats, equity) where stats is the trade_stats() frame and
+    equity the cumulative pnl in USD, one column per backtest.
+    """
+    pnl = pnl_matrix(records, slippage, direction, n_cols)
+    return trade_stats(pnl, point_value), equity_curves(pnl) * point_value
@@ -0,0 +1,345 @@
+# Benchmark suite for the stages of the integrated pipeline
+#
+# Every stage runs on synthetic OHLC bars (no TvDatafeed call) at each of the
+# requested sizes. Wall time, peak traced memory and throughput go to a JSON
+# results file, and a stored baseline can be compared against to flag
+# regressions.
+#
+#   python -m trend_forecaster.bench --sizes 5000 100000 1000000 --out bench.json
+#   python -m trend_forecaster.bench --baseline bench_baseline.json
+#   python -m trend_forecaster.bench --save-baseline bench_baseline.json
+#   python -m trend_forecaster.bench --parity --sizes 5000 100000
+#
+# --parity checks the native backtest engines against vectorbt trade for
+# trade instead of timing them (see check_parity) and fails on any mismatch;
+# tests/test_parity.py runs the same cases on short histories.
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .features import FeatureStore
+from .heikin_ashi import heikin_ashi
+from .signals import final_signal, momentum_signal
+
+DEFAULT_SIZES = [5000, 100000, 1000000]
+
+# the ADF autolag search and the classifier fits grow faster than linearly,
+# so by default they see at most this many rows (0 = no cap)
+ADF_ROWS = 100000
+FIT_ROWS = 200000
+
+
+def synthetic_bars(n, seed=0, start=4000., freq='4h'):
+    """Random-walk OHLC bars shaped like the ES history."""
+    rng = np.random.default_rng(seed)
+    close = start * np.cumprod(1 + rng.normal(0, 0.003, n))
+    open_ = np.concatenate(([start], close[:-1])) * (1 + rng.normal(0, 0.0005, n))
+    spread = np.abs(rng.normal(0, 0.002, n)) * close
+    return pd.DataFrame({
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+    }, index=pd.date_range('2000-01-01', periods=n, freq=freq))
+
+
+def _cap(n, rows):
+    return slice(-rows, None) if rows and n > rows else slice(None)
+
+
+# Each stage reads what the previous ones left in ctx and adds its output.
+
+def stage_heikin_ashi(ctx):
+    ctx['hadf'] = heikin_ashi(ctx['bars'])
+
+
+def stage_features(ctx):
+    store = FeatureStore.from_prices(ctx['hadf']['open'].to_numpy(), ctx['bars'].index)
+    ctx['data'] = store.frame()
+
+
+def stage_adf(ctx):
+    from .stationarity import adf
+
+    series = ctx['data']['hadf_log_return']
+    adf(series.iloc[_cap(len(series), ctx['adf_rows'])].to_numpy(), autolag='AIC')
+
+
+def stage_fit(ctx):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+
+    data = ctx['data'].iloc[_cap(len(ctx['data']), ctx['fit_rows'])]
+    X, y = data[['open_hadf', 'EMA_5']].to_numpy(), data['direction'].to_numpy()
+    ctx['logistic'] = LogisticRegression().fit(X, y)
+    ctx['random_forest'] = RandomForestClassifier(
+        max_depth=900, max_samples=min(2000, len(X)), n_estimators=50).fit(X, y)
+
+
+def stage_predict(ctx):
+    X = ctx['data'][['open_hadf', 'EMA_5']].to_numpy()
+    ctx['ml_predict'] = ctx['logistic'].predict(X)
+    ctx['random_forest'].predict(X)
+
+
+def stage_signals(ctx):
+    data = ctx['data']
+    long = (data['EMA_1'] > data['EMA_5']).astype(np.int8)
+    signal = long.diff().shift(1)
+    momentum = momentum_signal(signal, data['direction'])
+    ctx['final_signal'] = final_signal(momentum, ctx['ml_predict'])
+
+
+def stage_backtest(ctx):
+    from .crossover import crossover_masks, trade_records
+
+    px = ctx['data']['open_hadf'].to_numpy()
+    above, below = crossover_masks(px, 1, 5)
+    for entries, exits in ((above, below), (below, above)):
+        trade_records(px, entries, exits)
+
+
+def stage_backtest_vectorbt(ctx):
+    import vectorbt as vbt
+
+    px = ctx['data']['open_hadf']
+    fast_ma = vbt.MA.run(px, 1, short_name='fast')
+    slow_ma = vbt.MA.run(px, 5, short_name='slow')
+    above = fast_ma.ma_crossed_above(slow_ma)
+    below = fast_ma.ma_crossed_below(slow_ma)
+    for entries, exits in ((above, below), (below, above)):
+        pf = vbt.Portfolio.from_signals(px, entries, exits, init_cash=100000., size=1)
+        pf.trades.records
+
+
+STAGES = [
+    ('heikin_ashi', stage_heikin_ashi),
+    ('features', stage_features),
+    ('adf', stage_adf),
+    ('fit', stage_fit),
+    ('predict', stage_predict),
+    ('signals', stage_signals),
+    ('backtest', stage_backtest),
+    ('backtest_vectorbt', stage_backtest_vectorbt),
+]
+
+
+def _measure(func, ctx, repeat):
+    # timed runs without tracemalloc (it slows allocation-heavy code down),
+    # then one traced run for the peak
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func(ctx)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func(ctx)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
+
+
+def warm_up(stages, seed=0):
+    """Run the stages once on a small history so imports and numba
+    compilation are not charged to the first timed size."""
+    ctx = {'bars': synthetic_bars(1000, seed), 'adf_rows': 0, 'fit_rows': 0}
+    for _, func in stages:
+        func(ctx)
+
+
+def run(sizes=DEFAULT_SIZES, stages=None, repeat=1, seed=0, adf_rows=ADF_ROWS,
+        fit_rows=FIT_ROWS, warm=True):
+    """Run the selected stages (all by default) at each size.
+
+    Stages always execute in pipeline order; ones that are not selected
+    still run once (untimed) when a later selected stage needs their output.
+    Returns a list of result dicts.
+    """
+    names = [name for name, _ in STAGES]
+    selected = set(stages or names)
+    unknown = selected - set(names)
+    if unknown:
+        raise ValueError('unknown stages: %s' % sorted(unknown))
+    last = max(names.index(s) for s in selected)
+    if warm:
+        warm_up(STAGES[:last + 1], seed)
+
+    results = []
+    for n in sizes:
+        ctx = {'bars': synthetic_bars(n, seed), 'adf_rows': adf_rows, 'fit_rows': fit_rows}
+        for name, func in STAGES[:last + 1]:
+            if name not in selected:
+                func(ctx)
+                continue
+            seconds, peak = _measure(func, ctx, repeat)
+            results.append({'stage': name, 'n_bars': n, 'seconds': seconds,
+                            'peak_mb': peak / 2 ** 20,
+                            'bars_per_sec': n / seconds if seconds else float('inf')})
+    return results
+
+
+# FillModels the engines are compared under (FillModel arguments)
+PARITY_FILLS = {
+    'default': {},
+    'ticks_commission': dict(tick_size=0.25, commission=2.5),
+    'variable_slippage': dict(vol_slippage=0.05, volume_slippage=0.5),
+    'open_all': dict(tick_size=0.25, commission=2.5, vol_slippage=0.05, volume_slippage=0.5,
+                     price='open'),
+}
+
+
+def _mismatches(native, reference):
+    """Trades (rows) that differ in any field, NaN equal to NaN."""
+    native, reference = pd.DataFrame(native), pd.DataFrame(reference)
+    n = min(len(native), len(reference))
+    differ = np.zeros(n, dtype=bool)
+    for name in reference.columns:
+        a = native[name].to_numpy()[:n]
+        b = reference[name].to_numpy()[:n]
+        same = a == b
+        if a.dtype.kind == 'f':
+            same |= np.isnan(a) & np.isnan(b)
+        differ |= ~same
+    return int(differ.sum()) + abs(len(native) - len(reference))
+
+
+def check_parity(sizes=(5000,), seed=0, chunk_rows=1000):
+    """Trade-for-trade comparison of the native engines with vectorbt.
+
+    For every size: runner.backtest_instrument('native') and
+    chunked.backtest_chunked (streamed in blocks of chunk_rows) against the
+    'vectorbt' engine under each of PARITY_FILLS, and crossover.trade_records
+    against Portfolio.from_signals on random signals over a price series
+    with gaps (NaN) and too little cash for every order (partial fills).
+    Returns one row per case with the number of mismatching trades.
+    """
+    import dataclasses
+    import tempfile
+
+    import vectorbt as vbt
+
+    from .chunked import backtest_chunked
+    from .crossover import trade_records
+    from .datastore import BarStore
+    from .fills import FillModel
+    from .runner import ES, backtest_instrument
+
+    rows = []
+    for n in sizes:
+        bars = synthetic_bars(n, seed)
+        bars['volume'] = np.random.default_rng(seed).lognormal(7, 0.5, n)
+        with tempfile.TemporaryDirectory() as root:
+            store = BarStore(root)
+            store.save(bars, ES.symbol, ES.exchange, ES.interval, ES.fut_contract)
+            for name, kwargs in PARITY_FILLS.items():
+                spec = dataclasses.replace(ES, fills=FillModel(**kwargs))
+                reference = backtest_instrument(spec, bars, 'vectorbt')
+                native = backtest_instrument(spec, bars, 'native')
+                chunked = backtest_chunked(spec, store, chunk_rows=chunk_rows)[1]
+                for direction in ('long', 'short'):
+                    rows.append({'case': 'instrument/' + name, 'n_bars': n,
+                                 'direction': direction,
+                                 'trades': len(reference[direction]),
+                                 'mismatches': _mismatches(native[direction],
+                                                           reference[direction])})
+                    rows.append({'case': 'chunked/' + name, 'n_bars': n,
+                                 'direction': direction,
+                                 'trades': len(reference[direction]),
+                                 'mismatches': _mismatches(chunked[direction],
+                                                           reference[direction])})
+
+        rng = np.random.default_rng(seed)
+        px = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n)))
+        px[rng.random(n) < 0.01] = np.nan
+        entries = rng.random((n, 4)) < 0.05
+        exits = rng.random((n, 4)) < 0.05
+        # cash for one unit at the starting price: every order above it is
+        # sized down
+        native = trade_records(px, entries, exits, init_cash=100.)
+        reference = vbt.Portfolio.from_signals(px[:, np.newaxis], entries, exits,
+                                               init_cash=100., size=1.).trades.records
+        rows.append({'case': 'kernel/partial_fills_nan', 'n_bars': n, 'direction': 'long',
+                     'trades': len(reference), 'mismatches': _mismatches(native, reference)})
+    return pd.DataFrame(rows)
+
+
+def compare(results, baseline, tolerance=0.25, min_delta=0.005):
+    """Join results with a baseline on (stage, n_bars).
+
+    A row is flagged as a regression when it got slower by more than
+    tolerance (a fraction) and by more than min_delta seconds, so timer
+    noise on millisecond stages is not reported.
+    """
+    cur = pd.DataFrame(results).set_index(['stage', 'n_bars'])
+    base = pd.DataFrame(baseline).set_index(['stage', 'n_bars'])
+    both = cur[['seconds', 'peak_mb']].join(base[['seconds', 'peak_mb']], rsuffix='_baseline',
+                                            how='inner')
+    both['ratio'] = both['seconds'] / both['seconds_baseline']
+    both['regression'] = ((both['ratio'] > 1 + tolerance)
+                          & (both['seconds'] - both['seconds_baseline'] > min_delta))
+    return both.reset_index()
+
+
+def _environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'machine': platform.machine(),
+            'timestamp': datetime.now().isoformat()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Time every pipeline stage on synthetic bars and compare the results '
+                    'with a stored baseline.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES)
+    parser.add_argument('--stages', nargs='+', choices=[name for name, _ in STAGES])
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--adf-rows', type=int, default=ADF_ROWS)
+    parser.add_argument('--fit-rows', type=int, default=FIT_ROWS)
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--baseline', help='results file to compare against')
+    parser.add_argument('--save-baseline', help='also write the results here')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--min-delta', type=float, default=0.005)
+    parser.add_argument('--parity', action='store_true',
+                        help='check the native backtests against vectorbt instead of timing')
+    args = parser.parse_args(argv)
+
+    if args.parity:
+        report = check_parity(args.sizes, args.seed)
+        print(report.to_string(index=False))
+        return 1 if report['mismatches'].any() else 0
+
+    results = run(args.sizes, args.stages, args.repeat, args.seed, args.adf_rows,
+                  args.fit_rows)
+    payload = {'environment': _environment(), 'results': results}
+    for path in filter(None, [args.out, args.save_baseline]):
+        with open(path, 'w') as f:
+            json.dump(payload, f, indent=2)
+    print(pd.DataFrame(results).to_string(index=False))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        report = compare(results, baseline, args.tolerance, args.min_delta)
+        print('')
+        print(report.to_string(index=False))
+        if report['regression'].any():
+            print('')
+            print('REGRESSIONS:', ', '.join('%s@%d' % (r.stage, r.n_bars)
+                                            for r in report[report['regression']].itertuples()))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
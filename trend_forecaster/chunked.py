@@ -0,0 +1,391 @@
+# Out-of-core backtests
+#
+#   rows, trades = backtest_chunked(ES_1M, store)              # crossover
+#   rows, trades = backtest_chunked(ES_1M, store, model=clf)   # final_signal
+#
+# backtest_instrument() holds the whole history, its Heikin-Ashi frame, the
+# indicator frames and two vectorbt portfolios in memory, which caps it at a
+# few thousand bars per call. Here bars are streamed from the BarStore in
+# blocks (BarStore.iter_chunks) and everything that depends on earlier bars is
+# carried from one block to the next as a few numbers:
+#
+#   Heikin-Ashi      the previous HA open and close
+#   rolling means    vectorbt's running sum and the last `window` partial sums
+#   crossovers       whether the fast MA was above / has been below the slow one
+#   EMAs             the lfilter state (final_signal mode)
+#   positions        cash, size, entry bar and price of the open position
+#
+# Indicators are computed per block with the same arithmetic as vectorbt
+# (MA.run, ma_crossed_above / below, Portfolio.from_signals with size=1 and
+# no fees), so the trade records match the in-memory path exactly (checked
+# by `python -m trend_forecaster.bench --parity`). Only the bars of entry /
+# exit signals go through Python, and closed trades are appended to the
+# trade log as they happen; a position still open after the last block is
+# reported like vectorbt's open trade (status 0). The spec's
+# FillModel is applied to the finished records (fills.fill_trades), with the
+# bar-dependent slippage of each entry / exit kept next to the position.
+
+import math
+
+import numpy as np
+
+from .datastore import CHUNK_ROWS
+from .features import FEATURES
+from .heikin_ashi import OHLC, heikin_ashi_arrays
+from .instrument import stage
+from .signals import UP, DOWN, encode_labels, final_signal, momentum_signal
+
+TRADE_FIELDS = [('id', np.int64), ('col', np.int64), ('size', np.float64),
+                ('entry_idx', np.int64), ('entry_price', np.float64),
+                ('entry_fees', np.float64), ('exit_idx', np.int64),
+                ('exit_price', np.float64), ('exit_fees', np.float64),
+                ('pnl', np.float64), ('return', np.float64), ('direction', np.int64),
+                ('status', np.int64), ('parent_id', np.int64)]
+
+# vectorbt's float tolerances (vectorbt.utils.math_)
+REL_TOL = 1e-9
+ABS_TOL = 1e-12
+# smallest order from_signals fills (settings.portfolio['min_size'])
+MIN_SIZE = 1e-8
+
+
+def _is_close(a, b):
+    return a == b or abs(a - b) <= max(REL_TOL * max(abs(a), abs(b)), ABS_TOL)
+
+
+def _add(a, b):
+    """a + b, snapped to 0 when the two cancel out (vectorbt's add_nb)."""
+    return 0. if _is_close(a, -b) else a + b
+
+
+class HeikinAshiCarry:
+    """heikin_ashi_arrays() over consecutive blocks of one series."""
+
+    def __init__(self):
+        self.prev = None
+
+    def update(self, bars):
+        ha = heikin_ashi_arrays(*(bars[k].to_numpy(dtype=np.float64) for k in OHLC),
+                                prev=self.prev)
+        if len(ha[0]):
+            self.prev = (ha[0][-1], ha[3][-1])
+        return ha
+
+
+class RollingMean:
+    """vectorbt's rolling mean (minp = window) over consecutive blocks:
+    the running sum is never restarted, as in rolling_mean_1d_nb, so the
+    values are identical to one call on the whole series."""
+
+    def __init__(self, window):
+        self.window = window
+        self.seen = 0
+        self.cumsum = 0.
+        self.nancnt = 0
+        self.tail_sum = np.empty(0)              # running sums of the last
+        self.tail_nan = np.empty(0, np.int64)    # `window` values seen
+
+    def update(self, a):
+        w = self.window
+        isnan = np.isnan(a)
+        if not self.nancnt and not isnan.any():
+            return self._update_finite(a)
+        # cumsum is strictly sequential, so seeding it with the carried sum
+        # reproduces the single-pass accumulation
+        csum = np.cumsum(np.concatenate(([self.cumsum], np.where(isnan, 0., a))))[1:]
+        ncnt = self.nancnt + np.cumsum(isnan)
+        all_sum = np.concatenate((self.tail_sum, csum))
+        all_nan = np.concatenate((self.tail_nan, ncnt))
+
+        # rows from j0 on have a full window; their window starts are a slice
+        j0 = min(max(w - self.seen, 0), len(a))
+        back = slice(len(self.tail_sum) + j0 - w, len(self.tail_sum) + len(a) - w)
+        window_sum = csum.copy()
+        window_len = (self.seen + 1 + np.arange(len(a)) - ncnt).astype(np.float64)
+        window_sum[j0:] -= all_sum[back]
+        window_len[j0:] = w - (ncnt[j0:] - all_nan[back])
+        out = np.full(len(a), np.nan)
+        np.divide(window_sum, window_len, out=out, where=window_len >= w)
+
+        if len(a):
+            self.cumsum = csum[-1]
+            self.nancnt = int(ncnt[-1])
+            self.tail_sum = all_sum[-w:]
+            self.tail_nan = all_nan[-w:]
+        self.seen += len(a)
+        return out
+
+    def _update_finite(self, a):
+        # update() without NaN so far: every window holds `window` values
+        w = self.window
+        csum = np.cumsum(np.concatenate(([self.cumsum], a)))[1:]
+        all_sum = np.concatenate((self.tail_sum, csum))
+        j0 = min(max(w - self.seen, 0), len(a))
+        out = np.full(len(a), np.nan)
+        if 0 < j0 and self.seen + j0 == w:
+            out[j0 - 1] = csum[j0 - 1] / w   # the first full window
+        start = len(self.tail_sum) + j0 - w
+        np.divide(csum[j0:] - all_sum[start:start + len(a) - j0], w, out=out[j0:])
+
+        if len(a):
+            self.cumsum = csum[-1]
+            self.tail_sum = all_sum[-w:]
+            self.tail_nan = np.zeros(len(self.tail_sum), np.int64)
+        self.seen += len(a)
+        return out
+
+
+class Crossed:
+    """vectorbt's crossed_above(a, b) (wait=0) over consecutive blocks:
+    True where a goes above b after having been below it since the last
+    NaN."""
+
+    def __init__(self):
+        self.above = False
+        self.was_below = False
+
+    def update(self, a, b):
+        n = len(a)
+        if not n:
+            return np.zeros(0, dtype=bool)
+        nan = np.isnan(a) | np.isnan(b)
+        above = a > b
+        below = a < b
+        nan_at = np.flatnonzero(nan)
+        if not len(nan_at) or nan_at[-1] == len(nan_at) - 1:
+            # NaN only at the start of the block (the MA warm-up): below
+            # since then, or before the block when it has no NaN
+            k = len(nan_at)
+            was_below = np.zeros(n, dtype=bool)
+            if not k and self.was_below:
+                was_below[:] = True
+            elif below[k:].any():
+                was_below[k + np.argmax(below[k:]):] = True
+        else:
+            idx = np.arange(n)
+            last_below = np.maximum.accumulate(np.where(below, idx, -1))
+            last_nan = np.maximum.accumulate(np.where(nan, idx, -1))
+            was_below = np.where((last_below < 0) & (last_nan < 0), self.was_below,
+                                 last_below > last_nan)
+        prev_above = np.concatenate(([self.above], above[:-1]))
+        prev_below = np.concatenate(([self.was_below], was_below[:-1]))
+        self.above = bool(above[-1])
+        self.was_below = bool(was_below[-1])
+        return above & ~prev_above & prev_below
+
+
+class CrossoverSignals:
+    """runner.backtest_instrument's signals: fast / slow simple MAs of the
+    HA open, long entries on the cross above, exits on the cross below."""
+
+    skip = 0
+
+    def __init__(self, fast=1, slow=5):
+        self.ha = HeikinAshiCarry()
+        self.fast = RollingMean(fast)
+        self.slow = RollingMean(slow)
+        self.up = Crossed()
+        self.down = Crossed()
+
+    def update(self, bars):
+        """(price, entries, exits) of a block."""
+        px = self.ha.update(bars)[0]
+        fast, slow = self.fast.update(px), self.slow.update(px)
+        return px, self.up.update(fast, slow), self.down.update(slow, fast)
+
+
+class FinalSignals:
+    """The integrated model's final_signal (pipeline.integrate_signals) for
+    a fitted classifier: entries where it is 1, exits where it is -1, priced
+    at the HA open. Like build_features() the first bar has no features and
+    is skipped."""
+
+    skip = 1
+
+    def __init__(self, model, fast=1, slow=5):
+        self.model = model
+        self.ha = HeikinAshiCarry()
+        self.alphas = (2. / (fast + 1), 2. / (slow + 1))
+        self.ema_state = None
+        self.prev_open = None
+        self.long = []      # `long` of the last two rows
+
+    def _emas(self, x):
+        from scipy.signal import lfilter
+
+        if self.ema_state is None:
+            self.ema_state = [np.array([(1 - a) * x[0]]) for a in self.alphas]
+        out = []
+        for k, a in enumerate(self.alphas):
+            y, self.ema_state[k] = lfilter([a], [1., a - 1], x, zi=self.ema_state[k])
+            out.append(y)
+        return out
+
+    def update(self, bars):
+        import pandas as pd
+
+        ha_open = self.ha.update(bars)[0]
+        if not len(ha_open):
+            return ha_open, np.zeros(0, bool), np.zeros(0, bool)
+        ema_fast, ema_slow = self._emas(ha_open)
+        if self.prev_open is None:
+            prev, start = ha_open[:-1], 1
+        else:
+            prev, start = np.concatenate(([self.prev_open], ha_open[:-1])), 0
+        self.prev_open = ha_open[-1]
+        px, ema_fast, ema_slow = ha_open[start:], ema_fast[start:], ema_slow[start:]
+        if not len(px):
+            return px, np.zeros(0, bool), np.zeros(0, bool)
+
+        pct = np.divide(px, prev)
+        pct -= 1
+        direction = np.where(pct > 0, UP, DOWN).astype(np.int8)
+        # Signal = long.diff().shift(1): the change in `long` one row earlier
+        long = np.concatenate((self.long, ema_fast > ema_slow)).astype(np.int8)
+        signal = np.zeros(len(long), dtype=np.int8)
+        signal[2:] = long[1:-1] - long[:-2]
+        signal = signal[len(self.long):]
+        self.long = list(long[-2:])
+
+        X = pd.DataFrame({FEATURES[0]: px, FEATURES[1]: ema_slow}, copy=False)
+        final = final_signal(momentum_signal(signal, direction),
+                             encode_labels(self.model.predict(X)))
+        return px, final == 1, final == -1
+
+
+class TradeBook:
+    """Long-only Portfolio.from_signals(size=1, no fees) bookkeeping,
+    fed block by block; trade records are kept as they close."""
+
+    def __init__(self, init_cash=100000., size=1.):
+        self.cash = init_cash
+        self.order_size = size
+        self.size = 0.
+        self.entry_idx = self.entry_price = None
+        self.last_idx = self.last_price = None
+        self.trades = []
+        # variable slippage (fills.BarSlippage) at each trade's entry / exit
+        self.entry_cost = self.last_cost = 0.
+        self.costs = []
+
+    def update(self, px, entries, exits, offset=0, cost=None):
+        """Process one block whose first bar is bar `offset` of the series;
+        cost is the optional per-bar variable slippage of the block."""
+        # an entry and an exit on the same bar cancel out (upon_long_conflict='ignore')
+        for i in np.flatnonzero(entries ^ exits):
+            price = float(px[i])
+            if not price > 0 or not math.isfinite(price):
+                continue
+            if self.size == 0 and entries[i]:
+                if self._buy(price, offset + int(i)) and cost is not None:
+                    self.entry_cost = float(cost[i])
+            elif self.size > 0 and exits[i]:
+                self.costs.append((self.entry_cost, 0. if cost is None else float(cost[i])))
+                self._sell(price, offset + int(i))
+        if len(px):
+            # an open position is marked to the last bar, even without a price
+            self.last_idx = offset + len(px) - 1
+            self.last_price = float(px[-1])
+            self.last_cost = 0. if cost is None else float(cost[-1])
+
+    def _buy(self, price, idx):
+        req = self.order_size * price
+        if _is_close(req, self.cash) or req < self.cash:
+            size, spent = self.order_size, req
+        elif self.cash > 0:
+            size, spent = self.cash / price, self.cash   # partial fill
+            if size < MIN_SIZE and not _is_close(size, MIN_SIZE):
+                return False
+        else:
+            return False
+        self.cash = _add(self.cash, -spent)
+        # vectorbt's trade entry price is gross value / size
+        self.size, self.entry_idx, self.entry_price = size, idx, size * price / size
+        return True
+
+    def _sell(self, price, idx):
+        self.cash = _add(self.cash, self.size * price)
+        self.trades.append(self._trade(idx, price, status=1))
+        self.size = 0.
+
+    def _trade(self, idx, price, status):
+        entry_val = self.size * self.entry_price
+        pnl = _add(self.size * price, -entry_val)
+        n = len(self.trades)
+        return (n, 0, self.size, self.entry_idx, self.entry_price, 0., idx, price, 0.,
+                pnl, pnl / entry_val, 0, status, n)
+
+    def record_array(self):
+        """Trade records in vectorbt's layout (structured array), including
+        the open position marked to the last price."""
+        trades = self.trades
+        if self.size > 0:
+            trades = trades + [self._trade(self.last_idx, self.last_price, status=0)]
+        return np.array(trades, dtype=TRADE_FIELDS)
+
+    def records(self):
+        """record_array() as a DataFrame, like Portfolio.trades.records."""
+        import pandas as pd
+
+        return pd.DataFrame(self.record_array())
+
+    def trade_costs(self):
+        """(entry, exit) variable slippage per record of record_array()."""
+        costs = self.costs
+        if self.size > 0:
+            costs = costs + [(self.entry_cost, self.last_cost)]
+        costs = np.array(costs, dtype=np.float64).reshape(-1, 2)
+        return costs[:, 0], costs[:, 1]
+
+
+def backtest_chunked(spec, store, model=None, chunk_rows=CHUNK_ROWS, init_cash=100000.,
+                     size=1.):
+    """Backtest a contract's whole stored history block by block.
+
+    Without a model this is runner.backtest_instrument's MA crossover; with
+    a fitted direction classifier, trades follow its final_signal. The
+    history is read from the store (spec.n_bars is ignored), so nothing but
+    one block of bars is in memory at a time. Returns (summary rows,
+    {'long': trade log, 'short': trade log}) like runner.run_instrument.
+    """
+    from .fills import BarSlippage, FillModel, fill_trades
+    from .runner import summary_rows
+
+    if spec.base_interval is not None:
+        raise ValueError('chunked backtests read stored bars; resample %s into the store '
+                         'first' % spec.name)
+    signals = (CrossoverSignals(spec.fast, spec.slow) if model is None
+               else FinalSignals(model, spec.fast, spec.slow))
+    fills = spec.fills or FillModel()
+    bar_cost = BarSlippage(fills) if fills.variable else None
+    books = {'long': TradeBook(init_cash, size), 'short': TradeBook(init_cash, size)}
+    n = 0
+    first_open = last_open = None
+    with stage('backtest', instrument=spec.name, chunked=True) as st:
+        for bars in store.iter_chunks(spec.symbol, spec.exchange, spec.interval,
+                                      fut_contract=spec.fut_contract, chunk_rows=chunk_rows):
+            if not len(bars):
+                continue
+            px, entries, exits = signals.update(bars)
+            offset = max(n - signals.skip, 0)
+            fill_px = fills.prices(px, bars)
+            cost = None
+            if bar_cost is not None:
+                cost = bar_cost.update(bars)[len(bars) - len(px):]
+            books['long'].update(fill_px, entries, exits, offset, cost)
+            books['short'].update(fill_px, exits, entries, offset, cost)
+            if first_open is None:
+                first_open = float(bars['open'].iloc[0])
+            last_open = float(bars['open'].iloc[-1])
+            n += len(bars)
+        trades = {}
+        for direction, slippage in (('long', spec.slippage_long),
+                                    ('short', spec.slippage_short)):
+            book = books[direction]
+            extra = book.trade_costs() if bar_cost is not None else None
+            trades[direction] = fill_trades(book.records(), fills, direction, slippage,
+                                            extra, spec.point_value)
+        st.record(bars=n, trades=sum(len(t) for t in trades.values()))
+    if not n:
+        raise LookupError('no stored bars for %s' % spec.name)
+    return summary_rows(spec, n, last_open - first_open, trades), trades
@@ -0,0 +1,231 @@
+"""Command line entry point (installed as `trend-forecaster`).
+
+    trend-forecaster pipeline --csv fixtures/ --report report/
+    trend-forecaster pipeline --csv fixtures/ --stage-cache stage_cache --stage-cache-mb 2048
+    trend-forecaster backtest --csv fixtures/ --out results.csv
+    trend-forecaster backtest --csv fixtures/ --significance 10000
+    trend-forecaster stationarity ES GE --window 1000 --kpss --cache-file adf.jsonl
+    trend-forecaster live bars.csv --model logistic
+    trend-forecaster bench --sizes 5000 100000
+
+Bars come from a directory of CSV fixtures (--csv, see datastore.CsvSource)
+or, without it, from TradingView through tvDatafeed, and are cached in
+--cache. Each command imports only what it needs, so `live` starts without
+pandas, scikit-learn (for linear models in the registry), vectorbt or
+matplotlib.
+"""
+
+import argparse
+import sys
+
+
+def _store(args):
+    from .datastore import BarStore, CsvSource
+
+    if args.csv:
+        source = CsvSource(args.csv)
+    elif args.offline:
+        source = None
+    else:
+        from tvDatafeed import TvDatafeed
+        source = TvDatafeed()
+    return BarStore(args.cache, source=source)
+
+
+def _specs(names):
+    from . import runner
+
+    return [getattr(runner, name) for name in names]
+
+
+def cmd_pipeline(args):
+    from .pipeline import run_pipeline
+    from .registry import ModelRegistry
+    from .reporting import Report
+
+    report = None
+    if args.report:
+        report = Report(args.report, plots=False if args.no_plots else None)
+    registry = ModelRegistry(args.registry) if args.registry else None
+    cache = None
+    if args.stage_cache:
+        from .stagecache import StageCache
+
+        max_bytes = int(args.stage_cache_mb * (1 << 20)) if args.stage_cache_mb else None
+        cache = StageCache(args.stage_cache, max_bytes=max_bytes)
+    spec, = _specs([args.instrument])
+    result = run_pipeline(spec, _store(args), _specs(args.backtest), registry=registry,
+                          report=report, seed=args.seed, refresh=not args.offline,
+                          max_workers=args.workers, cache=cache)
+    print(result['results'].to_string(index=False))
+    for name, acc in result['accuracy'].items():
+        print('%s accuracy: %.4f' % (name, acc))
+    if report is not None:
+        print(report.write(args.workers))
+
+
+def cmd_backtest(args):
+    if args.chunked:
+        import pandas as pd
+
+        from .chunked import backtest_chunked
+        from .runner import RESULT_COLUMNS
+
+        store = _store(args)
+        rows = [row for spec in _specs(args.instruments)
+                for row in backtest_chunked(spec, store, chunk_rows=args.chunked)[0]]
+        results = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    else:
+        from .runner import run_universe
+
+        results, trades = run_universe(_specs(args.instruments), _store(args),
+                                       max_workers=args.workers, refresh=not args.offline,
+                                       with_trades=True)
+    print(results.to_string(index=False))
+    if args.out:
+        results.to_csv(args.out, index=False)
+    if args.significance:
+        _print_significance(args, trades)
+
+
+def _print_significance(args, trades):
+    import pandas as pd
+
+    from .fills import FillModel
+    from .heikin_ashi import heikin_ashi
+    from .significance import significance
+
+    store = _store(args)
+    tables = []
+    for spec in _specs(args.instruments):
+        bars = spec.fetch(store, refresh=False)
+        ha_open = pd.to_numeric(heikin_ashi(bars)['open'], errors='coerce').to_numpy()
+        # the prices the trades were filled at, before slippage and ticks
+        px = (spec.fills or FillModel()).prices(ha_open, bars)
+        for direction in ('long', 'short'):
+            # buy-and-hold of the raw open, as in the results table above
+            table = significance(trades[spec.name, direction], px, spec.point_value,
+                                 direction, n_resamples=args.significance,
+                                 n_jobs=args.workers or -1,
+                                 benchmark_px=bars['open'].to_numpy(dtype=float))
+            table.insert(0, 'direction', direction)
+            table.insert(0, 'instrument', spec.name)
+            tables.append(table)
+    with pd.option_context('display.width', 200):
+        print(pd.concat(tables, ignore_index=True).to_string(index=False))
+
+
+def cmd_stationarity(args):
+    import pandas as pd
+
+    from .pipeline import build_features
+    from .stationarity import ResultCache, screen
+
+    store = _store(args)
+    series = {spec.name: build_features(spec.fetch(store, not args.offline))[args.column]
+              for spec in _specs(args.instruments)}
+    results = screen(series, args.window, args.step, kpss=args.kpss, n_jobs=args.workers or -1,
+                     cache=ResultCache(args.cache_file))
+    with pd.option_context('display.width', 200):
+        print(results.to_string(index=False))
+    if args.out:
+        results.to_csv(args.out, index=False)
+
+
+def cmd_live(args):
+    import asyncio
+
+    from .live import LiveSignal, LiveSignalService, replay_csv
+    from .registry import ModelRegistry
+
+    entry = ModelRegistry(args.registry).load(args.model, args.version)
+    service = LiveSignalService(entry)
+
+    async def main():
+        queue = asyncio.Queue()
+        producer = asyncio.ensure_future(replay_csv(args.bars, queue, args.delay))
+        n = await service.run(queue, lambda sig: print(','.join(map(str, sig))))
+        await producer
+        return n
+
+    print(','.join(LiveSignal._fields))
+    asyncio.run(main())
+
+
+def _data_args(parser):
+    parser.add_argument('--csv', help='directory of CSV bar fixtures (default: TradingView)')
+    parser.add_argument('--cache', default='bar_cache', help='bar cache directory')
+    parser.add_argument('--offline', action='store_true',
+                        help='use the cached bars only, fetch nothing')
+    parser.add_argument('--workers', type=int, help='worker processes')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='trend-forecaster',
+                                     description='Heikin-Ashi momentum / ML trend model')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+
+    p = sub.add_parser('pipeline', help='train, integrate signals, backtest and report')
+    _data_args(p)
+    p.add_argument('--instrument', default='ES', help='spec the classifiers train on')
+    p.add_argument('--backtest', nargs='+', default=['ES', 'GE'], help='specs to backtest')
+    p.add_argument('--registry', default='model_registry', help="'' to skip saving models")
+    p.add_argument('--report', default='report', help="'' to skip the report")
+    p.add_argument('--no-plots', action='store_true')
+    p.add_argument('--seed', type=int)
+    p.add_argument('--stage-cache', help='directory of cached stage outputs reused across runs')
+    p.add_argument('--stage-cache-mb', type=float, metavar='MB',
+                   help='evict least recently used stages beyond this size')
+    p.set_defaults(func=cmd_pipeline)
+
+    p = sub.add_parser('backtest', help='backtest instrument specs (runner.ES, runner.GE, ...)')
+    _data_args(p)
+    p.add_argument('instruments', nargs='*', default=['ES', 'GE'])
+    p.add_argument('--out', help='write the results table to this CSV file')
+    p.add_argument('--chunked', type=int, metavar='ROWS',
+                   help='backtest the whole cached history, streamed in blocks of ROWS bars')
+    p.add_argument('--significance', type=int, metavar='N',
+                   help='bootstrap / random-entry significance with N resamples '
+                        '(not with --chunked)')
+    p.set_defaults(func=cmd_backtest)
+
+    p = sub.add_parser('stationarity', help='ADF / KPSS screen of instrument returns')
+    _data_args(p)
+    p.add_argument('instruments', nargs='*', default=['ES', 'GE'])
+    p.add_argument('--column', default='hadf_log_return', help='build_features() column tested')
+    p.add_argument('--window', type=int, help='rolling window length (default: whole series)')
+    p.add_argument('--step', type=int, help='bars between windows (default: window)')
+    p.add_argument('--kpss', action='store_true', help='run the KPSS test too')
+    p.add_argument('--cache-file', help='JSON-lines result cache reused across runs')
+    p.add_argument('--out', help='write the results table to this CSV file')
+    p.set_defaults(func=cmd_stationarity)
+
+    p = sub.add_parser('live', help='replay CSV bars through the live signal service')
+    p.add_argument('bars', help='CSV with datetime, open, high, low, close columns')
+    p.add_argument('--registry', default='model_registry')
+    p.add_argument('--model', default='logistic')
+    p.add_argument('--version', type=int)
+    p.add_argument('--delay', type=float, default=0., help='seconds between bars')
+    p.set_defaults(func=cmd_live)
+
+    # listed for --help only; main() hands its arguments to bench.main unparsed
+    sub.add_parser('bench', help='offline benchmarks (see trend_forecaster.bench)', add_help=False)
+    return parser
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ['bench']:
+        from .bench import main as bench_main
+        return bench_main(argv[1:])
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, 'chunked', None) and getattr(args, 'significance', None):
+        # the resamples need the whole price series in memory
+        parser.error('--significance cannot be combined with --chunked')
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
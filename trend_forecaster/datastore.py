@@ -0,0 +1,258 @@
+# Local bar store in front of TvDatafeed.get_hist
+#
+# Fetched OHLCV is persisted per (symbol, exchange, interval, contract) as an
+# Arrow/Feather file (memory-mapped on read) or Parquet. Later requests are
+# served from disk and a refresh only asks the source for the missing tail.
+#
+# A "source" is anything with TvDatafeed's get_hist() signature, so the
+# TvDatafeed object itself can be passed in directly, or CsvSource can stand
+# in for it to run the pipeline offline.
+#
+# Histories too long to hold in memory (years of minute bars) are written
+# with save_chunks() and read back block by block with iter_chunks(); only
+# the record batches being read are decompressed.
+
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .instrument import stage
+
+BAR_COLUMNS = ['symbol', 'open', 'high', 'low', 'close', 'volume']
+CHUNK_ROWS = 1 << 20
+
+# Interval values as used by tvDatafeed.Interval
+INTERVAL_LENGTHS = {
+    '1': timedelta(minutes=1),
+    '3': timedelta(minutes=3),
+    '5': timedelta(minutes=5),
+    '15': timedelta(minutes=15),
+    '30': timedelta(minutes=30),
+    '45': timedelta(minutes=45),
+    '1H': timedelta(hours=1),
+    '2H': timedelta(hours=2),
+    '3H': timedelta(hours=3),
+    '4H': timedelta(hours=4),
+    '1D': timedelta(days=1),
+    '1W': timedelta(weeks=1),
+    '1M': timedelta(days=31),
+}
+
+
+def interval_name(interval):
+    """'4H' for Interval.in_4_hour, or the string itself."""
+    return str(getattr(interval, 'value', interval))
+
+
+def as_interval(interval):
+    """tvDatafeed.Interval for a string such as '4H' when tvDatafeed is
+    installed (TvDatafeed.get_hist only accepts the enum)."""
+    if not isinstance(interval, str):
+        return interval
+    try:
+        from tvDatafeed import Interval
+    except ImportError:
+        return interval
+    return Interval(interval)
+
+
+class CsvSource:
+    """Offline stand-in for TvDatafeed that reads CSV fixtures.
+
+    Files are looked up as <directory>/<symbol>_<exchange>_<interval>_<contract>.csv
+    (falling back to <symbol>_<exchange>_<interval>.csv) with a datetime
+    first column and open/high/low/close[/volume] columns.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, symbol, exchange, interval, fut_contract=None):
+        stem = '%s_%s_%s' % (symbol, exchange, interval_name(interval))
+        if fut_contract is not None:
+            path = os.path.join(self.directory, '%s_%s.csv' % (stem, fut_contract))
+            if os.path.exists(path):
+                return path
+        return os.path.join(self.directory, stem + '.csv')
+
+    def get_hist(self, symbol, exchange, interval, n_bars=10, fut_contract=None):
+        df = pd.read_csv(self.path(symbol, exchange, interval, fut_contract),
+                         index_col=0, parse_dates=True)
+        df.index.name = 'datetime'
+        if 'symbol' not in df:
+            df.insert(0, 'symbol', '%s:%s' % (exchange, symbol))
+        if 'volume' not in df:
+            df['volume'] = np.nan
+        return df[BAR_COLUMNS].sort_index().iloc[-n_bars:]
+
+
+class BarStore:
+    """Disk cache of OHLCV bars with the same get_hist() call as TvDatafeed."""
+
+    def __init__(self, root, source=None, fmt='feather'):
+        if fmt not in ('feather', 'parquet'):
+            raise ValueError("fmt must be 'feather' or 'parquet'")
+        self.root = root
+        self.source = source
+        self.fmt = fmt
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, symbol, exchange, interval, fut_contract=None):
+        contract = 'spot' if fut_contract is None else 'c%s' % fut_contract
+        name = '%s_%s_%s_%s.%s' % (symbol, exchange, interval_name(interval),
+                                   contract, self.fmt)
+        return os.path.join(self.root, name)
+
+    def load(self, symbol, exchange, interval, fut_contract=None):
+        """Cached bars for a key, or None if nothing is stored yet."""
+        path = self.path(symbol, exchange, interval, fut_contract)
+        if not os.path.exists(path):
+            return None
+        if self.fmt == 'feather':
+            from pyarrow import feather
+            table = feather.read_table(path, memory_map=True)
+        else:
+            import pyarrow.parquet as pq
+            table = pq.read_table(path, memory_map=True)
+        return table.to_pandas().set_index('datetime')
+
+    def save(self, df, symbol, exchange, interval, fut_contract=None):
+        path = self.path(symbol, exchange, interval, fut_contract)
+        tmp = path + '.tmp'
+        out = df.reset_index()
+        out = out.rename(columns={out.columns[0]: 'datetime'})
+        if self.fmt == 'feather':
+            out.to_feather(tmp)
+        else:
+            out.to_parquet(tmp, index=False)
+        os.replace(tmp, path)  # readers never see a half-written file
+
+    def save_chunks(self, chunks, symbol, exchange, interval, fut_contract=None):
+        """Write an iterable of sorted bar frames as one stored history
+        without concatenating them in memory. Returns the number of bars."""
+        import pyarrow as pa
+
+        path = self.path(symbol, exchange, interval, fut_contract)
+        tmp = path + '.tmp'
+        writer = None
+        n = 0
+        try:
+            for df in chunks:
+                out = df.reset_index()
+                out = out.rename(columns={out.columns[0]: 'datetime'})
+                table = pa.Table.from_pandas(out, preserve_index=False)
+                if writer is None:
+                    writer = self._chunk_writer(tmp, table.schema)
+                writer.write_table(table)
+                n += len(df)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            raise ValueError('no bars to save')
+        os.replace(tmp, path)
+        return n
+
+    def _chunk_writer(self, path, schema):
+        if self.fmt == 'feather':
+            import pyarrow as pa
+            return pa.ipc.new_file(path, schema, options=pa.ipc.IpcWriteOptions(
+                compression='lz4'))
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(path, schema)
+
+    def iter_chunks(self, symbol, exchange, interval, fut_contract=None,
+                    chunk_rows=CHUNK_ROWS):
+        """Stored bars of a key as consecutive frames of about chunk_rows
+        bars (whole record batches, so a chunk can be somewhat larger)."""
+        path = self.path(symbol, exchange, interval, fut_contract)
+        if not os.path.exists(path):
+            raise LookupError('no cached bars for %s' % ((symbol, exchange, interval,
+                                                          fut_contract),))
+        pending, size = [], 0
+        for batch in self._iter_batches(path, chunk_rows):
+            pending.append(batch)
+            size += batch.num_rows
+            if size >= chunk_rows:
+                yield self._batches_frame(pending)
+                pending, size = [], 0
+        if pending:
+            yield self._batches_frame(pending)
+
+    def _iter_batches(self, path, chunk_rows):
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            yield from pq.ParquetFile(path, memory_map=True).iter_batches(chunk_rows)
+            return
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+    @staticmethod
+    def _batches_frame(batches):
+        import pyarrow as pa
+        return pa.Table.from_batches(batches).to_pandas().set_index('datetime')
+
+    def missing_bars(self, cached, interval, now=None):
+        """Rough number of bars printed since the last cached one.
+
+        Session gaps make this an overestimate, which is fine: the overlap
+        is de-duplicated when merging.
+        """
+        length = INTERVAL_LENGTHS.get(interval_name(interval))
+        if length is None:
+            return None
+        now = now or datetime.now()
+        last = cached.index[-1]
+        if getattr(last, 'tzinfo', None) is not None:
+            last = last.tz_localize(None)
+        return max(int((now - last) / length) + 2, 2)
+
+    def get_hist(self, symbol, exchange, interval, n_bars=10, fut_contract=None,
+                 refresh=True):
+        """Return the last n_bars for a key.
+
+        With refresh=False the cache is served as is (no source needed).
+        Otherwise only the bars after the cached tail are fetched; the full
+        history is fetched when the cache is empty or too short.
+        """
+        with stage('fetch', symbol=symbol, exchange=exchange,
+                   interval=interval_name(interval), refresh=refresh) as st:
+            df = self._get_hist(symbol, exchange, interval, n_bars, fut_contract, refresh)
+            st.record(df)
+        return df
+
+    def _get_hist(self, symbol, exchange, interval, n_bars, fut_contract, refresh):
+        key = (symbol, exchange, interval, fut_contract)
+        cached = self.load(*key)
+
+        if cached is not None and not refresh:
+            return cached.iloc[-n_bars:]
+        if self.source is None:
+            if cached is None:
+                raise LookupError('no cached bars for %s and no source' % (key,))
+            return cached.iloc[-n_bars:]
+
+        missing = None if cached is None else self.missing_bars(cached, interval)
+        if cached is None or missing is None or len(cached) + missing < n_bars:
+            missing = n_bars
+        df = self.source.get_hist(symbol=symbol, exchange=exchange,
+                                  interval=as_interval(interval), n_bars=missing,
+                                  fut_contract=fut_contract)
+        if cached is not None and df is not None:
+            # the last cached bar may still have been forming, so fresh rows win
+            df = pd.concat([cached, df])
+            df = df[~df.index.duplicated(keep='last')].sort_index()
+
+        if df is None or not len(df):
+            if cached is None:
+                raise LookupError('source returned no bars for %s' % (key,))
+            return cached.iloc[-n_bars:]
+
+        df.index.name = 'datetime'
+        self.save(df, *key)
+        return df.iloc[-n_bars:]
@@ -0,0 +1,125 @@
+# Feature store for the script's base columns
+#
+# The script kept re-copying data_open (momentum_backtest_data, data_copy,
+# opens, live_px_data, fin_mod, simX_test / simY_test, ...) and dropping
+# columns to get back to the two model features. FeatureStore computes the
+# base columns once into a single Fortran-ordered float64 block - every
+# column contiguous - and hands out views of it: 1-D columns, the
+# (n, 2) [open_hadf, EMA_5] model matrix (the two columns sit next to each
+# other, so it is a slice, not a gather) and DataFrames built on those views.
+# Nothing downstream copies the data unless it writes to it. That relies on
+# pandas 3's Copy-on-Write (hence pandas>=3 in pyproject.toml): on pandas 2
+# the DataFrames would be built on copies.
+#
+# Rows follow the script's dropna(): the first bar (no pct change) is not
+# stored.
+
+import numpy as np
+
+from .heikin_ashi import heikin_ashi_arrays
+from .instrument import stage
+from .signals import direction
+
+FEATURES = ['open_hadf', 'EMA_5']
+BASE_COLUMNS = ['open', 'EMA_1', 'open_hadf', 'EMA_5', 'hadf_pct_change', 'hadf_log_return']
+
+
+def ewm(x, span, axis=0):
+    """ewm(span, adjust=False).mean() of x along axis (linear filter)."""
+    from scipy.signal import lfilter
+
+    alpha = 2. / (span + 1)
+    zi = (1 - alpha) * np.take(x, [0], axis=axis)
+    return lfilter([alpha], [1., alpha - 1], x, axis=axis, zi=zi)[0]
+
+
+def fill_base_columns(col, open_hadf, open=None, spans=(1, 5), start=1):
+    """Write the BASE_COLUMNS of bars start, start + 1, ... into the column
+    views of col (a dict name -> 1-D array); start >= 1."""
+    if open is not None:
+        col['open'][:] = np.asarray(open, dtype=np.float64)[start:]
+    col['open_hadf'][:] = open_hadf[start:]
+    col['EMA_1'][:] = ewm(open_hadf, spans[0])[start:]
+    col['EMA_5'][:] = ewm(open_hadf, spans[1])[start:]
+    np.divide(open_hadf[start:], open_hadf[start - 1:-1], out=col['hadf_pct_change'])
+    col['hadf_pct_change'] -= 1
+    np.log(1 + col['hadf_pct_change'], out=col['hadf_log_return'])
+
+
+class FeatureStore:
+    """Base feature columns held once in contiguous float64 arrays.
+
+    values is an (n, len(columns)) Fortran-ordered block; direction the
+    int8 label (signals.UP / DOWN) of every row. Use from_bars() or
+    from_prices() rather than the constructor.
+    """
+
+    def __init__(self, values, columns, direction, index=None):
+        self.values = values
+        self.columns = list(columns)
+        self.direction = direction
+        self.index = index
+        self._position = {c: i for i, c in enumerate(self.columns)}
+
+    @classmethod
+    def from_prices(cls, open_hadf, index=None, open=None, spans=(1, 5)):
+        """Store built from the Heikin-Ashi open (and optionally the raw
+        open) of every bar; e.g. a simulated path."""
+        open_hadf = np.asarray(open_hadf, dtype=np.float64)
+        columns = [c for c in BASE_COLUMNS if c != 'open' or open is not None]
+        n = len(open_hadf) - 1
+        values = np.empty((max(n, 0), len(columns)), order='F')
+        if n > 0:
+            fill_base_columns(dict(zip(columns, values.T)), open_hadf, open, spans)
+        if index is not None:
+            index = index[1:]
+        return cls(values, columns, direction(values[:, columns.index('hadf_pct_change')]),
+                   index)
+
+    @classmethod
+    def from_bars(cls, bars, spans=(1, 5)):
+        """Store for an OHLC DataFrame (Heikin-Ashi conversion included)."""
+        with stage('features') as st:
+            ha_open = heikin_ashi_arrays(bars['open'].to_numpy(), bars['high'].to_numpy(),
+                                         bars['low'].to_numpy(), bars['close'].to_numpy())[0]
+            store = cls.from_prices(ha_open, bars.index, bars['open'].to_numpy(), spans)
+            st.record(store.values)
+        return store
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, name):
+        return self.column(name)
+
+    def column(self, name):
+        """1-D view of one column ('direction' included)."""
+        if name == 'direction':
+            return self.direction
+        return self.values[:, self._position[name]]
+
+    def matrix(self, names=FEATURES):
+        """2-D view of adjacent columns (the model features by default);
+        other selections are gathered into a new array."""
+        pos = [self._position[n] for n in names]
+        if pos == list(range(pos[0], pos[0] + len(pos))):
+            return self.values[:, pos[0]:pos[0] + len(pos)]
+        return self.values[:, pos]
+
+    def frame(self, names=None):
+        """DataFrame over views of the given columns (default: all of them
+        and direction), indexed like the bars."""
+        import pandas as pd
+
+        names = self.columns + ['direction'] if names is None else list(names)
+        # one float block (so X.to_numpy() is still a view) plus the int8 labels
+        block = pd.DataFrame(self.values, index=self.index, columns=self.columns, copy=False)
+        frames = [block[[n for n in names if n != 'direction']]]
+        if 'direction' in names:
+            frames.append(pd.DataFrame({'direction': self.direction}, index=self.index,
+                                       copy=False))
+        return pd.concat(frames, axis=1)[names]
+
+    def features(self):
+        """The model's (X, y): FEATURES as a DataFrame view and direction."""
+        return self.frame(FEATURES), self.direction
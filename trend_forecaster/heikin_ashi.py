@@ -0,0 +1,135 @@
+# Heikin-Ashi candle conversion
+#
+# The HA open is a first-order linear recursion on the HA close:
+#
+#     ha_open[0] = open[0]
+#     ha_open[i] = (ha_open[i-1] + ha_close[i-1]) / 2
+#
+# so instead of filling it row by row we run it as a linear filter
+# (scipy.signal.lfilter, compiled C) over float64 arrays. Halving is exact in
+# floating point, so the output matches the original loop bit for bit.
+
+import numpy as np
+
+from .instrument import stage
+
+OHLC = ['open', 'high', 'low', 'close']
+
+
+def heikin_ashi_open(open_, high, low, close, prev=None):
+    """(HA open, HA close) of heikin_ashi_arrays(), without the high / low."""
+    from scipy.signal import lfilter
+
+    open_ = np.asarray(open_, dtype=np.float64)
+    ha_close = (open_ + np.asarray(high, dtype=np.float64) + np.asarray(low, dtype=np.float64)
+                + np.asarray(close, dtype=np.float64)) / 4
+    ha_open = np.empty_like(ha_close)
+    if len(ha_close) == 0:
+        return ha_open, ha_close
+
+    # y[n] = 0.5 * x[n] + 0.5 * y[n-1] with y[-1] = open[0] gives ha_open[n+1]
+    ha_open[0] = open_[0] if prev is None else 0.5 * prev[0] + 0.5 * prev[1]
+    zi = (0.5 * ha_open[0])[np.newaxis, ...]
+    ha_open[1:], _ = lfilter([0.5], [1.0, -0.5], ha_close[:-1], axis=0, zi=zi)
+    return ha_open, ha_close
+
+
+def heikin_ashi_arrays(open_, high, low, close, prev=None):
+    """Heikin-Ashi (open, high, low, close) for raw OHLC arrays.
+
+    Inputs may be 1-D (one series) or 2-D with time along axis 0 and one
+    column per symbol. prev is the (HA open, HA close) of the bar before
+    the first one, to continue a series chunk by chunk. Returns four float64
+    arrays of the same shape.
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    ha_open, ha_close = heikin_ashi_open(open_, high, low, close, prev)
+    if len(ha_close) == 0:
+        return ha_open, ha_open.copy(), ha_open.copy(), ha_close
+
+    # fmax/fmin skip NaNs the same way DataFrame.max(axis=1) does
+    ha_high = np.fmax(np.fmax(ha_open, ha_close), high)
+    ha_low = np.fmin(np.fmin(ha_open, ha_close), low)
+    return ha_open, ha_high, ha_low, ha_close
+
+
+def heikin_ashi(df):
+    """Convert a DataFrame of OHLC candles to Heikin-Ashi candles."""
+    import pandas as pd
+
+    with stage('heikin_ashi') as st:
+        ha = heikin_ashi_arrays(df['open'].to_numpy(), df['high'].to_numpy(),
+                                df['low'].to_numpy(), df['close'].to_numpy())
+        out = pd.DataFrame(dict(zip(OHLC, ha)), index=df.index.values)
+        st.record(out)
+    return out
+
+
+def heikin_ashi_many(frames):
+    """Convert several OHLC frames (a dict of symbol -> DataFrame) at once.
+
+    The histories are left-aligned into one NaN-padded 2-D block and run
+    through a single filter call. Padding only ever sits after the real bars,
+    so it never leaks into them. Returns a dict of symbol -> HA DataFrame.
+    """
+    import pandas as pd
+
+    symbols = list(frames)
+    if not symbols:
+        return {}
+    lengths = [len(frames[s]) for s in symbols]
+    block = np.full((4, max(lengths), len(symbols)), np.nan)
+    for j, s in enumerate(symbols):
+        block[:, :lengths[j], j] = frames[s][OHLC].to_numpy(dtype=np.float64).T
+
+    ha = heikin_ashi_arrays(*block)
+
+    out = {}
+    for j, s in enumerate(symbols):
+        cols = {name: arr[:lengths[j], j] for name, arr in zip(OHLC, ha)}
+        out[s] = pd.DataFrame(cols, index=frames[s].index.values)
+    return out
+
+
+class HeikinAshiStream:
+    """Incremental Heikin-Ashi conversion for live bars.
+
+    Only the previous HA open and close are kept, so each update() is O(1)
+    regardless of how much history came before it.
+    """
+
+    def __init__(self):
+        self.prev_open = None
+        self.prev_close = None
+
+    @classmethod
+    def from_history(cls, df):
+        """Seed the stream from a raw OHLC history so that the next update()
+        continues it exactly."""
+        stream = cls()
+        if len(df):
+            ha = heikin_ashi(df)
+            stream.prev_open = float(ha['open'].iloc[-1])
+            stream.prev_close = float(ha['close'].iloc[-1])
+        return stream
+
+    def update(self, bar):
+        """Feed one raw bar (a mapping with open/high/low/close, or an
+        (open, high, low, close) tuple) and return the HA bar as a tuple."""
+        if isinstance(bar, (tuple, list)):
+            o, h, l, c = bar
+        else:
+            o, h, l, c = bar['open'], bar['high'], bar['low'], bar['close']
+
+        ha_close = (o + h + l + c) / 4
+        if self.prev_open is None:
+            ha_open = float(o)
+        else:
+            ha_open = (self.prev_open + self.prev_close) / 2
+        ha_high = np.fmax(np.fmax(ha_open, ha_close), h)
+        ha_low = np.fmin(np.fmin(ha_open, ha_close), l)
+
+        self.prev_open = ha_open
+        self.prev_close = ha_close
+        return ha_open, float(ha_high), float(ha_low), float(ha_close)
@@ -0,0 +1,242 @@
+# Stage-level instrumentation
+#
+#   with instrument.stage('heikin_ashi') as st:
+#       hadf = ...
+#       st.record(hadf)          # row count and memory footprint
+#
+# Each stage emits one structured event (a dict) with its wall time, row
+# count, DataFrame memory, the number of DataFrame/Series copies made while
+# it ran and, on request, a cProfile summary and tracemalloc peak. Events go
+# to every registered sink (the in-memory log by default, see add_sink and
+# JsonLinesSink).
+#
+# Instrumentation is off unless enable() is called or TRENDFC_INSTRUMENT=1 is
+# set (worker processes inherit the variable). When off, stage() returns a
+# shared no-op context manager, so the cost is one attribute check. pandas is
+# only imported once copy counting or summary() needs it.
+
+import functools
+import io
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+ENV_VAR = 'TRENDFC_INSTRUMENT'
+
+
+class _State:
+    enabled = False
+    profile = False
+    trace_memory = False
+    sinks = []
+    events = []
+    copies = 0
+    active_profile = False
+    memory_stack = []   # open trace_memory stages, innermost last
+    lock = threading.Lock()
+    patched = {}
+
+
+_state = _State()
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def record(self, obj=None, **fields):
+        pass
+
+
+_NULL = _NullStage()
+
+
+def _count_copies(original):
+    def copy(self, *args, **kwargs):
+        _state.copies += 1
+        return original(self, *args, **kwargs)
+    copy.__wrapped__ = original
+    return copy
+
+
+def _patch_copies():
+    import pandas as pd
+    for cls in (pd.DataFrame, pd.Series):
+        if cls not in _state.patched:
+            _state.patched[cls] = cls.copy
+            cls.copy = _count_copies(cls.copy)
+
+
+def _unpatch_copies():
+    for cls, original in _state.patched.items():
+        cls.copy = original
+    _state.patched.clear()
+
+
+def enable(profile=False, trace_memory=False, count_copies=True):
+    """Turn instrumentation on. profile / trace_memory switch on cProfile and
+    tracemalloc capture for every stage (they can also be asked for per
+    stage)."""
+    _state.enabled = True
+    _state.profile = profile
+    _state.trace_memory = trace_memory
+    if count_copies:
+        _patch_copies()
+
+
+def disable():
+    _state.enabled = False
+    _unpatch_copies()
+
+
+def is_enabled():
+    return _state.enabled
+
+
+def add_sink(sink):
+    """Register a callable that receives every event dict."""
+    _state.sinks.append(sink)
+
+
+def events():
+    """Events collected in memory since the last reset()."""
+    return list(_state.events)
+
+
+def reset():
+    del _state.events[:]
+
+
+def summary():
+    """Collected events as a DataFrame (one row per stage run)."""
+    import pandas as pd
+
+    cols = ['stage', 'seconds', 'rows', 'memory_bytes', 'copies', 'peak_bytes', 'pid']
+    df = pd.DataFrame(_state.events)
+    return df[[c for c in cols if c in df]] if len(df) else pd.DataFrame(columns=cols)
+
+
+def emit(event):
+    with _state.lock:
+        _state.events.append(event)
+    for sink in _state.sinks:
+        sink(event)
+
+
+class JsonLinesSink:
+    """Append events to a JSON-lines file."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, event):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(event, default=str) + '\n')
+
+
+def _footprint(obj):
+    pd = sys.modules.get('pandas')
+    if pd is not None and isinstance(obj, (pd.DataFrame, pd.Series)):
+        mem = obj.memory_usage(deep=True)
+        return len(obj), int(mem.sum() if isinstance(obj, pd.DataFrame) else mem)
+    nbytes = getattr(obj, 'nbytes', None)
+    return (len(obj) if hasattr(obj, '__len__') else None), nbytes
+
+
+class Stage:
+    def __init__(self, name, profile, trace_memory, fields):
+        self.name = name
+        self.event = {'event': 'stage', 'stage': name, 'pid': os.getpid()}
+        self.event.update(fields)
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.profiler = None
+        self.started_tracing = False
+        self.peak = 0       # peak traced memory before the last reset_peak()
+
+    def record(self, obj=None, **fields):
+        """Attach the row count / memory of obj and any extra fields."""
+        if obj is not None:
+            rows, nbytes = _footprint(obj)
+            self.event['rows'] = rows
+            self.event['memory_bytes'] = nbytes
+        self.event.update(fields)
+
+    def __enter__(self):
+        # only one profiler can run at a time, so nested stages are not profiled
+        if self.profile and not _state.active_profile:
+            import cProfile
+            self.profiler = cProfile.Profile()
+            _state.active_profile = True
+            self.profiler.enable()
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started_tracing = True
+            # resetting the peak for this stage must not lose the enclosing
+            # stage's peak so far
+            stack = _state.memory_stack
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            stack.append(self)
+        self.copies = _state.copies
+        self.t0 = time.perf_counter()
+        self.event['start'] = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.event['seconds'] = time.perf_counter() - self.t0
+        self.event['copies'] = _state.copies - self.copies
+        if self.trace_memory:
+            peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            self.event['peak_bytes'] = peak
+            stack = _state.memory_stack
+            if self in stack:
+                stack.remove(self)
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, peak)
+            if self.started_tracing:
+                tracemalloc.stop()
+        if self.profiler is not None:
+            import pstats
+            self.profiler.disable()
+            _state.active_profile = False
+            out = io.StringIO()
+            pstats.Stats(self.profiler, stream=out).sort_stats('cumulative').print_stats(20)
+            self.event['profile'] = out.getvalue()
+        if exc_type is not None:
+            self.event['error'] = repr(exc)
+        emit(self.event)
+        return False
+
+
+def stage(name, profile=None, trace_memory=None, **fields):
+    """Context manager timing one pipeline stage (a no-op when disabled)."""
+    if not _state.enabled:
+        return _NULL
+    return Stage(name, _state.profile if profile is None else profile,
+                 _state.trace_memory if trace_memory is None else trace_memory, fields)
+
+
+def instrumented(name):
+    """Decorator running a function inside stage(name)."""
+    def wrap(func):
+        @functools.wraps(func)
+        def inner(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with stage(name):
+                return func(*args, **kwargs)
+        return inner
+    return wrap
+
+
+if os.environ.get(ENV_VAR, '').lower() in ('1', 'true', 'yes', 'profile'):
+    enable(profile=os.environ[ENV_VAR].lower() == 'profile')
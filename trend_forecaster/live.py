@@ -0,0 +1,272 @@
+# Incremental live-signal service
+#
+# Produces the script's momentum_signal, ml_predict and final_signal for one
+# new bar at a time. All state is a handful of floats (Heikin-Ashi open and
+# close, the two EMAs, the previous HA open and the last two `long` flags),
+# so each update is O(1) and allocates no DataFrame:
+#
+#   open_hadf      HA open of the bar (HeikinAshiStream)
+#   EMA_1, EMA_5   ewm(span, adjust=False) of open_hadf
+#   direction      UP (1) if open_hadf rose versus the previous bar, else DOWN (-1);
+#                  0 (no label, so flat signals) on the first bar, which batch drops
+#   Signal         long.diff().shift(1), long = EMA_1 > EMA_5
+#   momentum       signals.AGREE[Signal, direction]
+#   final_signal   signals.AGREE[momentum, ml_predict]
+#
+# Labels and signals use the int8 codes of trend_forecaster.signals; a
+# classifier trained on 'UP'/'DOWN' strings is mapped onto them.
+
+import asyncio
+import csv
+import os
+from collections import namedtuple
+
+import numpy as np
+
+from .heikin_ashi import HeikinAshiStream, heikin_ashi
+from .signals import AGREE_ROWS, DOWN, UP, encode_label
+
+LiveSignal = namedtuple('LiveSignal', ['time', 'open_hadf', 'EMA_1', 'EMA_5', 'direction',
+                                       'momentum_signal', 'ml_predict', 'final_signal'])
+
+
+class LinearPredictor:
+    """predict() for a fitted binary linear classifier (e.g. the study's
+    LogisticRegression) on one row, without sklearn's per-call validation."""
+
+    def __init__(self, model):
+        self.coef = [float(c) for c in np.ravel(model.coef_)]
+        self.intercept = float(np.ravel(model.intercept_)[0])
+        self.classes = list(model.classes_)
+
+    @classmethod
+    def from_params(cls, coef, intercept, classes):
+        self = cls.__new__(cls)
+        self.coef = [float(c) for c in coef]
+        self.intercept = float(intercept)
+        self.classes = list(classes)
+        return self
+
+    def __call__(self, row):
+        score = self.intercept
+        for c, x in zip(self.coef, row):
+            score += c * x
+        return self.classes[1] if score > 0 else self.classes[0]
+
+
+TREE_ARRAYS = ('roots', 'left', 'right', 'feature', 'threshold', 'missing_left', 'value',
+               'classes')
+
+
+class TreePredictor:
+    """predict() for a fitted decision tree or forest classifier from its
+    node arrays alone.
+
+    The nodes of all trees are concatenated into one set of arrays (child
+    indices global, roots[k] the first node of tree k, value the normalised
+    class proportions), which save() writes as .npy files and load() maps
+    read-only. Rows are compared as float32 and probabilities summed tree
+    by tree as sklearn does, so the predictions are the estimator's.
+    """
+
+    def __init__(self, arrays):
+        for name in TREE_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    @staticmethod
+    def supports(model):
+        trees = getattr(model, 'estimators_', None)
+        trees = [model] if trees is None else list(trees)
+        return (len(getattr(model, 'classes_', ())) > 0 and getattr(model, 'n_outputs_', 1) == 1
+                and all(hasattr(t, 'tree_') for t in trees))
+
+    @classmethod
+    def from_model(cls, model):
+        trees = [t.tree_ for t in getattr(model, 'estimators_', [model])]
+        sizes = np.array([t.node_count for t in trees])
+        roots = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        left, right, missing = [], [], []
+        for tree, root in zip(trees, roots):
+            leaf = tree.children_left < 0
+            left.append(np.where(leaf, -1, tree.children_left + root))
+            right.append(np.where(leaf, -1, tree.children_right + root))
+            missing.append(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, bool)))
+        value = np.concatenate([t.value[:, 0, :] for t in trees])
+        total = value.sum(axis=1, keepdims=True)
+        total[total == 0] = 1.
+        return cls({
+            'roots': roots.astype(np.intp),
+            'left': np.concatenate(left).astype(np.intp),
+            'right': np.concatenate(right).astype(np.intp),
+            'feature': np.concatenate([t.feature for t in trees]).astype(np.intp),
+            'threshold': np.concatenate([t.threshold for t in trees]),
+            'missing_left': np.concatenate(missing).astype(bool),
+            'value': value / total,
+            # object labels ('UP' / 'DOWN') as a fixed-width array np.load can map
+            'classes': np.asarray(model.classes_.tolist()),
+        })
+
+    def save(self, path):
+        for name in TREE_ARRAYS:
+            np.save(os.path.join(path, 'tree_%s.npy' % name), getattr(self, name))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        return cls({name: np.load(os.path.join(path, 'tree_%s.npy' % name),
+                                  mmap_mode='r' if mmap else None)
+                    for name in TREE_ARRAYS})
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(len(X))
+        node = np.repeat(np.asarray(self.roots)[:, np.newaxis], len(X), axis=1)
+        while True:
+            left = self.left[node]
+            inner = left >= 0
+            if not inner.any():
+                break
+            x = X[rows, np.where(inner, self.feature[node], 0)]
+            go_left = np.where(np.isnan(x), self.missing_left[node], x <= self.threshold[node])
+            node = np.where(inner, np.where(go_left, left, self.right[node]), node)
+        value = self.value
+        proba = np.zeros((len(X), value.shape[1]))
+        for tree_nodes in node:
+            proba += value[tree_nodes]
+        return proba / len(node)
+
+    def predict(self, X):
+        return np.asarray(self.classes)[np.argmax(self.predict_proba(X), axis=1)]
+
+    def __call__(self, row):
+        return self.predict([row])[0]
+
+
+def fast_predictor(model):
+    """One-row predict function for a fitted classifier (or a registry
+    entry, see registry.RegisteredModel)."""
+    if hasattr(model, 'predictor'):
+        return model.predictor()
+    coef = getattr(model, 'coef_', None)
+    if coef is not None and len(getattr(model, 'classes_', ())) == 2:
+        return LinearPredictor(model)
+    names = getattr(model, 'feature_names_in_', None)
+    if names is None:
+        return lambda row: model.predict(np.asarray([row], dtype=np.float64))[0]
+    import pandas as pd
+    return lambda row: model.predict(pd.DataFrame([row], columns=names))[0]
+
+
+class LiveSignalService:
+    """Stateful per-bar signal generator around a fitted direction classifier.
+
+    The classifier is called on [open_hadf, EMA_5], as in the script.
+    """
+
+    def __init__(self, model, fast=1, slow=5):
+        self.model = model
+        self.predict = fast_predictor(model)
+        self.alpha_fast = 2. / (fast + 1)
+        self.alpha_slow = 2. / (slow + 1)
+        self.ha = HeikinAshiStream()
+        self.ema_fast = None
+        self.ema_slow = None
+        self.prev_open_hadf = None
+        self.long_1 = None   # long flag of the previous bar
+        self.long_2 = None   # and of the one before it
+
+    @classmethod
+    def from_history(cls, bars, model, fast=1, slow=5):
+        """Service whose state continues an OHLC history (vectorized warm-up)."""
+        service = cls(model, fast, slow)
+        if not len(bars):
+            return service
+        ha = heikin_ashi(bars)
+        open_hadf = ha['open']
+        ema_fast = open_hadf.ewm(span=fast, adjust=False).mean().to_numpy()
+        ema_slow = open_hadf.ewm(span=slow, adjust=False).mean().to_numpy()
+        long = ema_fast > ema_slow
+
+        service.ha.prev_open = float(ha['open'].iloc[-1])
+        service.ha.prev_close = float(ha['close'].iloc[-1])
+        service.ema_fast = float(ema_fast[-1])
+        service.ema_slow = float(ema_slow[-1])
+        service.prev_open_hadf = float(open_hadf.iloc[-1])
+        service.long_1 = bool(long[-1])
+        service.long_2 = bool(long[-2]) if len(long) > 1 else None
+        return service
+
+    def update(self, bar, time=None):
+        """Consume one raw OHLC bar and return its LiveSignal."""
+        open_hadf = self.ha.update(bar)[0]
+
+        if self.ema_fast is None:
+            self.ema_fast = self.ema_slow = open_hadf
+        else:
+            self.ema_fast += self.alpha_fast * (open_hadf - self.ema_fast)
+            self.ema_slow += self.alpha_slow * (open_hadf - self.ema_slow)
+
+        # the first bar has no pct change (the script drops it with dropna()):
+        # no label, so its momentum and final signals are flat
+        if self.prev_open_hadf is None:
+            direction = 0
+        else:
+            direction = UP if open_hadf > self.prev_open_hadf else DOWN
+
+        # Signal of this bar is the change in `long` one bar earlier
+        signal = 0
+        if self.long_1 is not None and self.long_2 is not None:
+            signal = int(self.long_1) - int(self.long_2)
+        momentum = AGREE_ROWS[signal + 1][direction + 1]
+
+        ml = encode_label(self.predict((open_hadf, self.ema_slow)))
+        final = AGREE_ROWS[momentum + 1][ml + 1]
+
+        self.long_2 = self.long_1
+        self.long_1 = self.ema_fast > self.ema_slow
+        self.prev_open_hadf = open_hadf
+        return LiveSignal(time, open_hadf, self.ema_fast, self.ema_slow, direction,
+                          momentum, ml, final)
+
+    async def run(self, bars, on_signal=None):
+        """Consume bars from an asyncio.Queue (None ends the stream) or an
+        async iterable, calling on_signal (sync or async) with each result.
+        Returns the number of bars processed."""
+        n = 0
+        async for bar in _iterate(bars):
+            sig = self.update(bar, bar.get('datetime') if isinstance(bar, dict) else None)
+            n += 1
+            if on_signal is not None:
+                res = on_signal(sig)
+                if asyncio.iscoroutine(res):
+                    await res
+        return n
+
+
+async def _iterate(bars):
+    if isinstance(bars, asyncio.Queue):
+        while True:
+            bar = await bars.get()
+            if bar is None:
+                return
+            yield bar
+    else:
+        async for bar in bars:
+            yield bar
+
+
+async def replay_csv(path, queue, delay=0.):
+    """Feed bars from a CSV file (datetime, open, high, low, close columns)
+    into a queue, optionally sleeping delay seconds between bars, then put
+    the None end marker."""
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = [h.strip().lower() for h in next(reader)]
+        header[0] = 'datetime'
+        cols = [header.index(k) for k in ('open', 'high', 'low', 'close')]
+        for row in reader:
+            await queue.put({'datetime': row[0], 'open': float(row[cols[0]]),
+                             'high': float(row[cols[1]]), 'low': float(row[cols[2]]),
+                             'close': float(row[cols[3]])})
+            if delay:
+                await asyncio.sleep(delay)
+    await queue.put(None)
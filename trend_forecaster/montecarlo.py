@@ -0,0 +1,127 @@
+# Monte Carlo evaluation of the direction classifiers
+#
+# Instead of one 5000-step path, N x T price paths are generated per call
+# from a seeded np.random.Generator, their features (EMA_5, pct change,
+# direction) are computed for all paths at once along axis 1, and every
+# model scores all rows of a chunk in one predict() call. The result is a
+# distribution of per-path accuracies. Paths are produced and scored in
+# chunks so memory stays bounded by chunk_size x n_steps, each chunk with
+# its own child seed. Given a shared.SharedPool the chunks are scored in its
+# workers, which read the returns by handle; a seed gives the same result
+# with or without a pool.
+
+import numpy as np
+import pandas as pd
+
+from .features import ewm
+from .instrument import instrumented
+from .signals import direction, encode_labels
+
+METHODS = ('normal', 'bootstrap', 'block')
+
+
+def simulate_returns(returns, n_paths, n_steps, method='normal', block_size=20, rng=None):
+    """(n_paths, n_steps) matrix of simulated per-step returns.
+
+    'normal' draws from N(mean, std) of the given returns (as the script
+    does), 'bootstrap' resamples them i.i.d. and 'block' resamples
+    contiguous blocks of block_size steps, keeping short-range dependence.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    returns = np.asarray(returns, dtype=np.float64)
+    returns = returns[~np.isnan(returns)]
+
+    if method == 'normal':
+        return rng.normal(returns.mean(), returns.std(ddof=1), (n_paths, n_steps))
+    if method == 'bootstrap':
+        return returns[rng.integers(0, len(returns), (n_paths, n_steps))]
+    if method == 'block':
+        block_size = min(block_size, len(returns))
+        n_blocks = -(-n_steps // block_size)
+        starts = rng.integers(0, len(returns) - block_size + 1, (n_paths, n_blocks))
+        idx = (starts[:, :, np.newaxis] + np.arange(block_size)).reshape(n_paths, -1)
+        return returns[idx[:, :n_steps]]
+    raise ValueError('method must be one of %s' % (METHODS,))
+
+
+def simulate_paths(returns, initial, n_paths, n_steps, method='normal', block_size=20,
+                   rng=None):
+    """(n_paths, n_steps) simulated price paths starting from initial."""
+    sim = simulate_returns(returns, n_paths, n_steps, method, block_size, rng)
+    return initial * np.cumprod(sim + 1, axis=1)
+
+
+def ewm_rows(x, span):
+    """ewm(span, adjust=False).mean() along axis 1 of a path matrix."""
+    return ewm(x, span, axis=1)
+
+
+def path_features(paths, span=5):
+    """Features and labels for every path, as in the script's `simulation`.
+
+    Returns (X, y): X is (n_paths, n_steps - 1, 2) holding open_hadf and
+    EMA_5, y the int8 direction code (signals.UP / DOWN). The first step
+    has no pct change and is dropped (the script's dropna()).
+    """
+    ema = ewm_rows(paths, span)
+    pct = paths[:, 1:] / paths[:, :-1] - 1
+    X = np.stack([paths[:, 1:], ema[:, 1:]], axis=-1)
+    y = direction(pct)
+    return X, y
+
+
+def score_paths(models, X, y):
+    """Per-path accuracy of each model, one predict() call per model."""
+    n_paths, n_steps = y.shape
+    rows = X.reshape(-1, X.shape[-1])
+    labels = y.ravel()
+    out = {}
+    for name, model in models.items():
+        names = getattr(model, 'feature_names_in_', None)
+        # models fitted on a DataFrame expect one (wrapping is copy-free)
+        data = rows if names is None else pd.DataFrame(rows, columns=names, copy=False)
+        # models trained on 'UP'/'DOWN' strings are compared on the codes
+        pred = encode_labels(model.predict(data))
+        out[name] = (pred == labels).reshape(n_paths, n_steps).mean(axis=1)
+    return out
+
+
+def _score_chunk(models, returns, initial, n, n_steps, method, block_size, seed, span):
+    rng = np.random.default_rng(seed)
+    paths = simulate_paths(returns, initial, n, n_steps, method, block_size, rng)
+    X, y = path_features(paths, span)
+    return score_paths(models, X, y)
+
+
+@instrumented('simulation')
+def monte_carlo_accuracy(models, returns, initial, n_paths=1000, n_steps=5000,
+                         method='normal', block_size=20, chunk_size=100, seed=None,
+                         span=5, pool=None):
+    """Accuracy distribution of fitted classifiers over simulated paths.
+
+    models maps a name to a fitted estimator taking [open_hadf, EMA_5].
+    pool, a shared.SharedPool, scores the chunks in its workers. Returns a
+    DataFrame with one row per path and one column per model.
+    """
+    if isinstance(models, dict):
+        models = dict(models)
+    else:
+        models = {'model': models}
+    sizes = [min(chunk_size, n_paths - start) for start in range(0, n_paths, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    if pool is None:
+        results = [_score_chunk(models, returns, initial, n, n_steps, method, block_size, s,
+                                span) for n, s in zip(sizes, seeds)]
+    else:
+        data = pool.publish(np.asarray(returns, dtype=np.float64))
+        futures = []
+        try:
+            futures = [pool.submit(_score_chunk, models, data, initial, n, n_steps, method,
+                                   block_size, s, span) for n, s in zip(sizes, seeds)]
+            results = [f.result() for f in futures]
+        finally:
+            for f in futures:
+                f.cancel()
+            pool.release(data)
+    return pd.DataFrame({name: np.concatenate([r[name] for r in results]) for name in models})
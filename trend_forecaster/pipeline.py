@@ -0,0 +1,173 @@
+# The integrated model as a library call
+#
+#   result = run_pipeline(ES, BarStore('bar_cache', source=CsvSource('fixtures')))
+#
+# Same sequence as fyp_integrated_model_main.py - Heikin-Ashi, EMA features,
+# direction classifiers, momentum / ML signal integration, backtests and the
+# report - without the notebook's printing, so a worker can import it and the
+# command line (`trend-forecaster pipeline`) can run it. scikit-learn,
+# vectorbt and matplotlib are imported inside the steps that use them.
+#
+# With a stagecache.StageCache the features, the fitted classifiers, the
+# integrated signals, the backtests and the stationarity screen are read
+# back from disk unless their inputs, parameters or code changed, so a rerun
+# after editing e.g. integrate_signals or the report recomputes only that
+# stage and what follows it.
+
+import importlib
+
+import numpy as np
+
+from .features import FEATURES, FeatureStore
+from .instrument import stage
+from .signals import decode_labels, encode_labels, final_signal, momentum_signal
+from .stagecache import code_hash, fingerprint
+from .stationarity import screen
+
+# modules whose code each cached stage runs, next to the stage function
+STAGE_MODULES = {
+    'features': ('features', 'heikin_ashi', 'signals'),
+    'training': ('walkforward',),
+    'signal_integration': ('signals',),
+    'backtest': ('runner', 'analytics', 'chunked', 'crossover', 'fills', 'heikin_ashi',
+                 'portfolio'),
+    'stationarity': ('stationarity',),
+}
+
+
+def build_features(bars):
+    """The script's data_open frame: HA open, raw open, EMA_1 / EMA_5 of the
+    HA open, its pct and log returns and the int8 direction label (views of
+    a FeatureStore)."""
+    return FeatureStore.from_bars(bars).frame()
+
+
+def train_classifiers(data, estimators=None, test_size=0.25, seed=None, features=FEATURES):
+    """Fit the study's classifiers on a shuffled train/test split of data's
+    features columns (e.g. TechnicalConfig().features on a
+    technical_features() frame).
+
+    Returns (models, split) where split is (X_train, X_test, y_train, y_test).
+    The estimators passed in are cloned, not fitted.
+    """
+    from sklearn.base import clone
+    from sklearn.model_selection import train_test_split
+
+    from .walkforward import default_estimators
+
+    split = train_test_split(data[list(features)], data['direction'], test_size=test_size,
+                             random_state=seed)
+    X_train, _, y_train, _ = split
+    models = {}
+    for name, est in (estimators or default_estimators()).items():
+        est = clone(est)
+        if getattr(est, 'max_samples', None):
+            est.set_params(max_samples=min(est.max_samples, len(X_train)))
+        with stage('training', model=name):
+            models[name] = est.fit(X_train, y_train)
+    return models, split
+
+
+def integrate_signals(data, model):
+    """The script's final_data: momentum_signal, ml_predict and final_signal
+    next to open_hadf / open / EMA_5."""
+    with stage('signal_integration'):
+        long = (data['EMA_1'] > data['EMA_5']).astype(np.int8)
+        signal = long.diff().shift(1)
+        momentum = momentum_signal(signal, data['direction'])
+    with stage('prediction'):
+        ml = encode_labels(model.predict(data[FEATURES]))
+    with stage('signal_integration'):
+        out = data[['open_hadf', 'open', 'EMA_5']]
+        out['momentum_signal'] = momentum
+        out['ml_predict'] = ml
+        out['final_signal'] = final_signal(momentum, ml)
+    return out
+
+
+def _cached(cache, name, func, *args, params=None, inputs=(), **kwargs):
+    """(key, func(*args, **kwargs)), through cache when there is one."""
+    if cache is None:
+        return None, func(*args, **kwargs)
+    modules = [importlib.import_module('.' + m, __package__) for m in STAGE_MODULES[name]]
+    return cache.run(name, func, *args, params=params, inputs=inputs,
+                     code=code_hash(func, *modules), **kwargs)
+
+
+def _backtest(specs, store, max_workers):
+    from .runner import run_universe
+    from .shared import SharedPool
+
+    # the contracts' bars go to the workers by handle (max_workers=1: in-process)
+    with SharedPool(max_workers) as pool:
+        return run_universe(specs, store, refresh=False, with_trades=True, pool=pool)
+
+
+def _stationarity(data):
+    return screen(data[['hadf_pct_change', 'hadf_log_return']], kpss=True, n_jobs=1)
+
+
+def run_pipeline(spec, store, backtest_specs=None, registry=None, report=None,
+                 test_size=0.25, seed=None, refresh=True, max_workers=None, cache=None):
+    """Fetch, model, integrate and backtest one instrument.
+
+    spec is the InstrumentSpec the classifiers are trained on (the script
+    uses ES); backtest_specs are run through run_universe (default: spec
+    alone) on a shared.SharedPool of max_workers processes. Fitted models
+    are saved to registry and figures / stats added to report when those
+    are given. Returns a dict with the feature frame ('data'), the
+    integrated signals, the models, their test accuracy, the backtest
+    results and the trade logs keyed by (name, direction).
+    cache is a StageCache the stages are read from and written to (with
+    seed=None, a cached fit is reused rather than redrawn).
+    """
+    specs = backtest_specs or [spec]
+    bars = spec.fetch(store, refresh)
+    bars_key = fingerprint(bars) if cache is not None else None
+
+    data_key, data = _cached(cache, 'features', build_features, bars, inputs=[bars_key])
+    fit_key, (models, split) = _cached(cache, 'training', train_classifiers, data,
+                                       test_size=test_size, seed=seed,
+                                       params=dict(test_size=test_size, seed=seed,
+                                                   features=FEATURES),
+                                       inputs=[data_key])
+    X_train, X_test, y_train, y_test = split
+    accuracy = {name: model.score(X_test, y_test) for name, model in models.items()}
+    _, signals = _cached(cache, 'signal_integration', integrate_signals, data,
+                         models['logistic'], inputs=[data_key, fit_key])
+
+    if registry is not None:
+        for name, model in models.items():
+            registry.save(name, model, FEATURES, X_train.index.min(), X_train.index.max(),
+                          {'accuracy': accuracy[name]})
+
+    # the universe reads the bars cached by the fetches here
+    if refresh:
+        for other in specs:
+            if other != spec:
+                other.fetch(store, refresh=True)
+    inputs = ()
+    if cache is not None:
+        inputs = [bars_key if other == spec else fingerprint(other.fetch(store, refresh=False))
+                  for other in specs]
+    _, (results, trades) = _cached(cache, 'backtest', _backtest, specs, store, max_workers,
+                                   params=[repr(s) for s in specs], inputs=inputs)
+
+    if report is not None:
+        report.line('hadf_log_return', data['hadf_log_return'],
+                    title='Heikin-Ashi log returns', figsize=(16, 8))
+        for name, model in models.items():
+            report.confusion_matrix('%s_test' % name, decode_labels(y_test),
+                                    decode_labels(model.predict(X_test)),
+                                    title='%s | test data' % name)
+        report.add_stats('stationarity', _cached(cache, 'stationarity', _stationarity, data,
+                                                 inputs=[data_key])[1])
+        report.add_stats('accuracy', accuracy)
+        report.add_stats('backtest', results)
+        point_values = {s.name: s.point_value for s in specs}
+        for (name, side), log in trades.items():
+            report.trade_section('%s_%s' % (name.lower(), side), log, point_values[name],
+                                 '%s Trades | %s' % (side.upper(), name))
+
+    return {'data': data, 'signals': signals, 'models': models, 'accuracy': accuracy,
+            'results': results, 'trades': trades}
@@ -0,0 +1,196 @@
+# One account for both directions
+#
+#   trades, equity = simulate(px, above, below, mode='reverse', fills=ES.fills, bars=bars)
+#
+# The script backtests the long side (dmac_long_pf) and the short side
+# (dmac_short_pf, the mirrored long-only portfolio) as two unrelated
+# Portfolios and never adds them up. simulate() runs both from one set of
+# signals and reports them as one account:
+#
+#   independent      the script's two books (long on long_entries until
+#                    long_exits, short on short_entries until short_exits;
+#                    by default the mirror image), as two columns of one
+#                    crossover.trade_records call
+#   reverse          stop-and-reverse: a long entry closes any short and
+#                    goes long at the same bar and vice versa, so the
+#                    account holds one net position. Exits, if given, only
+#                    flatten their own side
+#
+# The position in reverse mode follows from the signals without a loop: it
+# is the side of the latest entry unless an exit of that side came after it.
+# Same-bar conflicts cancel out as in from_signals: an entry and an exit of
+# the same side first, then a long and a short entry; an entry next to the
+# opposite side's exit reverses.
+#
+# Both modes return one trade log (fills.fill_trades per side, `direction`
+# 0 long / 1 short as in vectorbt, in entry order) and the account equity
+# per bar in USD: starting cash plus realised pnl plus open positions marked
+# to the fill price, with every slippage / fee booked on the bar it is paid.
+# Futures are margined, so reverse mode does not limit positions by cash.
+
+import numpy as np
+
+from .chunked import TRADE_FIELDS
+from .crossover import INIT_CASH, TRADE_SIZE, trade_records
+from .fills import FillModel, fill_trades, trade_slippage
+
+MODES = ('independent', 'reverse')
+LONG, SHORT = 0, 1          # vectorbt's trade direction codes
+
+
+def _mask(mask, n):
+    return np.zeros(n, dtype=bool) if mask is None else np.asarray(mask, dtype=bool)
+
+
+def _last(flags, idx):
+    """Index of the last True at or before every bar (-1 if none)."""
+    return np.maximum.accumulate(np.where(flags, idx, -1))
+
+
+def net_position(px, long_entries, short_entries, long_exits=None, short_exits=None):
+    """Stop-and-reverse position per bar (+1 long, -1 short, 0 flat),
+    held from the bar's open fill onward."""
+    n = len(px)
+    le, se = _mask(long_entries, n), _mask(short_entries, n)
+    lx, sx = _mask(long_exits, n), _mask(short_exits, n)
+    valid = np.isfinite(px) & (px > 0)
+    # an entry and an exit of one side cancel, then so do two entries
+    le, lx = le & ~lx & valid, lx & ~le & valid
+    se, sx = se & ~sx & valid, sx & ~se & valid
+    both = le & se
+    idx = np.arange(n)
+
+    last_long, last_short = _last(le & ~both, idx), _last(se & ~both, idx)
+    side = np.where(last_long > last_short, 1, np.where(last_short > last_long, -1, 0))
+    entry = np.maximum(last_long, last_short)
+    closed_long = _last(lx, idx) > entry
+    closed_short = _last(sx, idx) > entry
+    flat = ((side > 0) & closed_long) | ((side < 0) & closed_short)
+    return np.where(flat, 0, side).astype(np.int8)
+
+
+def _runs(position, px, size, sign):
+    """Trade records (mirrored long-only layout) of the runs where position
+    has the given sign."""
+    n = len(position)
+    held = position == sign
+    change = np.diff(np.concatenate(([False], held, [False])).astype(np.int8))
+    entry_idx = np.flatnonzero(change > 0)
+    end = np.flatnonzero(change < 0)             # first bar after each run
+    closed = end < n
+    exit_idx = np.where(closed, end, n - 1)
+
+    out = np.zeros(len(entry_idx), dtype=TRADE_FIELDS)
+    out['size'] = size
+    out['entry_idx'] = entry_idx
+    out['entry_price'] = px[entry_idx]
+    out['exit_idx'] = exit_idx
+    out['exit_price'] = px[exit_idx]
+    out['pnl'] = size * (out['exit_price'] - out['entry_price'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out['return'] = out['pnl'] / (size * out['entry_price'])
+    out['status'] = closed
+    return out
+
+
+def reverse_records(px, long_entries, short_entries, long_exits=None, short_exits=None,
+                    size=TRADE_SIZE):
+    """(long records, short records) of the stop-and-reverse account; short
+    trades in the mirrored long-only layout, like the script's short book."""
+    px = np.asarray(px, dtype=np.float64)
+    position = net_position(px, long_entries, short_entries, long_exits, short_exits)
+    return _runs(position, px, size, 1), _runs(position, px, size, -1)
+
+
+def independent_records(px, long_entries, long_exits, short_entries=None, short_exits=None,
+                        init_cash=INIT_CASH, size=TRADE_SIZE):
+    """(long records, short records) of the two long-only books, from one
+    trade_records call; the short book defaults to the mirror image."""
+    short_entries = long_exits if short_entries is None else short_entries
+    short_exits = long_entries if short_exits is None else short_exits
+    # (n_bars, 2) views of column-major stacks: trade_records scans the
+    # masks column by column without copying them
+    records = trade_records(px, np.stack((long_entries, short_entries)).T,
+                            np.stack((long_exits, short_exits)).T, init_cash, size)
+    legs = []
+    split = np.searchsorted(records['col'], 1)   # records are sorted by col
+    for leg in (records[:split].copy(), records[split:].copy()):
+        # numbered as if each book had been run on its own
+        leg['col'] = 0
+        leg['id'] = leg['parent_id'] = np.arange(len(leg))
+        legs.append(leg)
+    return tuple(legs)
+
+
+def equity_curve(trades, mark, point_value=1., size=TRADE_SIZE, init_cash=INIT_CASH):
+    """Account equity per bar (USD) of a combined trade log.
+
+    mark is the price positions are valued at (the fill price series).
+    Between entry and exit a trade earns the moves of mark; the difference
+    to its filled prices (slippage, ticks) and its fees are booked on the
+    entry and exit bars, so the last value is init_cash + the log's pnl.
+    """
+    mark = np.asarray(mark, dtype=np.float64)
+    n = len(mark)
+    valid = np.isfinite(mark)
+    if valid.any() and not valid.all():
+        filled = np.maximum.accumulate(np.where(valid, np.arange(n), 0))
+        mark = mark[filled]
+        mark[:np.argmax(valid)] = mark[np.argmax(valid)]
+
+    sign = np.where(np.asarray(trades['direction']) == SHORT, -1., 1.)
+    entry = np.asarray(trades['entry_idx'], dtype=np.intp)
+    exit_ = np.asarray(trades['exit_idx'], dtype=np.intp)
+    entry_cost = (sign * (mark[entry] - np.asarray(trades['entry_price']))
+                  - np.asarray(trades['entry_fees']))
+    exit_cost = (sign * (np.asarray(trades['exit_price']) - mark[exit_])
+                 - np.asarray(trades['exit_fees']))
+
+    position = np.cumsum(np.bincount(entry, sign, n + 1) - np.bincount(exit_, sign, n + 1))[:n]
+    pts = np.zeros(n)
+    pts[1:] = position[:-1] * np.diff(mark)
+    pts += np.bincount(entry, entry_cost, n) + np.bincount(exit_, exit_cost, n)
+    return init_cash + np.cumsum(pts) * point_value * size
+
+
+def simulate(px, long_entries, long_exits=None, short_entries=None, short_exits=None,
+             mode='independent', fills=None, bars=None, slippage_long=0., slippage_short=0.,
+             point_value=1., init_cash=INIT_CASH, size=TRADE_SIZE):
+    """Long and short trading of one signal set in a single account.
+
+    px is the signal price (the HA open); fills a FillModel whose raw open
+    and bar-dependent slippage come from bars, as in
+    crossover.backtest_crossover. In 'reverse' mode short_entries defaults
+    to long_exits and only explicitly given exits flatten. Returns (trade
+    log, equity per bar in USD); see the module header.
+    """
+    import pandas as pd
+
+    if mode not in MODES:
+        raise ValueError('mode must be one of %s' % (MODES,))
+    fills = fills or FillModel()
+    px = np.asarray(px, dtype=np.float64)
+    fill_px = fills.prices(px, bars)
+    if mode == 'reverse':
+        if short_entries is None:
+            short_entries, long_exits = long_exits, None
+        legs = reverse_records(fill_px, long_entries, short_entries, long_exits, short_exits,
+                               size)
+    else:
+        legs = independent_records(fill_px, long_entries, long_exits, short_entries,
+                                   short_exits, init_cash, size)
+
+    bar_cost = fills.bar_slippage(bars)[len(bars) - len(px):] if fills.variable else None
+    logs = []
+    for direction, records, slippage in zip(('long', 'short'), legs,
+                                            (slippage_long, slippage_short)):
+        extra = trade_slippage(records, bar_cost) if bar_cost is not None else None
+        log = fill_trades(records, fills, direction, slippage, extra, point_value)
+        log['direction'] = LONG if direction == 'long' else SHORT
+        logs.append(log)
+    trades = pd.concat(logs, ignore_index=True)
+    trades = trades.sort_values(['entry_idx', 'direction'], kind='stable', ignore_index=True)
+    trades['id'] = trades['parent_id'] = np.arange(len(trades))
+    trades['col'] = 0
+    trades['cumulative_pnl_points'] = trades['pnl'].cumsum()
+    return trades, equity_curve(trades, fill_px, point_value, size, init_cash)
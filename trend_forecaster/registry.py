@@ -0,0 +1,178 @@
+# Persistent registry of fitted classifiers
+#
+# Layout: <root>/<name>/<version>/model.joblib + meta.json. The metadata
+# (feature schema, training window, metrics, estimator class) is a small
+# JSON file read eagerly; the estimator itself is only unpickled on first
+# use. Unpickling copies a tree's nodes into sklearn's own buffers, so
+# decision trees and forests also store their node arrays as tree_*.npy
+# files (live.TreePredictor): predictor() and predict() map those read-only
+# and never load the pickle. Binary linear models likewise keep their
+# coefficients in meta.json, so a service can predict with them without
+# loading the pickle or importing scikit-learn at all.
+
+import json
+import os
+import sys
+from datetime import datetime
+
+import numpy as np
+
+from .live import LinearPredictor, TreePredictor, fast_predictor
+
+MODEL_FILE = 'model.joblib'
+META_FILE = 'meta.json'
+
+
+def _jsonable(value):
+    if isinstance(value, (np.integer, np.floating, np.bool_)):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+class RegisteredModel:
+    """A stored estimator: metadata now, the estimator on first access."""
+
+    def __init__(self, path, meta, mmap=True):
+        self.path = path
+        self.meta = meta
+        self.mmap = mmap
+        self._model = None
+        self._trees = None
+
+    @property
+    def name(self):
+        return self.meta['name']
+
+    @property
+    def version(self):
+        return self.meta['version']
+
+    @property
+    def features(self):
+        return self.meta['features']
+
+    @property
+    def model(self):
+        if self._model is None:
+            import joblib
+            self._model = joblib.load(os.path.join(self.path, MODEL_FILE),
+                                      mmap_mode='r' if self.mmap else None)
+        return self._model
+
+    @property
+    def trees(self):
+        """TreePredictor over the stored node arrays, or None."""
+        if self._trees is None and self.meta.get('trees'):
+            self._trees = TreePredictor.load(self.path, self.mmap)
+        return self._trees
+
+    def predictor(self):
+        """One-row predict function; linear and tree models skip loading
+        the pickle."""
+        linear = self.meta.get('linear')
+        if linear is not None:
+            return LinearPredictor.from_params(linear['coef'], linear['intercept'],
+                                               linear['classes'])
+        if self.trees is not None:
+            return self.trees
+        return fast_predictor(self.model)
+
+    def predict(self, X):
+        """Batch predict; DataFrames are checked against the feature schema."""
+        pd = sys.modules.get('pandas')
+        if pd is not None and isinstance(X, pd.DataFrame):
+            missing = [f for f in self.features if f not in X]
+            if missing:
+                raise KeyError('missing features %s' % missing)
+            X = X[self.features]
+        if self.trees is not None:
+            return self.trees.predict(X)
+        return self.model.predict(X)
+
+    def __repr__(self):
+        return 'RegisteredModel(%r, version=%r)' % (self.name, self.version)
+
+
+class ModelRegistry:
+    """Save and lazily load fitted estimators with their metadata."""
+
+    def __init__(self, root):
+        self.root = root
+        self._loaded = {}
+        os.makedirs(root, exist_ok=True)
+
+    def versions(self, name):
+        path = os.path.join(self.root, name)
+        if not os.path.isdir(path):
+            return []
+        return sorted(int(v) for v in os.listdir(path) if v.isdigit())
+
+    def save(self, name, model, features, train_start=None, train_end=None, metrics=None,
+             **extra):
+        """Store a fitted estimator as the next version of name."""
+        import joblib
+
+        existing = self.versions(name)
+        version = existing[-1] + 1 if existing else 1
+        path = os.path.join(self.root, name, str(version))
+        os.makedirs(path)
+
+        joblib.dump(model, os.path.join(path, MODEL_FILE))
+        trees = TreePredictor.supports(model)
+        if trees:
+            TreePredictor.from_model(model).save(path)
+
+        meta = {
+            'name': name,
+            'version': version,
+            'estimator': type(model).__name__,
+            'features': list(features),
+            'train_start': train_start,
+            'train_end': train_end,
+            'metrics': metrics or {},
+            'created': datetime.now(),
+            'trees': trees,
+        }
+        meta.update(extra)
+        coef = getattr(model, 'coef_', None)
+        if coef is not None and len(getattr(model, 'classes_', ())) == 2:
+            meta['linear'] = {'coef': np.ravel(coef).tolist(),
+                              'intercept': float(np.ravel(model.intercept_)[0]),
+                              'classes': list(model.classes_)}
+        with open(os.path.join(path, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=2, default=_jsonable)
+        return version
+
+    def load(self, name, version=None, mmap=True):
+        """RegisteredModel for a version (latest by default). Cached."""
+        if version is None:
+            existing = self.versions(name)
+            if not existing:
+                raise KeyError('no model registered as %r' % name)
+            version = existing[-1]
+        key = (name, int(version))
+        if key not in self._loaded:
+            path = os.path.join(self.root, name, str(version))
+            with open(os.path.join(path, META_FILE)) as f:
+                meta = json.load(f)
+            self._loaded[key] = RegisteredModel(path, meta, mmap)
+        return self._loaded[key]
+
+    def list(self):
+        """One row per stored (name, version) with its metadata."""
+        import pandas as pd
+
+        rows = []
+        for name in sorted(os.listdir(self.root)):
+            for version in self.versions(name):
+                meta = self.load(name, version).meta
+                row = {k: meta.get(k) for k in ('name', 'version', 'estimator',
+                                                 'train_start', 'train_end', 'created')}
+                row['features'] = ','.join(meta['features'])
+                row.update(meta.get('metrics', {}))
+                rows.append(row)
+        return pd.DataFrame(rows)
@@ -0,0 +1,213 @@
+# Headless report bundles
+#
+# Figures are described as plain data (a kind, NumPy arrays and labels)
+# while the pipeline runs, and rendered later with matplotlib's
+# non-interactive Agg backend in a pool of worker processes. Nothing calls
+# plt.show(), so no display is needed and rendering never blocks the
+# computation. Report.write() produces a bundle directory:
+#
+#   <directory>/report.json    all stats + the list of figures
+#   <directory>/index.html     stats tables and embedded figures
+#   <directory>/<name>.png     one file per figure
+#
+# Plotting can be skipped entirely (plots=False, or TRENDFC_NO_PLOTS=1) for
+# batch runs; the stats are still written.
+
+import html
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .instrument import stage
+from .signals import decode_labels
+
+NO_PLOTS_ENV = 'TRENDFC_NO_PLOTS'
+
+
+def _array(values):
+    return np.asarray(getattr(values, 'to_numpy', lambda: values)(), dtype=np.float64)
+
+
+def _label_names(labels):
+    """'UP'/'DOWN' for integer direction codes; other labels as they are."""
+    labels = np.asarray(labels)
+    return decode_labels(labels) if labels.dtype.kind in 'iu' else labels
+
+
+def render_figure(spec, directory):
+    """Draw one figure spec to <directory>/<name>.png (runs in a worker)."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    opts = spec['options']
+    fig, ax = plt.subplots(figsize=opts.get('figsize', (10, 4)))
+    kind = spec['kind']
+    if kind == 'line':
+        if spec.get('x') is None:
+            ax.plot(spec['y'])
+        else:
+            ax.plot(spec['x'], spec['y'])
+        if opts.get('hline') is not None:
+            ax.axhline(y=opts['hline'], linestyle='dashed', color='red')
+    elif kind == 'hist':
+        ax.hist(spec['x'][~np.isnan(spec['x'])], bins=opts.get('bins', 40))
+    elif kind == 'confusion_matrix':
+        matrix, labels = spec['matrix'], spec['labels']
+        im = ax.imshow(matrix, cmap='viridis')
+        fig.colorbar(im, ax=ax)
+        ax.set_xticks(range(len(labels)), labels=labels)
+        ax.set_yticks(range(len(labels)), labels=labels)
+        for (i, j), v in np.ndenumerate(matrix):
+            ax.text(j, i, str(v), ha='center', va='center',
+                    color='white' if v < matrix.max() / 2 else 'black')
+        ax.set_xlabel('Predicted label')
+        ax.set_ylabel('True label')
+    else:
+        raise ValueError('unknown figure kind %r' % kind)
+
+    if opts.get('ylim') is not None:
+        ax.set_ylim(*opts['ylim'])
+    ax.set_title(opts.get('title', ''))
+    if opts.get('xlabel'):
+        ax.set_xlabel(opts['xlabel'])
+    if opts.get('ylabel'):
+        ax.set_ylabel(opts['ylabel'])
+
+    path = os.path.join(directory, spec['name'] + '.png')
+    fig.savefig(path, dpi=opts.get('dpi', 80), bbox_inches='tight')
+    plt.close(fig)
+    return path
+
+
+def _jsonable(obj):
+    if isinstance(obj, pd.DataFrame):
+        return json.loads(obj.to_json(orient='split', date_format='iso', default_handler=str))
+    if isinstance(obj, pd.Series):
+        return json.loads(obj.to_json(date_format='iso', default_handler=str))
+    if isinstance(obj, (np.integer, np.floating, np.bool_)):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+def _html_table(obj):
+    if isinstance(obj, pd.Series):
+        obj = obj.to_frame()
+    if isinstance(obj, pd.DataFrame):
+        return obj.to_html(border=0)
+    if isinstance(obj, dict):
+        return pd.Series(obj, dtype=object).to_frame('value').to_html(border=0)
+    return '<pre>%s</pre>' % html.escape(str(obj))
+
+
+class Report:
+    """Collects stats and figure specs, then writes them as a bundle."""
+
+    def __init__(self, directory, plots=None):
+        self.directory = directory
+        if plots is None:
+            plots = os.environ.get(NO_PLOTS_ENV, '').lower() not in ('1', 'true', 'yes')
+        self.plots = plots
+        self.figures = []
+        self.stats = {}
+
+    # --- figures -----------------------------------------------------------
+
+    def _figure(self, name, kind, **spec):
+        if self.plots:
+            options = spec.pop('options')
+            self.figures.append(dict(name=name, kind=kind, options=options, **spec))
+
+    def line(self, name, y, x=None, title='', xlabel=None, ylabel=None, ylim=None,
+             hline=None, figsize=(10, 4)):
+        self._figure(name, 'line', y=_array(y), x=None if x is None else np.asarray(x),
+                     options=dict(title=title, xlabel=xlabel, ylabel=ylabel, ylim=ylim,
+                                  hline=hline, figsize=figsize))
+
+    def hist(self, name, x, bins=40, title='', xlabel=None, ylabel=None, ylim=None,
+             figsize=(10, 8)):
+        self._figure(name, 'hist', x=_array(x),
+                     options=dict(bins=bins, title=title, xlabel=xlabel, ylabel=ylabel,
+                                  ylim=ylim, figsize=figsize))
+
+    def confusion_matrix(self, name, y_true, y_pred, labels=None, title=''):
+        """Replaces sklearn's plot_confusion_matrix; the matrix itself is
+        also stored as a stat. Direction codes are shown as 'UP'/'DOWN'."""
+        from sklearn.metrics import confusion_matrix
+
+        y_true, y_pred = _label_names(y_true), _label_names(y_pred)
+        labels = list(np.unique(np.concatenate([y_true, y_pred]))
+                      if labels is None else _label_names(labels))
+        matrix = confusion_matrix(y_true, y_pred, labels=labels)
+        self.stats[name] = pd.DataFrame(matrix, index=labels, columns=labels)
+        self._figure(name, 'confusion_matrix', matrix=matrix, labels=[str(l) for l in labels],
+                     options=dict(title=title, figsize=(6, 5)))
+
+    # --- stats ---------------------------------------------------------------
+
+    def add_stats(self, name, obj):
+        """Record a stats object (DataFrame, Series, dict or scalar)."""
+        self.stats[name] = obj
+
+    def trade_section(self, key, trades, point_value, label, ylim=None, bins=40):
+        """Everything the script shows for one trade log: the equity curve,
+        the return histogram, per-trade pnl and the describe() stats."""
+        pnl_usd = point_value * trades['pnl']
+        self.line(key + '_equity', trades['cumulative_pnl_points'] * point_value,
+                  title='Cumulative Profit/Loss in USD | %s' % label, xlabel='Trades',
+                  ylabel='Cumulative Profit (in USD)')
+        self.hist(key + '_returns', trades['return'], bins=bins,
+                  title='Distribution of Trade Returns | %s' % label,
+                  xlabel='Returns (per each trade)', ylabel='Number of Trades')
+        self.line(key + '_trade_pnl', pnl_usd, title='Individual Trade PnL | %s' % label,
+                  hline=0, ylim=ylim, figsize=(20, 8))
+        self.add_stats(key + '_pnl_stats', pnl_usd.describe())
+
+    # --- output --------------------------------------------------------------
+
+    def render(self, max_workers=None):
+        """Render all figures in a process pool; returns their paths."""
+        if not self.figures:
+            return []
+        os.makedirs(self.directory, exist_ok=True)
+        if max_workers == 1:
+            return [render_figure(spec, self.directory) for spec in self.figures]
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(render_figure, self.figures,
+                                 [self.directory] * len(self.figures)))
+
+    def write(self, max_workers=None):
+        """Write the bundle (figures, report.json, index.html); returns the
+        path of index.html."""
+        with stage('reporting', figures=len(self.figures)):
+            os.makedirs(self.directory, exist_ok=True)
+            paths = self.render(max_workers) if self.plots else []
+            figures = [os.path.basename(p) for p in paths]
+
+            with open(os.path.join(self.directory, 'report.json'), 'w') as f:
+                json.dump({'stats': self.stats, 'figures': figures}, f, indent=2,
+                          default=_jsonable)
+
+            parts = ['<html><head><meta charset="utf-8"><title>Report</title></head><body>']
+            for name, obj in self.stats.items():
+                parts.append('<h3>%s</h3>%s' % (html.escape(name), _html_table(obj)))
+            for fig in figures:
+                parts.append('<div><img src="%s"></div>' % html.escape(fig))
+            parts.append('</body></html>')
+            index = os.path.join(self.directory, 'index.html')
+            with open(index, 'w') as f:
+                f.write('\n'.join(parts))
+        return index
+
+    def write_async(self, max_workers=None):
+        """Start write() in a background thread and return its Future, so
+        the caller can carry on while figures render."""
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(self.write, max_workers)
+        executor.shutdown(wait=False)
+        return future
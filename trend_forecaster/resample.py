@@ -0,0 +1,183 @@
+# Multi-timeframe OHLC resampling
+#
+#   daily = resample_bars(es_4h, '1D', session_offset='-6h')
+#
+# Coarser bars are built from one stored base series instead of another
+# get_hist() call per timeframe. Each base bar is assigned to a bucket with
+# integer arithmetic on its timestamp, and since bars are sorted the buckets
+# form contiguous runs, so open / high / low / close / volume are single
+# reduceat() calls over the run offsets (no groupby, no Python loop).
+#
+# Sessions: futures trade days start the evening before (CME: 18:00 ET), so
+# a bar belongs to the trading date of (time - session_offset); with
+# session_offset='-6h' the 18:00 bar on a Sunday is the first bar of
+# Monday's daily bar and of that week's weekly bar. Intraday buckets are
+# anchored at the session open (4H: 18:00, 22:00, 02:00, ...). Daily bars are
+# labelled with the trading date, weekly bars with the Monday of the week
+# and monthly bars with the first of the month; intraday bars with their
+# start time. Timestamps are taken as exchange local time.
+#
+# Resampler keeps one timeframe up to date as base bars arrive: only the
+# last (possibly still forming) coarse bar is merged with the new data.
+
+import re
+
+import numpy as np
+
+from .datastore import BAR_COLUMNS, INTERVAL_LENGTHS
+
+# trading date = calendar date of (bar time - offset), per exchange
+SESSION_OFFSETS = {
+    'CME': '-6h',
+    'CME_MINI': '-6h',
+    'CBOT': '-6h',
+    'NYMEX': '-6h',
+    'COMEX': '-6h',
+}
+
+_RULE = re.compile(r'^(\d*)([HDWM]?)$')
+_NS_PER_DAY = 86400 * 10 ** 9
+_MONDAY = 4   # 1970-01-01 was a Thursday; day 4 is Monday 1970-01-05
+
+
+def parse_rule(rule):
+    """(count, unit) of an interval name as used by tvDatafeed: '15'
+    (minutes), '4H', '1D', '1W', '1M'. unit is 'min', 'H', 'D', 'W' or 'M'."""
+    match = _RULE.match(str(getattr(rule, 'value', rule)))
+    if not match or not match.group(0):
+        raise ValueError('unsupported interval %r' % (rule,))
+    count = int(match.group(1) or 1)
+    return count, match.group(2) or 'min'
+
+
+def session_offset_for(exchange):
+    """Session offset of an exchange (0 when it has no evening session)."""
+    return SESSION_OFFSETS.get(exchange, '0h')
+
+
+def bucket_labels(index, rule, session_offset='0h'):
+    """(bucket ids, label timestamps per id) of a sorted DatetimeIndex."""
+    import pandas as pd
+
+    count, unit = parse_rule(rule)
+    offset = pd.Timedelta(session_offset).value
+    if getattr(index, 'tz', None) is not None:
+        index = index.tz_localize(None)
+    ns = index.as_unit('ns').asi8 - offset
+
+    if unit in ('min', 'H'):
+        step = count * (60 if unit == 'min' else 3600) * 10 ** 9
+        buckets = ns // step
+        labels = buckets * step + offset
+    elif unit == 'D':
+        buckets = ns // (count * _NS_PER_DAY)
+        labels = buckets * count * _NS_PER_DAY
+    elif unit == 'W':
+        buckets = (ns // _NS_PER_DAY - _MONDAY) // (7 * count)
+        labels = (buckets * 7 * count + _MONDAY) * _NS_PER_DAY
+    else:
+        days = (ns // _NS_PER_DAY).astype('datetime64[D]')
+        months = days.astype('datetime64[M]').astype(np.int64)
+        buckets = months // count
+        first_month = (buckets * count).astype('datetime64[M]')
+        labels = first_month.astype('datetime64[ns]').astype(np.int64)
+    return buckets, labels
+
+
+def _reduce(bars, buckets, labels):
+    """One coarse bar per run of equal bucket ids."""
+    import pandas as pd
+
+    columns = [c for c in BAR_COLUMNS if c in bars]
+    if not len(buckets):
+        return bars.iloc[:0][columns], buckets
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.append(starts[1:], len(buckets)) - 1
+    out = {}
+    if 'symbol' in bars:
+        out['symbol'] = bars['symbol'].to_numpy()[starts]
+    out['open'] = bars['open'].to_numpy()[starts]
+    out['high'] = np.maximum.reduceat(bars['high'].to_numpy(), starts)
+    out['low'] = np.minimum.reduceat(bars['low'].to_numpy(), starts)
+    out['close'] = bars['close'].to_numpy()[ends]
+    if 'volume' in bars:
+        out['volume'] = np.add.reduceat(bars['volume'].to_numpy(dtype=np.float64), starts)
+    index = pd.DatetimeIndex(labels[starts].astype('datetime64[ns]'), name='datetime')
+    return pd.DataFrame(out, index=index), buckets[starts]
+
+
+def resample_bars(bars, rule, session_offset='0h'):
+    """OHLC(V) bars of a coarser timeframe built from sorted base bars.
+
+    The first and last coarse bars can be partial when the base history
+    starts or ends inside a bucket.
+    """
+    buckets, labels = bucket_labels(bars.index, rule, session_offset)
+    return _reduce(bars, buckets, labels)[0]
+
+
+def timeframes(bars, rules, session_offset='0h'):
+    """{rule: resampled bars} for several timeframes of one base series."""
+    return {rule: resample_bars(bars, rule, session_offset) for rule in rules}
+
+
+def interval_ratio(base, target):
+    """Approximate number of base bars per target bar ('4H' -> '1D': 6)."""
+    base_len = INTERVAL_LENGTHS.get(str(getattr(base, 'value', base)))
+    target_len = INTERVAL_LENGTHS.get(str(getattr(target, 'value', target)))
+    if base_len is None or target_len is None:
+        raise ValueError('unknown interval %r / %r' % (base, target))
+    return max(int(np.ceil(target_len / base_len)), 1)
+
+
+class Resampler:
+    """Incrementally maintained coarse timeframe.
+
+    update() takes the next base bars (sorted, after the ones already
+    seen) and returns the coarse bars they touched: the previously last
+    bar, if the new data extends it, and any new ones. bars() is the whole
+    coarse history so far.
+    """
+
+    def __init__(self, rule, session_offset='0h'):
+        parse_rule(rule)
+        self.rule = rule
+        self.session_offset = session_offset
+        self._done = []       # frames of completed coarse bars
+        self._last = None     # one-row frame of the last (forming) bar
+        self._last_bucket = None
+
+    def update(self, base):
+        import pandas as pd
+
+        if not len(base):
+            return base.iloc[:0][[c for c in BAR_COLUMNS if c in base]]
+        buckets, labels = bucket_labels(base.index, self.rule, self.session_offset)
+        new, new_buckets = _reduce(base, buckets, labels)
+
+        if self._last is not None and new_buckets[0] == self._last_bucket:
+            first = new.iloc[0]
+            merged = self._last.copy()
+            merged['high'] = max(merged['high'].iloc[0], first['high'])
+            merged['low'] = min(merged['low'].iloc[0], first['low'])
+            merged['close'] = first['close']
+            if 'volume' in merged:
+                merged['volume'] = merged['volume'].iloc[0] + first['volume']
+            new = pd.concat([merged, new.iloc[1:]])
+        elif self._last is not None:
+            self._done.append(self._last)
+
+        if len(new) > 1:
+            self._done.append(new.iloc[:-1])
+        self._last = new.iloc[-1:]
+        self._last_bucket = new_buckets[-1]
+        return new
+
+    def bars(self):
+        import pandas as pd
+
+        frames = self._done + ([self._last] if self._last is not None else [])
+        if len(frames) > 1:
+            # keep the list short so repeated calls stay cheap
+            self._done = [pd.concat(self._done)] if self._done else []
+        return pd.concat(frames) if frames else None
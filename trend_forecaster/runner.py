@@ -0,0 +1,239 @@
+# Instrument-spec driven pipeline runner
+#
+# One spec per contract replaces the copy-pasted ES / GE sections of the
+# script: fetch -> Heikin-Ashi -> EMA crossover -> long and short backtests
+# (crossover.py, or vectorbt portfolios) -> fills (fills.py: slippage, tick
+# size, commission) -> summary row. Contracts are processed concurrently
+# across a process pool; with a shared.SharedPool their bars are published
+# once and the tasks get Dataset handles instead of reading the cache.
+
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .analytics import trade_stats
+from .datastore import BarStore
+from .heikin_ashi import OHLC, heikin_ashi, heikin_ashi_open
+from .instrument import stage
+
+INIT_CASH = 100000.
+TRADE_SIZE = 1
+
+RESULT_COLUMNS = ['instrument', 'direction', 'bars', 'trades', 'win_rate',
+                  'profit_factor', 'total_pts', 'pnl_usd', 'max_drawdown_usd',
+                  'return_pct', 'buyhold_pnl_usd']
+
+
+@dataclass(frozen=True)
+class InstrumentSpec:
+    name: str
+    symbol: str
+    exchange: str
+    interval: str
+    point_value: float          # USD per point for one contract
+    slippage_long: float = 0.   # points paid on entry and on exit
+    slippage_short: float = 0.
+    n_bars: int = 5000
+    fut_contract: int = 1
+    fast: int = 1
+    slow: int = 5
+    base_interval: str = None   # derive `interval` bars from this stored series
+    session_offset: str = None  # default: resample.SESSION_OFFSETS[exchange]
+    fills: object = None        # fills.FillModel; default: HA open + the slippage above
+
+    def fetch(self, store, refresh=True):
+        if self.base_interval is None:
+            return store.get_hist(self.symbol, self.exchange, self.interval,
+                                  n_bars=self.n_bars, fut_contract=self.fut_contract,
+                                  refresh=refresh)
+        from .resample import interval_ratio, resample_bars, session_offset_for
+
+        base = store.get_hist(self.symbol, self.exchange, self.base_interval,
+                              n_bars=self.n_bars * interval_ratio(self.base_interval,
+                                                                  self.interval),
+                              fut_contract=self.fut_contract, refresh=refresh)
+        offset = self.session_offset or session_offset_for(self.exchange)
+        return resample_bars(base, self.interval, offset).iloc[-self.n_bars:]
+
+
+# The two contracts from the original study
+ES = InstrumentSpec('ES', 'ES', 'CME_MINI', '4H', point_value=50.,
+                    slippage_long=8., slippage_short=7.)
+GE = InstrumentSpec('GE', 'GE', 'CME', '1W', point_value=2500.)
+
+# e.g. the hybrid model on daily ES bars, built from the cached 4H series:
+#   dataclasses.replace(ES, name='ES_1D', interval='1D', base_interval='4H')
+# or filled at the raw open on the tick grid, with commission:
+#   dataclasses.replace(ES, fills=FillModel(tick_size=0.25, commission=2.5, price='open'))
+
+
+def backtest_instrument(spec, bars, engine='native'):
+    """Run the EMA crossover backtest on one contract's raw OHLC bars.
+
+    engine 'native' uses crossover.backtest_crossover, 'vectorbt' builds the
+    two vectorbt Portfolios; the trade logs are the same. Returns a dict of
+    direction -> slippage-adjusted trade log.
+    """
+    if engine not in ('native', 'vectorbt'):
+        raise ValueError("engine must be 'native' or 'vectorbt'")
+    if engine == 'native':
+        # only the HA open is traded; no HA frame is built
+        px = heikin_ashi_open(*(bars[k].to_numpy(dtype=np.float64) for k in OHLC))[0]
+    else:
+        px = pd.to_numeric(heikin_ashi(bars)['open'], errors='coerce')
+
+    with stage('backtest', instrument=spec.name, engine=engine) as st:
+        if engine == 'native':
+            from .crossover import backtest_crossover
+
+            trades = backtest_crossover(px, spec.fast, spec.slow, spec.slippage_long,
+                                        spec.slippage_short, INIT_CASH, TRADE_SIZE, spec.fills,
+                                        bars, spec.point_value)
+        else:
+            trades = _vectorbt_trades(spec, px, bars)
+        st.record(px, trades=sum(len(t) for t in trades.values()))
+    return trades
+
+
+def backtest_account(spec, bars, mode='independent'):
+    """Long and short crossover trading of one contract as one account
+    (portfolio.simulate; 'reverse' for stop-and-reverse).
+
+    Returns (trade log of both directions, equity in USD per bar).
+    """
+    from .crossover import crossover_masks
+    from .portfolio import simulate
+
+    hadf = heikin_ashi(bars)
+    px = pd.to_numeric(hadf['open'], errors='coerce').to_numpy()
+    with stage('backtest', instrument=spec.name, account=mode) as st:
+        above, below = crossover_masks(px, spec.fast, spec.slow)
+        trades, equity = simulate(px, above, below, mode=mode, fills=spec.fills, bars=bars,
+                                  slippage_long=spec.slippage_long,
+                                  slippage_short=spec.slippage_short,
+                                  point_value=spec.point_value, init_cash=INIT_CASH,
+                                  size=TRADE_SIZE)
+        st.record(px, trades=len(trades))
+    return trades, pd.Series(equity, index=bars.index, name='equity')
+
+
+def _vectorbt_trades(spec, px, bars):
+    import vectorbt as vbt
+
+    from .fills import FillModel, fill_trades, trade_slippage
+
+    fills = spec.fills or FillModel()
+    fast_ma = vbt.MA.run(px, spec.fast, short_name='fast')
+    slow_ma = vbt.MA.run(px, spec.slow, short_name='slow')
+    above = fast_ma.ma_crossed_above(slow_ma)
+    below = fast_ma.ma_crossed_below(slow_ma)
+    fill_px = pd.Series(fills.prices(px.to_numpy(), bars), index=px.index)
+    bar_cost = fills.bar_slippage(bars) if fills.variable else None
+
+    trades = {}
+    for direction, entries, exits, slippage in (('long', above, below, spec.slippage_long),
+                                                ('short', below, above, spec.slippage_short)):
+        records = vbt.Portfolio.from_signals(fill_px, entries, exits, init_cash=INIT_CASH,
+                                             size=TRADE_SIZE).trades.records
+        extra = trade_slippage(records, bar_cost) if bar_cost is not None else None
+        trades[direction] = fill_trades(records, fills, direction, slippage, extra,
+                                        spec.point_value)
+    return trades
+
+
+def summarize(spec, bars, trades):
+    """One results row per direction for a contract."""
+    buyhold_pts = float(bars['open'].iloc[-1] - bars['open'].iloc[0])
+    return summary_rows(spec, len(bars), buyhold_pts, trades)
+
+
+def summary_rows(spec, n_bars, buyhold_pts, trades):
+    """summarize() from the bar count and the first-to-last open move."""
+    rows = []
+    for direction, df in trades.items():
+        # pnl in the adjusted log is already net of slippage
+        pnl = df['pnl'].to_numpy(dtype=np.float64)[:, np.newaxis]
+        stats = trade_stats(pnl, spec.point_value * TRADE_SIZE).iloc[0]
+        rows.append({
+            'instrument': spec.name,
+            'direction': direction,
+            'bars': n_bars,
+            'trades': int(stats['trades']),
+            'win_rate': stats['win_rate'],
+            'profit_factor': stats['profit_factor'],
+            'total_pts': stats['total_pts'],
+            'pnl_usd': stats['total_usd'],
+            'max_drawdown_usd': stats['max_drawdown_usd'],
+            'return_pct': 100 * stats['total_usd'] / INIT_CASH,
+            'buyhold_pnl_usd': buyhold_pts * spec.point_value * TRADE_SIZE,
+        })
+    return rows
+
+
+def run_instrument(spec, store):
+    """Backtest one contract from the store. Returns (rows, trades)."""
+    bars = spec.fetch(store, refresh=False)
+    trades = backtest_instrument(spec, bars)
+    return summarize(spec, bars, trades), trades
+
+
+def _run_shared(spec, data, index_name):
+    """run_instrument() on bars published by run_universe."""
+    arrays = dict(data)
+    index = pd.DatetimeIndex(arrays.pop('index'), name=index_name)
+    bars = pd.DataFrame(arrays, index=index, copy=False)
+    trades = backtest_instrument(spec, bars)
+    return summarize(spec, bars, trades), trades
+
+
+def run_universe(specs, store, max_workers=None, refresh=True, with_trades=False, pool=None):
+    """Backtest a list of InstrumentSpecs and return one results table.
+
+    Bars are refreshed through the store in this process first (network
+    I/O), then the workers read them from the on-disk cache, so only the
+    specs and the cache location are sent to the pool. max_workers=1 runs
+    everything in-process. With pool, a shared.SharedPool (max_workers is
+    then ignored), each contract's bars are read here and published to the
+    pool, and its task gets them by handle.
+    """
+    if refresh:
+        for spec in specs:
+            spec.fetch(store, refresh=True)
+    cache = BarStore(store.root, source=None, fmt=store.fmt)
+
+    if pool is not None:
+        outputs = _run_pooled(specs, cache, pool)
+    elif max_workers == 1:
+        outputs = [run_instrument(spec, cache) for spec in specs]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            outputs = list(executor.map(run_instrument, specs, [cache] * len(specs)))
+
+    rows = [row for spec_rows, _ in outputs for row in spec_rows]
+    results = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    if not with_trades:
+        return results
+    trades = {(spec.name, direction): df
+              for spec, (_, spec_trades) in zip(specs, outputs)
+              for direction, df in spec_trades.items()}
+    return results, trades
+
+
+def _run_pooled(specs, cache, pool):
+    datasets, futures = [], []
+    try:
+        for spec in specs:
+            bars = spec.fetch(cache, refresh=False)
+            # the numeric columns (not the symbol)
+            arrays = {k: bars[k].to_numpy() for k in bars.select_dtypes('number').columns}
+            arrays['index'] = bars.index.to_numpy()
+            datasets.append(pool.publish(arrays))
+            futures.append(pool.submit(_run_shared, spec, datasets[-1], bars.index.name))
+        return [f.result() for f in futures]
+    finally:
+        for f in futures:
+            f.cancel()
+        for data in datasets:
+            pool.release(data)
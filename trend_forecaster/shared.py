@@ -0,0 +1,296 @@
+# Datasets shared with worker processes
+#
+#   with SharedPool(max_workers=4) as pool:
+#       data = pool.publish({'X': X, 'y': y})      # or an array / FeatureStore
+#       futures = [pool.submit(fit, est, data['X'], data['y']) for est in ests]
+#
+# Sending data_open / opens to a process pool pickles a copy per task and
+# keeps one per worker. publish() instead copies the arrays once into a
+# single shared-memory segment (multiprocessing.shared_memory, or with
+# backend='mmap' a file under `directory`, for when /dev/shm is small) and
+# returns a Dataset: a small picklable handle holding only the segment name
+# and the layout of its arrays. Any task argument that is a Dataset is
+# attached in the worker - mapped, not copied, as read-only NumPy views -
+# for the duration of the task.
+#
+# Lifecycle: the publishing process owns the segment. release() (called by
+# SharedPool on exit, after its workers are gone) unlinks it, and whatever
+# is still published at interpreter exit is released then. Workers never
+# unlink: they detach after each task, so a crashed worker cannot take a
+# dataset away from the others, and a released dataset is not kept mapped
+# by a long-lived pool's idle workers.
+
+import atexit
+import os
+import tempfile
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+ALIGN = 64
+BACKENDS = ('shm', 'mmap')
+
+_owned = {}      # name -> SharedMemory / np.memmap, in the publishing process
+_attached = {}   # name -> (buffer holder, {key: array}), in any process
+_pid = os.getpid()   # forked workers inherit _owned but must not release it
+
+
+class Dataset:
+    """Picklable reference to published arrays (see publish()).
+
+    dataset['X'] refers to one array of a published dict; attach() maps the
+    segment and returns what was published (dict, array or FeatureStore)
+    made of read-only views.
+    """
+
+    def __init__(self, name, backend, layout, kind, meta=None, key=None):
+        self.name = name
+        self.backend = backend
+        self.layout = layout          # ((key, dtype, shape, order, offset), ...)
+        self.kind = kind              # 'array', 'dict' or 'feature_store'
+        self.meta = meta or {}
+        self.key = key
+
+    def __getitem__(self, key):
+        if key not in {k for k, *_ in self.layout}:
+            raise KeyError(key)
+        return Dataset(self.name, self.backend, self.layout, self.kind, self.meta, key)
+
+    def __repr__(self):
+        return 'Dataset(%r, %s%s)' % (self.name, self.kind,
+                                      '' if self.key is None else ', key=%r' % self.key)
+
+    @property
+    def nbytes(self):
+        return sum(np.dtype(dtype).itemsize * int(np.prod(shape))
+                   for _, dtype, shape, _, _ in self.layout)
+
+    def arrays(self):
+        """{key: read-only view} of every published array."""
+        if self.name not in _attached:
+            _attached[self.name] = _map(self)
+        return _attached[self.name][1]
+
+    def attach(self):
+        arrays = self.arrays()
+        if self.key is not None:
+            return arrays[self.key]
+        if self.kind == 'array':
+            return arrays['values']
+        if self.kind == 'feature_store':
+            import pandas as pd
+
+            from .features import FeatureStore
+
+            index = arrays.get('index')
+            if index is not None:
+                index = pd.DatetimeIndex(index, name=self.meta.get('index_name'))
+            return FeatureStore(arrays['values'], self.meta['columns'], arrays['direction'],
+                                index)
+        return dict(arrays)
+
+
+def _layout(arrays):
+    layout, offset = [], 0
+    for key, a in arrays.items():
+        if a.dtype.hasobject:
+            raise TypeError('cannot share object array %r' % key)
+        order = 'F' if a.flags.f_contiguous and not a.flags.c_contiguous else 'C'
+        layout.append((key, a.dtype.str, a.shape, order, offset))
+        offset += -(-a.nbytes // ALIGN) * ALIGN
+    return tuple(layout), max(offset, 1)
+
+
+def _views(buf, layout, writeable):
+    out = {}
+    for key, dtype, shape, order, offset in layout:
+        a = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset, order=order)
+        a.flags.writeable = writeable
+        out[key] = a
+    return out
+
+
+def _open_shm(name):
+    from multiprocessing import resource_tracker, shared_memory
+
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)   # Python >= 3.13
+    except TypeError:
+        pass
+    # before 3.13 attaching registers the segment with the resource tracker,
+    # which unlinks it when the worker exits (or, if the tracker is the
+    # owner's, makes the owner's unlink fail), so skip the registration
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
+
+
+def _map(dataset):
+    if dataset.backend == 'shm':
+        holder = _owned.get(dataset.name) or _open_shm(dataset.name)
+        buf = holder.buf
+    else:
+        holder = np.memmap(dataset.name, dtype=np.uint8, mode='r')
+        buf = holder
+    return holder, _views(buf, dataset.layout, writeable=False)
+
+
+def publish(data, backend='shm', directory=None):
+    """Copy data into a new shared segment and return its Dataset handle.
+
+    data is a NumPy array, a dict of arrays or a FeatureStore (its block,
+    labels and index). directory is where 'mmap' files go (default: the
+    temp directory).
+    """
+    from .features import FeatureStore
+
+    if backend not in BACKENDS:
+        raise ValueError('backend must be one of %s' % (BACKENDS,))
+    meta = {}
+    if isinstance(data, FeatureStore):
+        kind = 'feature_store'
+        arrays = {'values': data.values, 'direction': data.direction}
+        meta['columns'] = list(data.columns)
+        if data.index is not None:
+            arrays['index'] = np.asarray(data.index, dtype='datetime64[ns]')
+            meta['index_name'] = data.index.name
+    elif isinstance(data, dict):
+        kind, arrays = 'dict', data
+    else:
+        kind, arrays = 'array', {'values': data}
+    arrays = {k: np.asarray(a) for k, a in arrays.items()}
+    layout, size = _layout(arrays)
+
+    if backend == 'shm':
+        from multiprocessing import shared_memory
+
+        holder = shared_memory.SharedMemory(create=True, size=size)
+        name, buf = holder.name, holder.buf
+    else:
+        name = os.path.join(directory or tempfile.gettempdir(),
+                            'trendfc-%s.bin' % uuid.uuid4().hex)
+        holder = np.memmap(name, dtype=np.uint8, mode='w+', shape=(size,))
+        buf = holder
+    for key, view in _views(buf, layout, writeable=True).items():
+        view[...] = arrays[key]
+    if backend == 'mmap':
+        holder.flush()
+    _owned[name] = holder
+    return Dataset(name, backend, layout, kind, meta)
+
+
+def _close(holder):
+    if hasattr(holder, 'close'):
+        try:
+            holder.close()
+        except BufferError:
+            pass   # a view is still alive; the mapping goes with it
+
+
+def _detach(name):
+    """Drop this process's attachment of a dataset (not the publisher's
+    own mapping)."""
+    holder = _attached.pop(name, (None,))[0]
+    if os.getpid() != _pid:
+        _owned.pop(name, None)   # a forked worker's copy of the publisher's mapping
+    if holder is not None and holder is not _owned.get(name):
+        _close(holder)
+
+
+def release(dataset):
+    """Unmap a dataset in this process and, if it was published here,
+    delete it. Views handed out by attach() must not be used afterwards."""
+    name = dataset.name
+    _detach(name)
+    owned = _owned.pop(name, None)
+    if owned is not None:
+        _close(owned)
+        if dataset.backend == 'shm':
+            owned.unlink()
+        else:
+            os.remove(name)
+
+
+@atexit.register
+def _release_all():
+    if os.getpid() != _pid:
+        return
+    for name in list(_owned):
+        backend = 'mmap' if isinstance(_owned[name], np.memmap) else 'shm'
+        release(Dataset(name, backend, (), 'array'))
+
+
+def _resolve(value):
+    return value.attach() if isinstance(value, Dataset) else value
+
+
+def _call(fn, args, kwargs):
+    held = set(_attached)
+    try:
+        args = [_resolve(a) for a in args]
+        kwargs = {k: _resolve(v) for k, v in kwargs.items()}
+        return fn(*args, **kwargs)
+    finally:
+        for name in set(_attached) - held:
+            _detach(name)
+
+
+class SharedPool:
+    """Process pool whose tasks take Dataset handles as arguments.
+
+    submit() and map() work like ProcessPoolExecutor's, except that Dataset
+    arguments arrive in the task as the attached data. Datasets published
+    through the pool are released when it shuts down. max_workers=1 runs
+    tasks in this process, on the same views.
+    """
+
+    def __init__(self, max_workers=None, backend='shm', directory=None, mp_context=None):
+        self.max_workers = max_workers
+        self.backend = backend
+        self.directory = directory
+        self.datasets = []
+        self._executor = (None if max_workers == 1
+                          else ProcessPoolExecutor(max_workers, mp_context=mp_context))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        return False
+
+    def publish(self, data):
+        dataset = publish(data, self.backend, self.directory)
+        self.datasets.append(dataset)
+        return dataset
+
+    def release(self, dataset):
+        """Release a dataset before the pool shuts down (its tasks must be
+        done)."""
+        self.datasets = [d for d in self.datasets if d.name != dataset.name]
+        release(dataset)
+
+    def submit(self, fn, *args, **kwargs):
+        if self._executor is not None:
+            return self._executor.submit(_call, fn, args, kwargs)
+        future = Future()
+        try:
+            future.set_result(_call(fn, args, kwargs))
+        except BaseException as exc:
+            future.set_exception(exc)
+        return future
+
+    def map(self, fn, *iterables):
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return (f.result() for f in futures)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+        for dataset in self.datasets:
+            release(dataset)
+        self.datasets = []
@@ -0,0 +1,82 @@
+# Compact integer signal encoding
+#
+# Labels and signals are int8 instead of object-dtype strings:
+#
+#   direction / ml_predict   UP = 1, DOWN = -1 (0 = no label)
+#   Signal, momentum_signal,
+#   final_signal             1, 0, -1 (a missing Signal counts as 0)
+#
+# Both six-way np.select rules of the script are the same 3x3 table: the
+# first input decides the side, the second has to agree with it.
+#
+#                  second: DOWN/-1   none/0   UP/1
+#   first  -1                -1        0        0
+#   first   0                 0        0        0
+#   first   1                 0        0        1
+#
+# so combining two encoded arrays is a single gather into that table.
+
+import numpy as np
+
+UP = 1
+DOWN = -1
+
+LABEL_CODES = {'UP': UP, 'DOWN': DOWN}
+LABEL_NAMES = np.array(['DOWN', '', 'UP'], dtype=object)
+
+AGREE = np.array([[-1, 0, 0],
+                  [0, 0, 0],
+                  [0, 0, 1]], dtype=np.int8)
+
+# the same table as nested tuples for scalar (per-bar) lookups
+AGREE_ROWS = tuple(tuple(int(v) for v in row) for row in AGREE)
+
+
+def encode_labels(labels):
+    """int8 codes for 'UP'/'DOWN' labels; integer labels pass through and
+    float ones (e.g. a Signal column) map NaN to 0."""
+    arr = np.asarray(labels)
+    if arr.dtype.kind in 'iub':
+        return arr.astype(np.int8, copy=False)
+    if arr.dtype.kind == 'f':
+        return np.nan_to_num(arr, nan=0.).astype(np.int8)
+    return np.where(arr == 'UP', UP, np.where(arr == 'DOWN', DOWN, 0)).astype(np.int8)
+
+
+def encode_label(label):
+    """Scalar version of encode_labels() (unknown strings map to 0)."""
+    return LABEL_CODES.get(label, 0) if isinstance(label, str) else int(label)
+
+
+def decode_labels(codes):
+    """Back to 'UP'/'DOWN' strings (e.g. for reports)."""
+    return LABEL_NAMES[np.asarray(codes, dtype=np.intp) + 1]
+
+
+def encode_signal(signal):
+    """int8 codes for a -1/0/1 float signal; NaN (no signal yet) becomes 0."""
+    return np.nan_to_num(np.asarray(signal, dtype=np.float64), nan=0.).astype(np.int8)
+
+
+def direction(pct_change):
+    """UP where the return is positive, else DOWN (NaN counts as DOWN, like
+    np.where(pct > 0, 'UP', 'DOWN'))."""
+    return np.where(np.asarray(pct_change) > 0, UP, DOWN).astype(np.int8)
+
+
+def combine(first, second):
+    """AGREE[first, second] for encoded arrays, as one gather."""
+    first = encode_labels(first)
+    second = encode_labels(second)
+    idx = (first.astype(np.intp) + 1) * 3 + (second.astype(np.intp) + 1)
+    return AGREE.ravel().take(idx)
+
+
+def momentum_signal(signal, direction_codes):
+    """opens['momentum_signal']: crossover Signal confirmed by direction."""
+    return combine(signal, direction_codes)
+
+
+def final_signal(momentum, ml_predict):
+    """fin_mod['final_signal']: momentum signal confirmed by the classifier."""
+    return combine(momentum, ml_predict)
@@ -0,0 +1,204 @@
+# Resampling significance tests of a backtest
+#
+#   table = significance(trades['long'], px, point_value=50., n_resamples=10000)
+#
+# The script judges the strategy by one strat_pct_return next to one
+# buyhold_pct_return. Here the trade log is resampled thousands of times to
+# see how much of that figure is luck:
+#
+#   bootstrap     trades drawn i.i.d. with replacement
+#   block         contiguous blocks of trades (montecarlo.simulate_returns),
+#                 keeping streaks of wins and losses together
+#   random_entry  the same holding periods, shuffled, and the flat time in
+#                 between split at random over the price series: the null
+#                 of a strategy with the same exposure and no timing skill.
+#                 Each random trade pays the costs of the logged trade whose
+#                 holding period it takes: the difference between the
+#                 trade's move at the quoted fill prices and its logged pnl,
+#                 i.e. slippage (fixed and variable), tick rounding and fees
+#                 as fills.fill_trades charged them
+#
+# Each resample is one column of an (n_trades, n_resamples) pnl matrix (the
+# analytics.py layout), so total pnl, Sharpe ratio and max drawdown of every
+# resample are a few reductions along axis 0. Resamples are generated in
+# chunks of at most CHUNK_CELLS values, each with its own child seed. From
+# PARALLEL_CHUNKS chunks on (a few seconds of work) they are spread over
+# n_jobs processes (joblib); fewer run in this process, as starting the
+# workers would cost more than it saves. The chunk layout depends on the
+# data only, so a seed gives the same result for any n_jobs.
+#
+# p-values: for the bootstrap methods, of the hypothesis that the statistic
+# is no better than the benchmark (buy-and-hold pnl and drawdown over
+# benchmark_px - the raw open, as in runner.summarize's buyhold_pnl_usd -
+# and a Sharpe ratio of 0), from the bootstrap distribution shifted onto the
+# benchmark; for random_entry, the share of random strategies doing at
+# least as well. The bands are percentile intervals of the resamples. With
+# fewer than MIN_TRADES trades there is nothing to resample and every
+# column but `observed` is NaN.
+
+import os
+
+import numpy as np
+
+from .analytics import DIRECTIONS, drawdowns
+from .instrument import instrumented
+from .montecarlo import simulate_returns
+
+METHODS = ('bootstrap', 'block', 'random_entry')
+STATISTICS = ('total_usd', 'sharpe', 'max_drawdown_usd')
+CHUNK_CELLS = 1 << 22
+PARALLEL_CHUNKS = 16
+MIN_TRADES = 2
+
+SIGNIFICANCE_COLUMNS = ['method', 'statistic', 'observed', 'benchmark', 'mean', 'lower',
+                        'upper', 'p_value', 'resamples']
+
+
+def pnl_stats(pnl):
+    """{statistic: value per column} of an (n_trades, n_cols) pnl matrix:
+    total, per-trade Sharpe ratio (mean / std) and max drawdown."""
+    n = pnl.shape[0]
+    total = pnl.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if n > 1:
+            sharpe = (total / n) / pnl.std(axis=0, ddof=1)
+        else:
+            sharpe = np.full(pnl.shape[1], np.nan)
+    if n:
+        max_dd = drawdowns(np.cumsum(pnl, axis=0)).min(axis=0)
+    else:
+        max_dd = np.zeros(pnl.shape[1])
+    return {'total_usd': total, 'sharpe': sharpe, 'max_drawdown_usd': max_dd}
+
+
+def random_entry_pnl(px, holds, n_resamples, direction='long', cost=0., rng=None):
+    """(n_trades, n_resamples) pnl (points) of trades with the given holding
+    periods (bars) placed in random order at random non-overlapping
+    positions of px, each paying cost (a number, or one per holding period
+    that moves with it)."""
+    rng = rng if rng is not None else np.random.default_rng()
+    holds = np.asarray(holds, dtype=np.intp)
+    n = len(holds)
+    flat = len(px) - 1 - int(holds.sum())
+    if flat < 0:
+        raise ValueError('holding periods exceed the price series')
+
+    shuffle = rng.permuted(np.broadcast_to(np.arange(n), (n_resamples, n)), axis=1).T
+    order = holds[shuffle]
+    if np.ndim(cost):
+        cost = np.asarray(cost, dtype=np.float64)[shuffle]
+    # flat bars before each trade: a uniform split of the flat time
+    gaps = rng.multinomial(flat, np.full(n + 1, 1. / (n + 1)), size=n_resamples).T[:n]
+    entry = np.cumsum(gaps, axis=0)
+    entry[1:] += np.cumsum(order, axis=0)[:-1]
+    return DIRECTIONS[direction] * (px[entry + order] - px[entry]) - cost
+
+
+def _chunk_stats(method, n, seed, pnl, block_size, px, holds, direction, cost, point_value):
+    rng = np.random.default_rng(seed)
+    if method == 'random_entry':
+        sample = random_entry_pnl(px, holds, n, direction, cost, rng)
+    else:
+        sample = simulate_returns(pnl, n, len(pnl), method, block_size, rng).T
+    return pnl_stats(sample * point_value)
+
+
+def trade_costs(trades, px, direction='long'):
+    """Points each trade of a log paid over its move at the prices px:
+    slippage, tick rounding and fees (0 for a cost-free log)."""
+    entry = np.asarray(trades['entry_idx'], dtype=np.intp)
+    exit_ = np.asarray(trades['exit_idx'], dtype=np.intp)
+    gross = DIRECTIONS[direction] * (px[exit_] - px[entry])
+    return gross - np.asarray(trades['pnl'], dtype=np.float64)
+
+
+def _forward_fill(px):
+    px = np.asarray(px, dtype=np.float64)
+    valid = np.isfinite(px)
+    if valid.all():
+        return px
+    if not valid.any():
+        raise ValueError('px has no valid prices')
+    idx = np.where(valid, np.arange(len(px)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    out = px[idx]
+    out[:np.argmax(valid)] = px[np.argmax(valid)]
+    return out
+
+
+@instrumented('significance')
+def significance(trades, px, point_value=1., direction='long', n_resamples=10000,
+                 methods=METHODS, block_size=10, confidence=0.95, seed=None, n_jobs=-1,
+                 benchmark_px=None):
+    """Bootstrap confidence bands and p-values of a backtest's total pnl,
+    Sharpe ratio and max drawdown.
+
+    trades is a filled trade log (fills.fill_trades, e.g. run_instrument's
+    trades['long']) and px the prices it was filled at before costs
+    (spec.fills.prices() of runner.backtest_instrument's Heikin-Ashi open);
+    direction is the log's. The random_entry trades are charged the log's
+    costs (see the module header). benchmark_px is the series held by the
+    buy-and-hold benchmark (default px; runner.summarize uses the raw
+    open). Returns one row
+    per (method, statistic) with the observed value, the benchmark, the
+    resample mean, the confidence band and the p-value (see the header).
+    """
+    import pandas as pd
+    from joblib import Parallel, delayed
+
+    for method in methods:
+        if method not in METHODS:
+            raise ValueError('method must be one of %s' % (METHODS,))
+    if direction not in DIRECTIONS:
+        raise ValueError("direction must be 'long' or 'short'")
+    px = _forward_fill(px)
+    pnl = np.asarray(trades['pnl'], dtype=np.float64)
+    holds = (np.asarray(trades['exit_idx']) - np.asarray(trades['entry_idx'])).astype(np.intp)
+    costs = trade_costs(trades, px, direction)
+
+    observed = {k: v[0] for k, v in pnl_stats(pnl[:, np.newaxis] * point_value).items()}
+    held = px if benchmark_px is None else _forward_fill(benchmark_px)
+    benchmark = {
+        'total_usd': (held[-1] - held[0]) * point_value,
+        'sharpe': 0.,
+        'max_drawdown_usd': (held - np.maximum.accumulate(held)).min() * point_value,
+    }
+
+    per_chunk = max(CHUNK_CELLS // max(len(pnl), 1), 1)
+    sizes = [min(per_chunk, n_resamples - i) for i in range(0, n_resamples, per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(methods) * len(sizes))
+    tasks = [(method, n, seeds[k * len(sizes) + i])
+             for k, method in enumerate(methods) for i, n in enumerate(sizes)]
+    if len(pnl) >= MIN_TRADES and tasks:
+        n_workers = os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs
+        parallel = len(tasks) >= PARALLEL_CHUNKS and n_workers > 1
+        results = Parallel(n_jobs=n_jobs if parallel else 1)(
+            delayed(_chunk_stats)(method, n, s, pnl, block_size, px, holds, direction,
+                                  costs, point_value)
+            for method, n, s in tasks)
+    else:
+        results = [None] * len(tasks)
+
+    alpha = (1 - confidence) / 2
+    rows = []
+    for method in methods:
+        chunks = [r for (m, _, _), r in zip(tasks, results) if m == method and r is not None]
+        for name in STATISTICS:
+            obs = observed[name]
+            if chunks:
+                values = np.concatenate([c[name] for c in chunks])
+                values = values[np.isfinite(values)]
+            else:
+                values = np.zeros(0)
+            row = dict(method=method, statistic=name, observed=obs, resamples=len(values),
+                       benchmark=np.nan if method == 'random_entry' else benchmark[name])
+            if len(values) and np.isfinite(obs):
+                if method == 'random_entry':
+                    better = values >= obs
+                else:
+                    better = values - obs + row['benchmark'] >= obs
+                lower, upper = np.quantile(values, [alpha, 1 - alpha])
+                row.update(mean=values.mean(), lower=lower, upper=upper,
+                           p_value=(1 + better.sum()) / (1 + len(values)))
+            rows.append(row)
+    return pd.DataFrame(rows, columns=SIGNIFICANCE_COLUMNS)
@@ -0,0 +1,224 @@
+# Content-addressed cache of pipeline stages
+#
+#   cache = StageCache('stage_cache', max_bytes=2 << 30)
+#   result = run_pipeline(ES, store, cache=cache)
+#
+# A stage's output is stored under a key that hashes everything it is
+# computed from: the stage name, its parameters, the keys of its inputs and
+# the source code it runs (code_hash of the stage function and the modules
+# doing its work). Inputs produced by an earlier stage are identified by
+# that stage's key, so raw data (the bars, see fingerprint()) is hashed
+# once and a change anywhere - new bars, another seed, an edited
+# integrate_signals - changes the keys of exactly the stages downstream of
+# it. Those miss and are recomputed; everything upstream is read back.
+#
+# Entries are directories <root>/<key>/. DataFrames and Series anywhere in
+# an output (also inside dicts, lists and tuples) are written as Arrow /
+# Feather files and memory-mapped on read; the rest of the output (fitted
+# models, scalars) is a joblib pickle with placeholders for those files.
+# Entries are written to a temporary directory and renamed, so a reader
+# never sees half an entry. A hit touches the entry, and after every write
+# the least recently used entries are deleted until the cache is within
+# max_bytes / max_entries.
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+SKELETON_FILE = 'value.joblib'
+
+
+class _Missing:
+    def __repr__(self):
+        return 'MISSING'
+
+
+MISSING = _Missing()
+
+
+def fingerprint(value):
+    """Hex digest of a DataFrame, Series or array's contents (labels and
+    dtypes included), or of any JSON-serialisable value."""
+    import pandas as pd
+
+    h = hashlib.sha1()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        h.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        columns = list(value.columns) if isinstance(value, pd.DataFrame) else [value.name]
+        dtypes = value.dtypes.astype(str).tolist() if isinstance(value, pd.DataFrame) \
+            else [str(value.dtype)]
+        h.update(repr((columns, dtypes, list(value.index.names))).encode())
+    elif isinstance(value, np.ndarray):
+        h.update(repr((value.dtype.str, value.shape)).encode())
+        h.update(np.ascontiguousarray(value).tobytes())
+    else:
+        h.update(json.dumps(value, sort_keys=True, default=repr).encode())
+    return h.hexdigest()
+
+
+def code_hash(*objects):
+    """Hex digest of the source code of functions, classes or modules."""
+    h = hashlib.sha1()
+    for obj in objects:
+        h.update(inspect.getsource(obj).encode())
+    return h.hexdigest()
+
+
+class _Frame:
+    """Placeholder for a DataFrame / Series stored as a Feather file."""
+
+    def __init__(self, file, series=False, name=None):
+        self.file = file
+        self.series = series
+        self.name = name
+
+
+def _dump(value, path, files):
+    import pandas as pd
+
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        import pyarrow as pa
+        from pyarrow import feather
+
+        series = isinstance(value, pd.Series)
+        file = '%d.feather' % len(files)
+        try:
+            table = pa.Table.from_pandas(value.to_frame('value') if series else value)
+            feather.write_feather(table, os.path.join(path, file))
+        except (TypeError, ValueError):
+            return value   # e.g. non-string column labels or mixed objects: pickled
+        files.append(file)
+        return _Frame(file, series, value.name if series else None)
+    if isinstance(value, dict):
+        return {k: _dump(v, path, files) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) and type(value) in (list, tuple):
+        return type(value)(_dump(v, path, files) for v in value)
+    return value
+
+
+def _load(value, path):
+    if isinstance(value, _Frame):
+        from pyarrow import feather
+
+        df = feather.read_table(os.path.join(path, value.file), memory_map=True).to_pandas()
+        return df['value'].rename(value.name) if value.series else df
+    if isinstance(value, dict):
+        return {k: _load(v, path) for k, v in value.items()}
+    if isinstance(value, (list, tuple)) and type(value) in (list, tuple):
+        return type(value)(_load(v, path) for v in value)
+    return value
+
+
+class StageCache:
+    """On-disk store of stage outputs keyed by StageCache.key()."""
+
+    def __init__(self, root, max_bytes=None, max_entries=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key(name, params=None, inputs=(), code=''):
+        """Key of stage `name` run with params (JSON-serialisable) on the
+        outputs with keys `inputs`, by the code with hash `code`."""
+        h = hashlib.sha1()
+        h.update(json.dumps([name, params, list(inputs), code], sort_keys=True,
+                            default=repr).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def __contains__(self, key):
+        return os.path.exists(os.path.join(self.path(key), SKELETON_FILE))
+
+    def get(self, key):
+        """The stored output, or MISSING."""
+        import joblib
+
+        path = self.path(key)
+        try:
+            skeleton = joblib.load(os.path.join(path, SKELETON_FILE))
+            value = _load(skeleton, path)
+            os.utime(path)
+        except (OSError, EOFError):
+            return MISSING   # not stored, or evicted by another process meanwhile
+        return value
+
+    def put(self, key, value):
+        import joblib
+
+        path = self.path(key)
+        tmp = '%s.tmp-%s' % (path, uuid.uuid4().hex)
+        os.makedirs(tmp)
+        try:
+            joblib.dump(_dump(value, tmp, []), os.path.join(tmp, SKELETON_FILE))
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=key)
+
+    def run(self, name, func, *args, params=None, inputs=(), code='', **kwargs):
+        """(key, output) of func(*args, **kwargs), read from the cache when
+        an entry with the same key exists."""
+        key = self.key(name, params, inputs, code)
+        value = self.get(key)
+        if value is MISSING:
+            self.misses += 1
+            value = func(*args, **kwargs)
+            self.put(key, value)
+        else:
+            self.hits += 1
+        return key, value
+
+    def entries(self):
+        """[(key, bytes, last use)] of the stored entries, least recent first."""
+        out = []
+        for key in os.listdir(self.root):
+            path = self.path(key)
+            if '.tmp-' in key or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(path))
+                out.append((key, size, os.stat(path).st_mtime))
+            except OSError:
+                continue
+        return sorted(out, key=lambda e: e[2])
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """Delete least recently used entries (never `keep`) until within
+        max_bytes and max_entries. Returns the deleted keys."""
+        if self.max_bytes is None and self.max_entries is None:
+            return []
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        count = len(entries)
+        deleted = []
+        for key, size, _ in entries:
+            if ((self.max_bytes is None or total <= self.max_bytes)
+                    and (self.max_entries is None or count <= self.max_entries)):
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.path(key), ignore_errors=True)
+            total -= size
+            count -= 1
+            deleted.append(key)
+        return deleted
+
+    def clear(self):
+        for key, _, _ in self.entries():
+            shutil.rmtree(self.path(key), ignore_errors=True)
@@ -0,0 +1,287 @@
+# Batched stationarity screening (ADF, optionally KPSS)
+#
+#   screen(data_open[['hadf_pct_change', 'hadf_log_return']], kpss=True)
+#   screen({'ES': es_returns, 'GE': ge_returns}, window=1000, step=250)
+#
+# statsmodels' adfuller(autolag='AIC') fits one OLS per candidate lag order
+# on the same sample. Those regressions are nested (the model with k lags
+# uses the first columns of the model with k + 1), so here the design matrix
+# [trend terms, level, dx lags 1..maxlag | dx] is QR-factorised once and the
+# residual sum of squares of every lag order is read off the last column of
+# R; only the chosen order is refitted for its t-statistic. The lag columns
+# of a series are slices of its differenced values, shared by every rolling
+# window, and long samples are factorised in row chunks so memory stays
+# bounded. Statistics, p-values and critical values match adfuller's.
+#
+# Each (window values, parameters) result is cached under a hash of the data,
+# so a nightly run over the universe only computes windows it has not seen.
+
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+
+from .instrument import instrumented
+
+TREND_TERMS = {'n': 0, 'c': 1, 'ct': 2, 'ctt': 3}
+AUTOLAGS = ('AIC', 'BIC', None)
+CHUNK_ROWS = 65536
+
+ADF_COLUMNS = ['nobs', 'adf_stat', 'adf_pvalue', 'used_lag', 'ic_best',
+               'crit_1%', 'crit_5%', 'crit_10%']
+KPSS_COLUMNS = ['kpss_stat', 'kpss_pvalue', 'kpss_lags']
+
+
+def default_maxlag(nobs, regression='c'):
+    """adfuller's default maximum lag order for a series of nobs values."""
+    maxlag = int(np.ceil(12. * np.power(nobs / 100., 1 / 4.)))
+    return min(nobs // 2 - TREND_TERMS[regression] - 1, maxlag)
+
+
+def _design(x, dx, j0, j1, n_lags, n_trend, shift):
+    """Rows j0..j1 of [trend terms, level, dx lags 1..n_lags, dx] (dx
+    positions, i.e. dx[j] is regressed on x[j] and dx[j-1], dx[j-2], ...)."""
+    out = np.empty((j1 - j0, n_trend + n_lags + 2))
+    if n_trend:
+        t = np.arange(j0, j1) / len(x)
+        out[:, 0] = 1.
+        for k in range(1, n_trend):
+            out[:, k] = t ** k
+    out[:, n_trend] = x[j0:j1] - shift
+    for k in range(1, n_lags + 1):
+        out[:, n_trend + k] = dx[j0 - k:j1 - k]
+    out[:, -1] = dx[j0:j1]
+    return out
+
+
+def _qr_r(x, dx, j0, j1, n_lags, n_trend, shift):
+    """R of the QR factorisation of the augmented design over dx rows
+    j0..j1, accumulated CHUNK_ROWS rows at a time."""
+    r = None
+    for start in range(j0, j1, CHUNK_ROWS):
+        block = _design(x, dx, start, min(start + CHUNK_ROWS, j1), n_lags, n_trend, shift)
+        r = np.linalg.qr(block if r is None else np.vstack([r, block]), mode='r')
+    return r
+
+
+def _information_criteria(r, nobs, first, method):
+    """AIC / BIC of every nested model with first..p columns, from R."""
+    p = r.shape[1] - 1
+    qty = r[:p, p]
+    tail = np.append(np.cumsum((qty ** 2)[::-1])[::-1], 0.)
+    ssr = r[p, p] ** 2 + tail[first:]
+    k = np.arange(first, p + 1)
+    llf = -nobs / 2. * (np.log(2 * np.pi) + np.log(ssr / nobs) + 1)
+    penalty = 2. * k if method == 'AIC' else np.log(nobs) * k
+    return -2 * llf + penalty
+
+
+def _level_tstat(r, nobs, level):
+    """t-statistic of the level coefficient from R of the augmented design."""
+    from scipy.linalg import solve_triangular
+
+    p = r.shape[1] - 1
+    rx = r[:p, :p]
+    coef = solve_triangular(rx, r[:p, p])
+    rinv = solve_triangular(rx, np.eye(p))
+    return coef[level] / np.sqrt(r[p, p] ** 2 / (nobs - p) * (rinv[level] ** 2).sum())
+
+
+def _adf_window(x, dx, start, stop, regression, maxlag, autolag):
+    """ADF on x[start:stop] (x and dx are the whole series)."""
+    from statsmodels.tsa.adfvalues import mackinnoncrit, mackinnonp
+
+    n_trend = TREND_TERMS[regression]
+    window = x[start:stop]
+    if window.max() == window.min():
+        raise ValueError('Invalid input, x is constant')
+    nobs = stop - start
+    if maxlag is None:
+        maxlag = default_maxlag(nobs, regression)
+    if maxlag < 0 or maxlag > nobs // 2 - n_trend - 1:
+        raise ValueError('window of %d values is too short for maxlag %d' % (nobs, maxlag))
+    # with a constant in the model the level column can be shifted freely;
+    # centring it keeps R well conditioned
+    shift = window.mean() if n_trend else 0.
+    last = stop - 1   # dx has one value fewer than x
+
+    icbest = np.nan
+    used = maxlag
+    if autolag is not None:
+        # every lag order on the common sample of the largest one
+        r = _qr_r(x, dx, start + maxlag, last, maxlag, n_trend, shift)
+        ic = _information_criteria(r, last - start - maxlag, n_trend + 1, autolag)
+        used = int(np.argmin(ic))
+        icbest = float(ic[used])
+
+    n = last - start - used
+    r = _qr_r(x, dx, start + used, last, used, n_trend, shift)
+    stat = float(_level_tstat(r, n, n_trend))
+    crit = mackinnoncrit(N=1, regression=regression, nobs=n)
+    return {'nobs': n, 'adf_stat': stat,
+            'adf_pvalue': float(mackinnonp(stat, regression=regression, N=1)),
+            'used_lag': used, 'ic_best': icbest,
+            'crit_1%': float(crit[0]), 'crit_5%': float(crit[1]), 'crit_10%': float(crit[2])}
+
+
+def adf(x, maxlag=None, regression='c', autolag='AIC'):
+    """Augmented Dickey-Fuller test of one series.
+
+    Same arguments and results as statsmodels' adfuller (regression in
+    'n', 'c', 'ct', 'ctt'; autolag 'AIC', 'BIC' or None), returned as a
+    dict with the ADF_COLUMNS keys.
+    """
+    if autolag is not None:
+        autolag = autolag.upper()
+    if regression not in TREND_TERMS or autolag not in AUTOLAGS:
+        raise ValueError('unsupported regression %r / autolag %r' % (regression, autolag))
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    return _adf_window(x, np.diff(x), 0, len(x), regression, maxlag, autolag)
+
+
+def kpss(x, regression='c', nlags='auto'):
+    """KPSS test (statsmodels) as a dict with the KPSS_COLUMNS keys.
+    Statistics outside the p-value table get the table's end value."""
+    from statsmodels.tsa.stattools import kpss as _kpss
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        stat, pvalue, lags = _kpss(np.asarray(x, dtype=np.float64), regression=regression,
+                                   nlags=nlags)[:3]
+    return {'kpss_stat': float(stat), 'kpss_pvalue': float(pvalue), 'kpss_lags': int(lags)}
+
+
+def rolling_windows(n, window=None, step=None):
+    """(start, stop) of the windows screened in a series of length n: the
+    whole series, or every full window of the given length starting at 0,
+    step, 2 * step, ... (default: non-overlapping). New bars only add
+    windows, so earlier ones stay cached."""
+    if window is None or window >= n:
+        return [(0, n)]
+    return [(a, a + window) for a in range(0, n - window + 1, step or window)]
+
+
+def window_key(values, params):
+    """Cache key of one window: a hash of its float64 bytes and the test
+    parameters."""
+    h = hashlib.sha1(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+    h.update(json.dumps(params, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """Screening results keyed by window_key(); kept in memory and, when a
+    path is given, appended to a JSON-lines file reloaded on the next run."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.results = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    key, row = json.loads(line)
+                    self.results[key] = row
+
+    def get(self, key):
+        return self.results.get(key)
+
+    def update(self, items):
+        self.results.update(items)
+        if self.path and items:
+            with open(self.path, 'a') as f:
+                for key, row in items.items():
+                    f.write(json.dumps([key, row]) + '\n')
+
+
+def _screen_block(values, windows, params):
+    x = np.ascontiguousarray(values, dtype=np.float64)
+    dx = np.diff(x)
+    rows = []
+    for start, stop in windows:
+        try:
+            row = _adf_window(x, dx, start, stop, params['regression'], params['maxlag'],
+                              params['autolag'])
+        except (ValueError, np.linalg.LinAlgError):
+            row = dict.fromkeys(ADF_COLUMNS, np.nan)
+            row['nobs'] = stop - start
+        if params['kpss']:
+            try:
+                row.update(kpss(x[start:stop], params['kpss_regression']))
+            except ValueError:
+                row.update(dict.fromkeys(KPSS_COLUMNS, np.nan))
+        rows.append(row)
+    return rows
+
+
+def _named_series(series):
+    if isinstance(series, dict):
+        return list(series.items())
+    if hasattr(series, 'columns'):
+        return [(name, series[name]) for name in series.columns]
+    return [(getattr(series, 'name', None) or 'series', series)]
+
+
+@instrumented('adf')
+def screen(series, window=None, step=None, kpss=False, regression='c', maxlag=None,
+           autolag='AIC', kpss_regression=None, alpha=0.05, n_jobs=-1, cache=None):
+    """Stationarity screen of many series, whole or in rolling windows.
+
+    series is a Series, a DataFrame (one series per column) or a dict of
+    name -> Series / array; NaNs are dropped. Every window gets the ADF
+    results (see adf()), the KPSS ones when kpss=True (kpss_regression
+    defaults to regression, 'c' or 'ct'), and a `stationary` flag: ADF
+    rejects a unit root at alpha and, with KPSS, KPSS does not reject
+    stationarity. Windows are spread over n_jobs processes (joblib, -1 for
+    one per CPU); cache is a ResultCache for results already computed.
+    Returns one row per (series, window).
+    """
+    import pandas as pd
+    from joblib import Parallel, delayed
+
+    if autolag is not None:
+        autolag = autolag.upper()
+    if regression not in TREND_TERMS or autolag not in AUTOLAGS:
+        raise ValueError('unsupported regression %r / autolag %r' % (regression, autolag))
+    if n_jobs != -1 and not (isinstance(n_jobs, (int, np.integer)) and n_jobs >= 1):
+        raise ValueError('n_jobs must be -1 or at least 1, got %r' % (n_jobs,))
+    params = dict(regression=regression, maxlag=maxlag, autolag=autolag, kpss=bool(kpss),
+                  kpss_regression=kpss_regression or ('ct' if regression == 'ct' else 'c'))
+
+    tasks, found, meta = [], {}, []
+    for name, values in _named_series(series):
+        s = pd.Series(values).dropna()
+        x = s.to_numpy(dtype=np.float64)
+        windows = rolling_windows(len(x), window, step)
+        keys = [window_key(x[a:b], params) for a, b in windows]
+        for (a, b), key in zip(windows, keys):
+            meta.append((name, s.index[a] if b > a else None,
+                         s.index[b - 1] if b > a else None, key))
+            if cache is not None and cache.get(key) is not None:
+                found[key] = cache.get(key)
+        todo = [(w, k) for w, k in zip(windows, keys) if k not in found]
+        if todo:
+            n_blocks = max(1, min(len(todo), os.cpu_count() if n_jobs == -1 else n_jobs))
+            for block in np.array_split(np.arange(len(todo)), n_blocks):
+                if len(block):
+                    tasks.append((x, [todo[i] for i in block]))
+
+    if tasks:
+        results = Parallel(n_jobs=n_jobs if len(tasks) > 1 else 1)(
+            delayed(_screen_block)(x, [w for w, _ in block], params) for x, block in tasks)
+        computed = {key: row for (_, block), rows in zip(tasks, results)
+                    for (_, key), row in zip(block, rows)}
+        found.update(computed)
+        if cache is not None:
+            cache.update(computed)
+
+    frame = pd.DataFrame([dict(series=name, start=start, end=end, **found[key])
+                          for name, start, end, key in meta])
+    columns = ['series', 'start', 'end'] + ADF_COLUMNS + (KPSS_COLUMNS if kpss else [])
+    frame = frame.reindex(columns=columns)
+    stationary = frame['adf_pvalue'] < alpha
+    if kpss:
+        stationary &= frame['kpss_pvalue'] > alpha
+    frame['stationary'] = stationary
+    return frame
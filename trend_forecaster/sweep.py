@@ -0,0 +1,130 @@
+# Parameter sweep of the moving-average crossover backtest
+#
+# Every (fast, slow, direction) combination of a chunk is simulated in one
+# crossover.trade_records call (the native equivalent of a broadcasted
+# vbt.Portfolio.from_signals): the crossover masks of all window pairs and
+# both directions are stacked side by side as columns.
+# Slippage does not change the signals (it is applied to the trade log), so
+# the slippage grid is expanded afterwards on the trade records, again as
+# one vectorized trade_stats() call over all columns.
+# With a shared.SharedPool the chunks run in its workers, which read the
+# price series from one published copy.
+
+import itertools
+
+import numpy as np
+
+from .analytics import DIRECTIONS, pnl_matrix, trade_stats
+from .instrument import instrumented
+
+INIT_CASH = 100000.
+TRADE_SIZE = 1
+
+# rough bytes per bar per column held while a chunk runs (MA outputs, the
+# stacked masks and the signal scan over them)
+BYTES_PER_CELL = 64
+
+
+def window_pairs(fast_windows, slow_windows):
+    """All (fast, slow) combinations with fast < slow."""
+    return [(f, s) for f, s in itertools.product(fast_windows, slow_windows) if f < s]
+
+
+def chunk_columns(n_bars, max_memory=None, chunk_size=None):
+    """Number of window pairs per trade_records call."""
+    if chunk_size is not None:
+        return max(int(chunk_size), 1)
+    if max_memory is None:
+        return None
+    # two directions per window pair
+    return max(int(max_memory // (n_bars * BYTES_PER_CELL * 2)), 1)
+
+
+def _masks(px, pairs, ewm):
+    # crossover imports the bar store (and with it pandas), which the
+    # package's eager import of this module must not pull in
+    from .crossover import crossover_masks
+
+    if not ewm:
+        masks = [crossover_masks(px, f, s) for f, s in pairs]
+        return (np.column_stack([m[0] for m in masks]),
+                np.column_stack([m[1] for m in masks]))
+    import vectorbt as vbt
+
+    fast_ma = vbt.MA.run(px, [f for f, _ in pairs], short_name='fast', ewm=True)
+    slow_ma = vbt.MA.run(px, [s for _, s in pairs], short_name='slow', ewm=True)
+    return (fast_ma.ma_crossed_above(slow_ma).to_numpy(),
+            fast_ma.ma_crossed_below(slow_ma).to_numpy())
+
+
+def _run_chunk(px, pairs, directions, ewm):
+    from .crossover import trade_records
+
+    above, below = _masks(np.asarray(px, dtype=np.float64), pairs, ewm)
+
+    # as in the script, shorts are the mirrored long-only portfolio
+    masks = {'long': (above, below), 'short': (below, above)}
+    entries = np.hstack([masks[d][0] for d in directions])
+    exits = np.hstack([masks[d][1] for d in directions])
+    return trade_records(px, entries, exits, INIT_CASH, TRADE_SIZE)
+
+
+@instrumented('backtest')
+def sweep(px, fast_windows, slow_windows, slippages=(0.,), directions=('long', 'short'),
+          point_value=1., ewm=False, chunk_size=None, max_memory=None,
+          rank_by='total_usd', pool=None):
+    """Backtest the crossover strategy over a grid of parameters.
+
+    px is the price series traded (the Heikin-Ashi open in the script).
+    Work is split into chunks of window pairs, either chunk_size pairs at a
+    time or as many as fit in max_memory bytes; by default the whole grid
+    runs in a single call. With a shared.SharedPool the chunks run in
+    parallel in its workers. Returns one row per (fast, slow, direction,
+    slippage) combination with the trade_stats() columns, ranked by rank_by
+    (descending).
+    """
+    import pandas as pd
+
+    directions = list(directions)
+    slippages = np.asarray(slippages, dtype=np.float64)
+    pairs = window_pairs(fast_windows, slow_windows)
+    if not pairs:
+        raise ValueError('no (fast, slow) window pair with fast < slow')
+
+    step = chunk_columns(len(px), max_memory, chunk_size) or len(pairs)
+    chunks = [pairs[start:start + step] for start in range(0, len(pairs), step)]
+    if pool is None:
+        results = (_run_chunk(px, chunk, directions, ewm) for chunk in chunks)
+    else:
+        data = pool.publish(np.asarray(px, dtype=np.float64))
+        futures = []
+        try:
+            futures = [pool.submit(_run_chunk, data, chunk, directions, ewm)
+                       for chunk in chunks]
+            results = [f.result() for f in futures]
+        finally:
+            for f in futures:
+                f.cancel()   # after a failed chunk, the ones not started yet
+            pool.release(data)
+
+    frames = []
+    for chunk, records in zip(chunks, results):
+        n_cols = len(chunk) * len(directions)
+
+        # gross pnl in points (sign flipped for the mirrored short columns),
+        # then every slippage value at once: slippage is paid on entry and
+        # exit in either direction
+        signs = np.repeat([DIRECTIONS[d] for d in directions], len(chunk))
+        gross = pnl_matrix(records, 0., 'long', n_cols=n_cols) * signs
+        net = gross[:, :, np.newaxis] - 2 * slippages
+        stats = trade_stats(net.reshape(len(net), -1), point_value * TRADE_SIZE)
+
+        params = pd.DataFrame(
+            [(f, s, d, slip) for d in directions for f, s in chunk for slip in slippages],
+            columns=['fast', 'slow', 'direction', 'slippage'])
+        frames.append(pd.concat([params, stats], axis=1))
+
+    results = pd.concat(frames, ignore_index=True)
+    results = results.sort_values(rank_by, ascending=False, kind='stable')
+    results.insert(0, 'rank', np.arange(1, len(results) + 1))
+    return results.reset_index(drop=True)
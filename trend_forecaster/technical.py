@@ -0,0 +1,355 @@
+# Technical feature library
+#
+#   store = technical_features(es_bars)              # a FeatureStore
+#   X = store.frame(TechnicalConfig().features)      # classifier inputs
+#   stream = TechnicalStream.from_history(es_bars)   # the live path
+#   row = stream.update(bar)                         # the same columns
+#
+# The classifiers only see open_hadf and EMA_5. technical_features() adds a
+# configurable set of features around them and writes them all into one
+# FeatureStore block. The Heikin-Ashi conversion, the close log returns and
+# the true range are computed once and shared. Exponential averages (EMAs,
+# Wilder's RSI / ATR smoothing) are linear filters and rolling volatilities
+# come from cumulative sums, so every feature is O(n) whatever its window:
+#
+#   EMA_<span>        ewm(span, adjust=False) of open_hadf
+#   volatility_<w>    rolling std (ddof=1) of close log returns over w bars
+#   rsi_<n>           Wilder RSI of close, 0..100
+#   atr_<n>           Wilder average true range
+#   log_return_<k>    close log return k bars back (0 = this bar)
+#   ha_body, ha_upper_wick, ha_lower_wick
+#                     HA candle body (signed) and wicks as fractions of its range
+#
+# The base columns (features.BASE_COLUMNS) come first, so FEATURES is still a
+# slice of the block. Rows follow the script's dropna(): the first bar and the
+# warm-up bars, where a volatility window or a return lag is not yet filled,
+# are left out. TechnicalStream keeps O(1) state per feature and produces the
+# same row for one new bar at a time.
+
+import math
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+
+from .features import BASE_COLUMNS, FeatureStore, ewm, fill_base_columns
+from .heikin_ashi import OHLC, HeikinAshiStream, heikin_ashi_arrays
+from .instrument import stage
+from .signals import DOWN, UP, direction
+
+HA_RATIOS = ['ha_body', 'ha_upper_wick', 'ha_lower_wick']
+BASE_SPANS = (1, 5)   # EMA_1 / EMA_5 of the base columns
+LABEL_SOURCES = ('hadf_pct_change', 'hadf_log_return')
+
+
+@dataclass(frozen=True)
+class TechnicalConfig:
+    """Which technical features to compute (on top of the base columns)."""
+
+    ema_spans: tuple = (10, 20, 50)
+    volatility_windows: tuple = (10, 20)
+    rsi_periods: tuple = (14,)
+    atr_periods: tuple = (14,)
+    return_lags: tuple = (0, 1, 2, 3, 4)
+    ha_ratios: bool = True
+
+    def __post_init__(self):
+        if min(self.ema_spans + self.rsi_periods + self.atr_periods, default=1) < 1:
+            raise ValueError('EMA spans and RSI / ATR periods must be >= 1')
+        if min(self.volatility_windows, default=2) < 2:
+            raise ValueError('volatility windows must be >= 2')
+        if min(self.return_lags, default=0) < 0:
+            raise ValueError('return lags must be >= 0')
+
+    @property
+    def extra_spans(self):
+        return tuple(s for s in self.ema_spans if s not in BASE_SPANS)
+
+    @property
+    def columns(self):
+        return (BASE_COLUMNS
+                + ['EMA_%d' % s for s in self.extra_spans]
+                + ['volatility_%d' % w for w in self.volatility_windows]
+                + ['rsi_%d' % n for n in self.rsi_periods]
+                + ['atr_%d' % n for n in self.atr_periods]
+                + ['log_return_%d' % k for k in self.return_lags]
+                + (HA_RATIOS if self.ha_ratios else []))
+
+    @property
+    def features(self):
+        """Columns usable as classifier inputs: all but hadf_pct_change /
+        hadf_log_return, which direction is derived from."""
+        return [c for c in self.columns if c not in LABEL_SOURCES]
+
+    @property
+    def warmup(self):
+        """Bars after the first one that are dropped before every feature
+        is defined."""
+        return max([w - 1 for w in self.volatility_windows] + list(self.return_lags) + [0])
+
+
+def rolling_std(x, window, ddof=1):
+    """x.rolling(window).std(ddof) from cumulative sums (NaN until the
+    first full window). x is centred first to limit cancellation."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(len(x), np.nan)
+    if len(x) < window:
+        return out
+    c = x - x.mean()
+    s1 = np.concatenate(([0.], np.cumsum(c)))
+    s2 = np.concatenate(([0.], np.cumsum(c * c)))
+    total = s1[window:] - s1[:-window]
+    var = (s2[window:] - s2[:-window] - total * total / window) / (window - ddof)
+    np.sqrt(np.maximum(var, 0.), out=out[window - 1:])
+    return out
+
+
+def rsi(gain_avg, loss_avg):
+    """RSI from Wilder-smoothed gains and losses (50 when both are 0)."""
+    total = gain_avg + loss_avg
+    out = np.full_like(total, 50.)
+    np.divide(100. * gain_avg, total, out=out, where=total > 0)
+    return out
+
+
+def true_range(high, low, close):
+    """max(high - low, |high - prev close|, |low - prev close|); the first
+    bar has no previous close and gets high - low."""
+    tr = high - low
+    prev = close[:-1]
+    tr[1:] = np.maximum(tr[1:], np.maximum(np.abs(high[1:] - prev), np.abs(low[1:] - prev)))
+    return tr
+
+
+def ha_ratios(ha_open, ha_high, ha_low, ha_close):
+    """(body, upper wick, lower wick) of HA candles as fractions of their
+    high - low range (0 for a flat candle)."""
+    scale = np.zeros_like(ha_open)
+    rng = ha_high - ha_low
+    np.divide(1., rng, out=scale, where=rng > 0)
+    return ((ha_close - ha_open) * scale,
+            (ha_high - np.maximum(ha_open, ha_close)) * scale,
+            (np.minimum(ha_open, ha_close) - ha_low) * scale)
+
+
+def technical_features(bars, config=None):
+    """FeatureStore of the base columns and config's technical features
+    (default TechnicalConfig()) for an OHLC DataFrame."""
+    config = config or TechnicalConfig()
+    columns = config.columns
+    with stage('features') as st:
+        o, h, l, c = (bars[k].to_numpy(dtype=np.float64) for k in OHLC)
+        ha_open, ha_high, ha_low, ha_close = heikin_ashi_arrays(o, h, l, c)
+        start = 1 + config.warmup   # first bar kept
+        n = max(len(o) - start, 0)
+        values = np.empty((n, len(columns)), order='F')
+        if n:
+            col = dict(zip(columns, values.T))
+            fill_base_columns(col, ha_open, o, BASE_SPANS, start)
+            for s in config.extra_spans:
+                col['EMA_%d' % s][:] = ewm(ha_open, s)[start:]
+
+            # close log returns; returns[i] belongs to bar i + 1
+            returns = np.log(c[1:] / c[:-1])
+            for w in config.volatility_windows:
+                col['volatility_%d' % w][:] = rolling_std(returns, w)[start - 1:]
+            for k in config.return_lags:
+                col['log_return_%d' % k][:] = returns[start - 1 - k:len(returns) - k]
+
+            if config.rsi_periods:
+                delta = c[1:] - c[:-1]
+                gain, loss = np.maximum(delta, 0.), np.maximum(-delta, 0.)
+                for p in config.rsi_periods:
+                    # Wilder's smoothing is an EMA with alpha = 1 / p
+                    col['rsi_%d' % p][:] = rsi(ewm(gain, 2 * p - 1),
+                                               ewm(loss, 2 * p - 1))[start - 1:]
+            if config.atr_periods:
+                tr = true_range(h, l, c)
+                for p in config.atr_periods:
+                    col['atr_%d' % p][:] = ewm(tr, 2 * p - 1)[start:]
+
+            if config.ha_ratios:
+                ratios = ha_ratios(ha_open, ha_high, ha_low, ha_close)
+                for name, arr in zip(HA_RATIOS, ratios):
+                    col[name][:] = arr[start:]
+        store = FeatureStore(values, columns,
+                             direction(values[:, columns.index('hadf_pct_change')]),
+                             bars.index[start:])
+        st.record(values)
+    return store
+
+
+class _Ewm:
+    """ewm(span, adjust=False) of a stream, same arithmetic as features.ewm."""
+
+    __slots__ = ('alpha', 'decay', 'value')
+
+    def __init__(self, span):
+        self.alpha = 2. / (span + 1)
+        self.decay = 1 - self.alpha
+        self.value = None
+
+    def update(self, x):
+        prev = x if self.value is None else self.value
+        self.value = self.alpha * x + self.decay * prev
+        return self.value
+
+
+class _RollingStd:
+    """Rolling std (ddof=1) over the last `window` pushed values. The sums
+    are kept around an anchor and recomputed whenever the window has been
+    replaced REFRESH times over, so rounding does not accumulate."""
+
+    REFRESH = 64
+
+    def __init__(self, window):
+        self.window = window
+        self.values = deque(maxlen=window)
+        self.anchor = None
+        self.s1 = self.s2 = 0.
+        self.count = 0
+
+    def push(self, x):
+        if self.anchor is None:
+            self.anchor = x
+        if len(self.values) == self.window:
+            old = self.values[0] - self.anchor
+            self.s1 -= old
+            self.s2 -= old * old
+        self.values.append(x)
+        d = x - self.anchor
+        self.s1 += d
+        self.s2 += d * d
+        self.count += 1
+        if self.count % (self.REFRESH * self.window) == 0:
+            self.anchor = math.fsum(self.values) / self.window
+            self.s1 = math.fsum(v - self.anchor for v in self.values)
+            self.s2 = math.fsum((v - self.anchor) ** 2 for v in self.values)
+
+    def std(self):
+        if len(self.values) < self.window:
+            return math.nan
+        w = self.window
+        return math.sqrt(max((self.s2 - self.s1 * self.s1 / w) / (w - 1), 0.))
+
+
+class TechnicalStream:
+    """Incremental technical_features(): one row per new raw OHLC bar.
+
+    update() returns a float64 array in `columns` order (direction is in
+    .direction). Rows before the batch's first one (the first bar and the
+    warm-up) have NaN where a feature is not defined yet; `ready` tells
+    whether the last row is complete.
+    """
+
+    def __init__(self, config=None):
+        self.config = config = config or TechnicalConfig()
+        self.columns = config.columns
+        self.ha = HeikinAshiStream()
+        self.emas = [_Ewm(s) for s in BASE_SPANS + config.extra_spans]
+        self.gains = [_Ewm(2 * p - 1) for p in config.rsi_periods]
+        self.losses = [_Ewm(2 * p - 1) for p in config.rsi_periods]
+        self.atrs = [_Ewm(2 * p - 1) for p in config.atr_periods]
+        self.vols = [_RollingStd(w) for w in config.volatility_windows]
+        self.returns = deque(maxlen=max(config.return_lags, default=0) + 1)
+        self.prev_open_hadf = None
+        self.prev_close = None
+        self.direction = None
+        self.bars_seen = 0
+
+    @property
+    def ready(self):
+        return self.bars_seen > 1 + self.config.warmup
+
+    @classmethod
+    def from_history(cls, bars, config=None):
+        """Stream whose state continues an OHLC history (vectorized
+        warm-up; the history's last bar is not returned again)."""
+        stream = cls(config)
+        if not len(bars):
+            return stream
+        config = stream.config
+        o, h, l, c = (bars[k].to_numpy(dtype=np.float64) for k in OHLC)
+        ha_open, _, _, ha_close = heikin_ashi_arrays(o, h, l, c)
+        stream.ha.prev_open = float(ha_open[-1])
+        stream.ha.prev_close = float(ha_close[-1])
+        for e, s in zip(stream.emas, BASE_SPANS + config.extra_spans):
+            e.value = float(ewm(ha_open, s)[-1])
+        if len(c) > 1:
+            delta = c[1:] - c[:-1]
+            gain, loss = np.maximum(delta, 0.), np.maximum(-delta, 0.)
+            for g, lo, p in zip(stream.gains, stream.losses, config.rsi_periods):
+                g.value = float(ewm(gain, 2 * p - 1)[-1])
+                lo.value = float(ewm(loss, 2 * p - 1)[-1])
+            returns = np.log(c[1:] / c[:-1])
+            tail = returns[-max((stream.returns.maxlen,) + config.volatility_windows):]
+            stream.returns.extend(float(r) for r in tail)
+            for v in stream.vols:
+                for r in tail[-v.window:]:
+                    v.push(float(r))
+        tr = true_range(h, l, c)
+        for a, p in zip(stream.atrs, config.atr_periods):
+            a.value = float(ewm(tr, 2 * p - 1)[-1])
+        stream.prev_open_hadf = float(ha_open[-1])
+        stream.prev_close = float(c[-1])
+        if len(ha_open) > 1:
+            stream.direction = UP if ha_open[-1] > ha_open[-2] else DOWN
+        stream.bars_seen = len(c)
+        return stream
+
+    def update(self, bar):
+        """Consume one raw OHLC bar (mapping or (o, h, l, c) tuple) and
+        return its feature row."""
+        if isinstance(bar, (tuple, list)):
+            o, h, l, c = (float(v) for v in bar)
+        else:
+            o, h, l, c = (float(bar[k]) for k in OHLC)
+        ha_open, ha_high, ha_low, ha_close = self.ha.update((o, h, l, c))
+        prev_hadf, prev_close = self.prev_open_hadf, self.prev_close
+        first = prev_close is None
+
+        out = [o, self.emas[0].update(ha_open), ha_open, self.emas[1].update(ha_open)]
+        if first:
+            out += [math.nan, math.nan]
+        else:
+            pct = ha_open / prev_hadf - 1
+            out += [pct, math.log(1 + pct)]
+        self.direction = UP if not first and ha_open > prev_hadf else DOWN
+        out += [e.update(ha_open) for e in self.emas[2:]]
+
+        if not first:
+            r = math.log(c / prev_close)
+            self.returns.append(r)
+            for v in self.vols:
+                v.push(r)
+        out += [v.std() for v in self.vols]
+
+        delta = 0. if first else c - prev_close
+        for g, lo in zip(self.gains, self.losses):
+            if first:
+                out.append(math.nan)
+                continue
+            ga = g.update(max(delta, 0.))
+            la = lo.update(max(-delta, 0.))
+            out.append(100. * ga / (ga + la) if ga + la > 0 else 50.)
+
+        tr = h - l
+        if not first:
+            tr = max(tr, abs(h - prev_close), abs(l - prev_close))
+        out += [a.update(tr) for a in self.atrs]
+
+        n = len(self.returns)
+        out += [self.returns[n - 1 - k] if k < n else math.nan
+                for k in self.config.return_lags]
+
+        if self.config.ha_ratios:
+            rng = ha_high - ha_low
+            scale = 1. / rng if rng > 0 else 0.
+            out += [(ha_close - ha_open) * scale,
+                    (ha_high - max(ha_open, ha_close)) * scale,
+                    (min(ha_open, ha_close) - ha_low) * scale]
+
+        self.prev_open_hadf = ha_open
+        self.prev_close = c
+        self.bars_seen += 1
+        return np.array(out)
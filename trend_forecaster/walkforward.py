@@ -0,0 +1,165 @@
+# Walk-forward training and evaluation of the direction classifiers
+#
+# Replaces the shuffled train_test_split: each fold trains only on bars
+# before its test window (expanding or rolling), so nothing from the future
+# leaks into the fit. Folds are split into contiguous blocks that run in
+# parallel (joblib); inside a block, estimators that support it are
+# warm-started from the previous fold's solution. The feature matrix is
+# converted to one float64 array up front (a view for FeatureStore frames)
+# and every fold slices views of it (joblib memory-maps it into the workers
+# instead of pickling it per task). Given a shared.SharedPool, the blocks
+# run in its workers instead, on one published copy of X and y.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .instrument import instrumented
+
+
+def default_estimators():
+    """The two classifiers from the study, unfitted."""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+
+    return {
+        'logistic': LogisticRegression(),
+        'random_forest': RandomForestClassifier(max_depth=900, max_samples=2000,
+                                                n_estimators=50),
+    }
+
+
+def walk_forward_splits(n, train_size, test_size, mode='expanding', step=None, gap=0):
+    """(train, test) slices over n rows.
+
+    The first fold trains on rows [0, train_size); each following fold moves
+    the test window forward by step (default test_size). 'expanding' keeps
+    the training start at 0, 'rolling' keeps the training window at
+    train_size rows. gap rows are left out between train and test. step
+    must be at least test_size: overlapping test windows would predict
+    some rows twice.
+    """
+    if mode not in ('expanding', 'rolling'):
+        raise ValueError("mode must be 'expanding' or 'rolling'")
+    step = step or test_size
+    if step < test_size:
+        raise ValueError('step must be at least test_size (test windows would overlap)')
+    splits = []
+    train_end = train_size
+    while train_end + gap < n:
+        test_start = train_end + gap
+        test_end = min(test_start + test_size, n)
+        train_start = 0 if mode == 'expanding' else train_end - train_size
+        splits.append((slice(train_start, train_end), slice(test_start, test_end)))
+        train_end += step
+    return splits
+
+
+def can_warm_start(estimator):
+    """Warm-starting only helps estimators that reuse a solution as the
+    starting point (linear models); ensembles would just add trees."""
+    from sklearn.ensemble import BaseEnsemble
+
+    return 'warm_start' in estimator.get_params() and not isinstance(estimator, BaseEnsemble)
+
+
+def _fit_block(estimator, X, y, folds, warm_start):
+    from sklearn.base import clone
+    from sklearn.metrics import accuracy_score, f1_score
+
+    est = clone(estimator)
+    if warm_start:
+        est.set_params(warm_start=True)
+    out = []
+    for fold, (train, test) in folds:
+        if not warm_start:
+            est = clone(estimator)
+        # the study's forest uses max_samples=2000, more than early folds have
+        max_samples = est.get_params().get('max_samples')
+        if isinstance(max_samples, int) and max_samples > train.stop - train.start:
+            est.set_params(max_samples=None)
+        est.fit(X[train], y[train])
+        pred = est.predict(X[test])
+        metrics = {
+            'fold': fold,
+            'n_train': train.stop - train.start,
+            'n_test': test.stop - test.start,
+            'accuracy': accuracy_score(y[test], pred),
+            'f1_macro': f1_score(y[test], pred, average='macro'),
+        }
+        out.append((fold, test, pred, metrics))
+    return out
+
+
+@instrumented('training')
+def walk_forward(X, y, estimators=None, train_size=1000, test_size=250, mode='expanding',
+                 step=None, gap=0, n_jobs=-1, warm_start=True, pool=None):
+    """Walk-forward fit/predict of each estimator.
+
+    X is a DataFrame of already computed features (e.g.
+    data_open[['open_hadf', 'EMA_5']]) and y the labels aligned to it.
+    Returns (metrics, predictions): one metrics row per (model, fold), and
+    the out-of-sample predictions of every model aligned to X.index (NaN
+    for the initial training window, so integer labels come back as
+    float). pool, a shared.SharedPool, runs the fold blocks in place of
+    joblib.
+    """
+    from joblib import Parallel, delayed
+
+    estimators = estimators or default_estimators()
+    index = X.index
+    X = X.to_numpy(dtype=np.float64)
+    if not (X.flags.c_contiguous or X.flags.f_contiguous):
+        X = np.ascontiguousarray(X)
+    y = np.asarray(y)
+
+    splits = list(enumerate(walk_forward_splits(len(X), train_size, test_size, mode,
+                                                step, gap)))
+    if not splits:
+        raise ValueError('not enough rows for one walk-forward fold')
+
+    n_workers = os.cpu_count() if n_jobs is None or n_jobs < 0 else n_jobs
+    n_blocks = max(min(n_workers, len(splits)), 1)
+    blocks = [list(b) for b in np.array_split(np.arange(len(splits)), n_blocks) if len(b)]
+
+    tasks = [(name, est, [splits[i] for i in block])
+             for name, est in estimators.items() for block in blocks]
+    if pool is None:
+        results = Parallel(n_jobs=n_jobs)(
+            delayed(_fit_block)(est, X, y, folds, warm_start and can_warm_start(est))
+            for name, est, folds in tasks)
+    else:
+        # object labels (strings) cannot be shared and are sent as they are
+        data = pool.publish({'X': X} if y.dtype.hasobject else {'X': X, 'y': y})
+        y_arg = y if y.dtype.hasobject else data['y']
+        futures = []
+        try:
+            futures = [pool.submit(_fit_block, est, data['X'], y_arg, folds,
+                                   warm_start and can_warm_start(est))
+                       for name, est, folds in tasks]
+            results = [f.result() for f in futures]
+        finally:
+            for f in futures:
+                f.cancel()   # after a failed block, the ones not started yet
+            pool.release(data)
+
+    rows = []
+    # numeric labels (the direction codes) as float, NaN before the first fold
+    if y.dtype.kind in 'biuf':
+        columns = {name: np.full(len(index), np.nan) for name in estimators}
+    else:
+        columns = {name: np.full(len(index), None, dtype=object) for name in estimators}
+    folds = np.full(len(index), np.nan)
+    for (name, _, _), block in zip(tasks, results):
+        for fold, test, pred, metrics in block:
+            rows.append(dict(model=name,
+                             test_start=index[test.start], test_end=index[test.stop - 1],
+                             **metrics))
+            columns[name][test] = pred
+            folds[test] = fold
+    predictions = pd.DataFrame(columns, index=index)
+    predictions['fold'] = folds
+
+    metrics = pd.DataFrame(rows).sort_values(['model', 'fold']).reset_index(drop=True)
+    return metrics, predictions